@@ -252,18 +252,22 @@ def set_cats_version_string():
 
 def register():
     print("\n### Loading CATS...")
+    startup = tools.startup
+    startup.timings.clear()
 
     # Check for unsupported Blender versions
-    check_unsupported_blender_versions()
+    with startup.phase('checks'):
+        check_unsupported_blender_versions()
 
-    # Check for faulty CATS installations
-    remove_corrupted_files()
+        # Check for faulty CATS installations
+        remove_corrupted_files()
 
     # Set cats version string
     version_str = set_cats_version_string()
 
     # Register Updater and check for CATS update
-    updater.register(bl_info, dev_branch, version_str)
+    with startup.phase('updater'):
+        updater.register(bl_info, dev_branch, version_str)
 
     # Set some global settings, first allowed use of globs
     globs.dev_branch = dev_branch
@@ -271,10 +275,11 @@ def register():
 
     # Load settings and show error if a faulty installation was deleted recently
     show_error = False
-    try:
-        tools.settings.load_settings()
-    except FileNotFoundError:
-        show_error = True
+    with startup.phase('settings'):
+        try:
+            tools.settings.load_settings()
+        except FileNotFoundError:
+            show_error = True
     if show_error:
         sys.tracebacklimit = 0
         raise ImportError('\n\nPlease restart Blender and enable CATS again!'
@@ -283,37 +288,23 @@ def register():
     # if not tools.settings.use_custom_mmd_tools():
     #     bpy.utils.unregister_module("mmd_tools")
 
-    # Load mmd_tools
-    try:
-        mmd_tools_local.register()
-    except AttributeError:
-        print('Could not register local mmd_tools')
-    except ValueError:
-        print('mmd_tools is already registered')
-
-    # Register all classes
+    # Register all classes, they finish the deferred loading when they are first used
     count = 0
-    tools.register.order_classes()
-    for cls in tools.register.__bl_classes:
-        try:
-            bpy.utils.register_class(cls)
-            count += 1
-        except ValueError:
-            pass
+    with startup.phase('classes'):
+        tools.register.order_classes()
+        for cls in tools.register.__bl_classes:
+            try:
+                bpy.utils.register_class(startup.first_use(cls))
+                count += 1
+            except ValueError:
+                pass
     # print('Registered', count, 'CATS classes.')
     if count < len(tools.register.__bl_classes):
         print('Skipped', len(tools.register.__bl_classes) - count, 'CATS classes.')
 
     # Register Scene types
-    extentions.register()
-
-    # Load supporter and settings icons and buttons
-    tools.supporter.load_other_icons()
-    tools.supporter.load_supporters()
-    tools.supporter.register_dynamic_buttons()
-
-    # Load the dictionaries and check if they are found.
-    globs.dict_found = tools.translate.load_translations()
+    with startup.phase('scene types'):
+        extentions.register()
 
     # Set preferred Blender options
     if hasattr(tools.common.get_user_preferences(), 'system') and hasattr(tools.common.get_user_preferences().system, 'use_international_fonts'):
@@ -340,7 +331,35 @@ def register():
     # Apply the settings after a short time, because you can't change checkboxes during register process
     tools.settings.start_apply_settings_timer()
 
-    print("### Loaded CATS successfully!\n")
+    # Load icons, supporters, dictionaries and mmd_tools once Blender is idle or on first use, in this order
+    startup.defer('icons', tools.supporter.load_other_icons)
+    startup.defer('supporters', load_supporters)
+    startup.defer('dictionary', tools.translate.ensure_translations)
+    startup.defer('mmd_tools', register_mmd_tools)
+    startup.start()
+
+    print("### Loaded CATS successfully! (" + startup.format_timings() + ")\n")
+
+
+def load_supporters():
+    # Load supporter icons and buttons
+    tools.supporter.load_supporters()
+    tools.supporter.register_dynamic_buttons()
+
+
+def register_mmd_tools():
+    # Load mmd_tools
+    try:
+        mmd_tools_local.register()
+    except AttributeError:
+        print('Could not register local mmd_tools')
+        return
+    except ValueError:
+        print('mmd_tools is already registered')
+        return
+
+    # The file that is already open missed the load handler of mmd_tools
+    mmd_tools_local.load_handler(None)
 
 
 def unregister():
@@ -349,15 +368,18 @@ def unregister():
     # Unregister updater
     updater.unregister()
 
-    # Unload mmd_tools
-    try:
-        mmd_tools_local.unregister()
-    except AttributeError:
-        print('Could not unregister local mmd_tools')
-        pass
-    except ValueError:
-        print('mmd_tools was not registered')
-        pass
+    # Unload mmd_tools, it is not registered yet if the deferred loading didn't run
+    mmd_tools_registered = tools.startup.is_done('mmd_tools')
+    tools.startup.stop()
+    if mmd_tools_registered:
+        try:
+            mmd_tools_local.unregister()
+        except AttributeError:
+            print('Could not unregister local mmd_tools')
+            pass
+        except ValueError:
+            print('mmd_tools was not registered')
+            pass
 
     # Unload all classes in reverse order
     count = 0
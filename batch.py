@@ -0,0 +1,330 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Converts a whole folder of models with the same recipe.
+# Every model is converted in its own background Blender process, so a crash or a broken model
+# only affects that one model. The stages themselves are in tools/batch.py.
+# This doesn't use bpy, so it runs with any Python 3:
+#
+#   python batch.py recipe.json --blender /path/to/blender --workers 4
+#
+# A recipe is a json file like this, paths are relative to the recipe:
+#
+#   {
+#       "input": "models",
+#       "output": "converted",
+#       "formats": [".pmx", ".pmd", ".fbx"],
+#       "recursive": false,
+#       "workers": 4,
+#       "timeout": 1800,
+#       "settings": {"remove_zero_weight": true},
+#       "stages": [
+#           "import",
+#           "fix_model",
+#           "translate",
+#           "visemes",
+#           {"stage": "eye_tracking", "optional": true},
+#           {"stage": "decimate", "decimation_mode": "SMART", "max_tris": 70000},
+#           "export"
+#       ]
+#   }
+#
+# Every option of a stage and every setting is a CATS scene property, like the ones in the CATS panels.
+# Settings are applied once per model, stage options right before their stage.
+# A failed stage ends the conversion of that model, unless the stage is optional.
+# The report of every model and a summary are written into the output folder.
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from subprocess import Popen, STDOUT, DEVNULL
+from optparse import OptionParser
+from collections import OrderedDict
+
+stage_names = ['import', 'fix_model', 'translate', 'visemes', 'eye_tracking', 'decimate', 'export', 'save_blend']
+stage_keys = ['stage', 'optional', 'filename']  # Everything else in a stage entry is a scene property
+default_formats = ['.pmx', '.pmd', '.xps', '.mesh', '.ascii', '.smd', '.qc', '.dmx', '.fbx', '.dae', '.vrm']
+addon_dir = os.path.dirname(os.path.abspath(__file__))
+report_file_name = 'report.json'
+
+# This runs inside of every background Blender process. It enables CATS, even if it's not
+# installed into this Blender, and runs the job file with tools/batch.py
+worker_script = '''
+import os
+import sys
+import importlib
+import addon_utils
+
+job_file, addon_dir = sys.argv[sys.argv.index('--') + 1:][:2]
+addon_name = os.path.basename(addon_dir)
+if not any(os.path.isdir(os.path.join(path, addon_name)) for path in addon_utils.paths()):
+    sys.path.append(os.path.dirname(addon_dir))
+
+if addon_utils.enable(addon_name, default_set=False):
+    importlib.import_module(addon_name + '.tools.batch').run_job(job_file)
+else:
+    print('CATS could not be enabled')
+'''
+
+
+class RecipeError(Exception):
+    pass
+
+
+def load_recipe(recipe_path, input_dir=None, output_dir=None):
+    try:
+        with open(recipe_path, encoding='utf8') as file:
+            recipe = json.load(file, object_pairs_hook=OrderedDict)
+    except (OSError, ValueError) as e:
+        raise RecipeError('The recipe could not be read: ' + str(e))
+    if input_dir:
+        recipe['input'] = os.path.abspath(input_dir)
+    if output_dir:
+        recipe['output'] = os.path.abspath(output_dir)
+    return check_recipe(recipe, os.path.dirname(os.path.abspath(recipe_path)))
+
+
+def check_recipe(recipe, base_dir):
+    # Fills in the defaults and brings every stage into the form {'stage': name, 'options': {...}}
+    if not isinstance(recipe, dict):
+        raise RecipeError('The recipe has to be a json object')
+    if not recipe.get('input'):
+        raise RecipeError('The recipe has no input folder')
+
+    checked = OrderedDict()
+    checked['input'] = os.path.normpath(os.path.join(base_dir, recipe['input']))
+    checked['output'] = os.path.normpath(os.path.join(base_dir, recipe.get('output') or os.path.join(recipe['input'], 'cats_output')))
+    checked['formats'] = [('.' + f.lower().lstrip('.')) for f in recipe.get('formats', default_formats)]
+    checked['recursive'] = bool(recipe.get('recursive', False))
+    checked['workers'] = int(recipe.get('workers', max(1, min((os.cpu_count() or 2) - 1, 8))))
+    checked['timeout'] = float(recipe.get('timeout', 1800))
+    checked['settings'] = recipe.get('settings', {})
+    if not isinstance(checked['settings'], dict):
+        raise RecipeError('The settings have to be a json object')
+
+    stages = []
+    for entry in recipe.get('stages', ['import', 'fix_model', 'export']):
+        if isinstance(entry, str):
+            entry = {'stage': entry}
+        if not isinstance(entry, dict) or entry.get('stage') not in stage_names:
+            raise RecipeError('Unknown stage ' + json.dumps(entry) + ', the stages are: ' + ', '.join(stage_names))
+        stage = OrderedDict((key, entry[key]) for key in stage_keys if key in entry)
+        stage['options'] = OrderedDict((key, value) for key, value in entry.items() if key not in stage_keys)
+        stages.append(stage)
+    if not stages or stages[0]['stage'] != 'import':
+        raise RecipeError('The first stage has to be "import"')
+    checked['stages'] = stages
+    return checked
+
+
+def find_models(recipe):
+    models = []
+    for root, dirs, files in os.walk(recipe['input']):
+        # Never convert our own output again
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != recipe['output'])
+        for file in sorted(files):
+            if os.path.splitext(file)[1].lower() in recipe['formats']:
+                models.append(os.path.join(root, file))
+        if not recipe['recursive']:
+            break
+    return models
+
+
+def get_blender_executable(blender=None):
+    if blender:
+        return blender
+    try:
+        import bpy
+        return bpy.app.binary_path
+    except ImportError:
+        pass
+    return shutil.which('blender')
+
+
+class Job:
+    def __init__(self, recipe, model, job_dir, stages, used_names=None):
+        # used_names holds the lowercase names of the other jobs, the name of this job is added to it
+        self.model = model
+        if model:
+            name, extension = os.path.splitext(os.path.relpath(model, recipe['input']))
+            name = name.replace(os.sep, '_').replace('/', '_')
+            if used_names is not None:
+                # Models that only differ in their format, like model.pmx and model.fbx, get it added to their name
+                if name.lower() in used_names:
+                    name += '_' + extension.lstrip('.')
+                unique_name = name
+                number = 2
+                while unique_name.lower() in used_names:
+                    unique_name = name + '_' + str(number)
+                    number += 1
+                name = unique_name
+                used_names.add(name.lower())
+            self.name = name
+            self.output_dir = os.path.join(recipe['output'], self.name)
+        else:
+            self.name = 'prepare'
+            self.output_dir = recipe['output']
+        self.job_file = os.path.join(job_dir, self.name + '.job.json')
+        self.report_file = os.path.join(self.output_dir, self.name + '.report.json')
+        self.log_file = os.path.join(self.output_dir, self.name + '.log')
+        self.process = None
+        self.started = None
+        self.timed_out = False
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        if os.path.isfile(self.report_file):
+            os.remove(self.report_file)
+        with open(self.job_file, 'w', encoding='utf8') as file:
+            json.dump({
+                'model': model,
+                'name': self.name,
+                'output_dir': self.output_dir,
+                'report': self.report_file,
+                'settings': recipe['settings'],
+                'stages': stages,
+            }, file, ensure_ascii=False, indent=4)
+
+    def start(self, blender):
+        self.started = time.time()
+        with open(self.log_file, 'wb') as log:
+            self.process = Popen([blender, '--background', '--factory-startup', '-noaudio', '--python-expr', worker_script, '--', self.job_file, addon_dir],
+                                 stdin=DEVNULL, stdout=log, stderr=STDOUT, creationflags=0x08000000 if os.name == 'nt' else 0)  # CREATE_NO_WINDOW
+
+    def running(self, timeout):
+        if self.process.poll() is not None:
+            return False
+        if time.time() - self.started > timeout:
+            self.process.kill()
+            self.process.wait()
+            self.timed_out = True
+            return False
+        return True
+
+    def get_report(self):
+        try:
+            with open(self.report_file, encoding='utf8') as file:
+                report = json.load(file, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            # The worker died before it could write its report
+            report = OrderedDict()
+            report['model'] = self.model
+            report['status'] = 'timeout' if self.timed_out else 'crashed'
+            report['warnings'] = []
+            report['outputs'] = []
+            report['stages'] = []
+            report['exit_code'] = self.process.returncode
+        report['name'] = self.name
+        report['wall_seconds'] = time.time() - self.started
+        report['log'] = self.log_file
+        return report
+
+
+def run(recipe, blender, workers=None, log=print):
+    """
+    Converts all models of the recipe and returns the summary, which is also saved as report.json in the output folder.
+    """
+    blender = get_blender_executable(blender)
+    if not blender:
+        raise RecipeError('Blender was not found, please set the path to the Blender executable')
+    workers = max(1, workers or recipe['workers'])
+    models = find_models(recipe)
+    os.makedirs(recipe['output'], exist_ok=True)
+    job_dir = tempfile.mkdtemp(prefix='cats_batch_')
+    start = time.time()
+
+    summary = OrderedDict()
+    summary['recipe'] = recipe
+    summary['blender'] = blender
+    summary['workers'] = workers
+    summary['started'] = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    try:
+        # Load and compile the dictionary once, the workers then only map the compiled file
+        log('Preparing ' + str(len(models)) + ' models with ' + str(workers) + ' workers...')
+        prepare = Job(recipe, None, job_dir, [{'stage': 'prepare', 'options': {}}])
+        prepare.start(blender)
+        while prepare.running(recipe['timeout']):
+            time.sleep(0.1)
+        summary['prepare'] = prepare.get_report()
+        if summary['prepare']['status'] != 'ok':
+            log('Preparation failed, see ' + prepare.log_file)
+
+        used_names = {prepare.name}
+        pending = [Job(recipe, model, job_dir, recipe['stages'], used_names) for model in models]
+        pending.reverse()
+        running = []
+        reports = []
+        while pending or running:
+            while pending and len(running) < workers:
+                job = pending.pop()
+                job.start(blender)
+                running.append(job)
+
+            for job in running[:]:
+                if job.running(recipe['timeout']):
+                    continue
+                running.remove(job)
+                report = job.get_report()
+                reports.append(report)
+                log('[' + str(len(reports)) + '/' + str(len(models)) + '] ' + report['status'].upper().ljust(8) + job.name
+                    + ' (' + str(round(report['wall_seconds'], 1)) + 's' + (', ' + str(len(report['warnings'])) + ' warnings' if report['warnings'] else '') + ')')
+            time.sleep(0.1)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    reports.sort(key=lambda r: r['name'])
+    summary['seconds'] = time.time() - start
+    summary['converted'] = len([r for r in reports if r['status'] == 'ok'])
+    summary['failed'] = len(reports) - summary['converted']
+    summary['models'] = reports
+
+    with open(os.path.join(recipe['output'], report_file_name), 'w', encoding='utf8') as file:
+        json.dump(summary, file, ensure_ascii=False, indent=4)
+    log('Converted ' + str(summary['converted']) + ' of ' + str(len(reports)) + ' models in ' + str(round(summary['seconds'], 1)) + 's')
+    return summary
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog recipe.json [options]')
+    parser.add_option('-b', '--blender', dest='blender', help='sets the blender executable', metavar='BLENDER')
+    parser.add_option('-w', '--workers', dest='workers', help='number of models that are converted at the same time', metavar='N', type='int')
+    parser.add_option('-i', '--input', dest='input', help='overrides the input folder of the recipe', metavar='DIR')
+    parser.add_option('-o', '--output', dest='output', help='overrides the output folder of the recipe', metavar='DIR')
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('please give the path to a recipe')
+
+    try:
+        recipe = load_recipe(args[0], options.input, options.output)
+        summary = run(recipe, options.blender, options.workers)
+    except RecipeError as e:
+        print('ERROR:', e)
+        return 2
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    # Inside of Blender the arguments for this script come after --
+    sys.exit(main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]))
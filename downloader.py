@@ -0,0 +1,251 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Downloads for the updater and the supporter list.
+# Interrupted downloads are resumed with HTTP range requests, finished downloads are verified
+# and can be kept in a cache, and installs swap whole directories instead of moving single files.
+# This doesn't use bpy, so it can be tested outside of Blender.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import http.client
+import urllib.error
+import urllib.request
+
+chunk_size = 1 << 16
+user_agent = 'Cats Blender Plugin'
+
+
+class DownloadError(Exception):
+    pass
+
+
+def download(url, cache_dir, sha256=None, cache_key=None, retries=3, retry_delay=1.0, timeout=30):
+    """
+    Downloads url into cache_dir and returns the path of the finished file.
+    Files with a known sha256 or cache_key are kept and returned again without downloading,
+    other files are downloaded again each time and should be removed by the caller.
+    Interrupted downloads are continued from where they stopped on the next try or call.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    reuse = bool(sha256 or cache_key)
+    if sha256:
+        sha256 = sha256.lower()
+        name = sha256
+    elif cache_key:
+        name = hashlib.sha1(cache_key.encode('utf-8')).hexdigest()
+    else:
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    file_path = os.path.join(cache_dir, name + '.download')
+    part_path = file_path + '.part'
+
+    # Use the cached file if it is still intact
+    if reuse and os.path.isfile(file_path):
+        if not sha256 or get_sha256(file_path) == sha256:
+            print('USING CACHED DOWNLOAD', file_path)
+            # Mark it as recently used for prune_cache
+            os.utime(file_path)
+            return file_path
+        os.remove(file_path)
+    elif os.path.isfile(file_path):
+        os.remove(file_path)
+
+    for attempt in range(retries + 1):
+        if attempt:
+            print('RETRYING DOWNLOAD', attempt)
+            time.sleep(retry_delay * attempt)
+        try:
+            download_part(url, part_path, timeout)
+            break
+        except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError, OSError) as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code != 408:
+                remove_part(part_path)
+                raise DownloadError('The server answered with ' + str(e.code) + ' ' + str(e.reason))
+            error = e
+    else:
+        # Keep the part file, the next call continues from there
+        raise DownloadError('The download failed: ' + str(error))
+
+    if sha256:
+        found_sha256 = get_sha256(part_path)
+        if found_sha256 != sha256:
+            remove_part(part_path)
+            raise DownloadError('The downloaded file is damaged (SHA-256 ' + found_sha256 + ' instead of ' + sha256 + ')')
+
+    os.replace(part_path, file_path)
+    remove_part(part_path)
+    return file_path
+
+
+def prune_cache(cache_dir, keep=2, keep_file=None):
+    """
+    Removes all but the keep most recently used finished downloads from cache_dir.
+    keep_file is never removed. Unfinished downloads are kept, so that they can still be continued.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.download')]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for file_path in files[keep:]:
+        if keep_file and os.path.normcase(os.path.abspath(file_path)) == os.path.normcase(os.path.abspath(keep_file)):
+            continue
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            print('COULD NOT REMOVE CACHED DOWNLOAD', file_path, e)
+
+
+def download_part(url, part_path, timeout):
+    # Continues the part file if the server still has the same file, otherwise starts over
+    meta_path = part_path + '.json'
+    meta = {}
+    if os.path.isfile(part_path) and os.path.isfile(meta_path):
+        try:
+            with open(meta_path, encoding='utf8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            meta = {}
+    offset = os.path.getsize(part_path) if meta.get('url') == url else 0
+    validator = meta.get('etag') or meta.get('last_modified')
+    if offset and not validator:
+        offset = 0
+
+    headers = {'User-Agent': user_agent}
+    if offset:
+        headers['Range'] = 'bytes=' + str(offset) + '-'
+        headers['If-Range'] = validator
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 416 or not offset:
+            raise
+        # The part is already complete if the server has nothing left to send
+        total = get_total_size(e.headers.get('Content-Range'))
+        if total == offset:
+            return
+        remove_part(part_path)
+        return download_part(url, part_path, timeout)
+
+    with response:
+        status = response.getcode()
+        if status == 206:
+            start = get_range_start(response.headers.get('Content-Range'))
+            if start != offset:
+                raise http.client.HTTPException('Unexpected range ' + str(response.headers.get('Content-Range')))
+            total = get_total_size(response.headers.get('Content-Range'))
+            mode = 'ab'
+        else:
+            offset = 0
+            length = response.headers.get('Content-Length')
+            total = int(length) if length and length.isdigit() else None
+            mode = 'wb'
+
+        if mode == 'wb' or not meta:
+            meta = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            with open(meta_path, 'w', encoding='utf8') as file:
+                json.dump(meta, file)
+
+        with open(part_path, mode) as file:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                file.write(chunk)
+            size = file.tell()
+
+    if total is not None and size < total:
+        raise http.client.IncompleteRead(b'', total - size)
+
+
+def get_range_start(content_range):
+    # "bytes 100-199/200"
+    try:
+        return int(content_range.split()[1].split('-')[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def get_total_size(content_range):
+    try:
+        return int(content_range.split('/')[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def remove_part(part_path):
+    for path in [part_path, part_path + '.json']:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def get_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def extract_zip(zip_path, target_dir):
+    # Extracts into a fresh directory after checking the crc of every file
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir)
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            broken_file = zip_ref.testzip()
+            if broken_file:
+                raise DownloadError('The downloaded zip is damaged: ' + broken_file)
+            zip_ref.extractall(target_dir)
+    except zipfile.BadZipFile:
+        raise DownloadError('The downloaded file is not a valid zip')
+
+
+def swap_directories(new_dir, target_dir):
+    """
+    Replaces target_dir with new_dir. Both have to be on the same drive.
+    The old directory is only deleted after the new one is in place and restored if that fails.
+    """
+    backup_dir = None
+    if os.path.exists(target_dir):
+        backup_dir = target_dir.rstrip('/\\') + '.old'
+        if os.path.exists(backup_dir):
+            shutil.rmtree(backup_dir)
+        os.rename(target_dir, backup_dir)
+
+    try:
+        os.rename(new_dir, target_dir)
+    except OSError:
+        if backup_dir:
+            os.rename(backup_dir, target_dir)
+        raise
+
+    if backup_dir:
+        shutil.rmtree(backup_dir, ignore_errors=True)
@@ -185,6 +185,19 @@ def createObject(name='Object', object_data=None, target_scene=None):
     obj.select = True
     return obj
 
+def createObjects(name='Object', counts=1, object_data_func=None, target_scene=None):
+    """ Create counts objects and link them to the scene without changing the selection.
+
+    object_data_func is called once per object to create its own object data.
+    """
+    target_scene = SceneOp(target_scene)
+    objs = []
+    for i in range(counts):
+        obj = bpy.data.objects.new(name=name, object_data=object_data_func() if object_data_func else None)
+        target_scene.link_object(obj)
+        objs.append(obj)
+    return objs
+
 def makeSphere(segment=8, ring_count=5, radius=1.0, target_object=None):
     import bmesh
     if target_object is None:
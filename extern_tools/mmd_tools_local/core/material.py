@@ -2,6 +2,7 @@
 
 import logging
 import os
+from contextlib import contextmanager
 
 import bpy
 from mmd_tools_local.bpyutils import addon_preferences, select_object
@@ -13,12 +14,76 @@ SPHERE_MODE_MULT   = 1
 SPHERE_MODE_ADD    = 2
 SPHERE_MODE_SUBTEX = 3
 
+
+class _ImageIndex:
+    """
+    Lookup table for already loaded images and image textures.
+    Entries are keyed on the normalized absolute path and on the file identity (st_dev, st_ino),
+    so each lookup costs at most one stat call instead of two per existing image.
+    """
+    def __init__(self):
+        self.__file_ids = {}
+        self.__images = {}
+        self.__textures = {}
+        for img in bpy.data.images:
+            self.add_image(img)
+        for tex in getattr(bpy.data, 'textures', ()):
+            if tex.type == 'IMAGE':
+                self.add_texture(tex)
+
+    @staticmethod
+    def __normpath(filepath):
+        return os.path.normcase(os.path.normpath(filepath))
+
+    def __file_id(self, filepath):
+        filepath = self.__normpath(filepath)
+        if filepath not in self.__file_ids:
+            try:
+                st = os.stat(filepath)
+                self.__file_ids[filepath] = (st.st_dev, st.st_ino) if st.st_ino else None
+            except (OSError, ValueError):
+                self.__file_ids[filepath] = None
+        return self.__file_ids[filepath]
+
+    def __keys(self, image):
+        if image and image.source == 'FILE':
+            filepath = bpy.path.abspath(image.filepath)
+            yield self.__normpath(filepath)
+            file_id = self.__file_id(filepath)
+            if file_id:
+                yield file_id
+
+    def __find(self, table, filepath):
+        item = table.get(self.__normpath(filepath), None)
+        if item is None:
+            file_id = self.__file_id(filepath)
+            if file_id:
+                item = table.get(file_id, None)
+        return item
+
+    def add_image(self, image):
+        for key in self.__keys(image):
+            self.__images.setdefault(key, image)
+
+    def add_texture(self, texture):
+        for key in self.__keys(texture.image):
+            self.__textures.setdefault(key, texture)
+
+    def find_image(self, filepath):
+        return self.__find(self.__images, filepath)
+
+    def find_texture(self, filepath):
+        return self.__find(self.__textures, filepath)
+
+
 class _FnMaterialBI:
     __BASE_TEX_SLOT = 0
     __TOON_TEX_SLOT = 1
     __SPHERE_TEX_SLOT = 2
     __SPHERE_ALPHA_SLOT = 5
 
+    _image_index = None
+
     def __init__(self, material=None):
         self.__material = material
 
@@ -83,6 +148,22 @@ class _FnMaterialBI:
                 continue  # This is already in place
             cls.swap_materials(meshObj, mat, new_idx, reverse=True, swap_slots=True)
 
+    @classmethod
+    @contextmanager
+    def image_index(cls):
+        """
+        Resolves images and textures through an index while the context is active.
+        The index is built once and kept up to date with the images and textures created inside the context.
+        """
+        if _FnMaterialBI._image_index is not None:
+            yield _FnMaterialBI._image_index
+            return
+        _FnMaterialBI._image_index = _ImageIndex()
+        try:
+            yield _FnMaterialBI._image_index
+        finally:
+            _FnMaterialBI._image_index = None
+
     @property
     def material_id(self):
         mmd_mat = self.__material.mmd_material
@@ -110,7 +191,11 @@ class _FnMaterialBI:
         return False
 
     def _load_image(self, filepath):
-        img = next((i for i in bpy.data.images if self.__same_image_file(i, filepath)), None)
+        index = _FnMaterialBI._image_index
+        if index is not None:
+            img = index.find_image(filepath)
+        else:
+            img = next((i for i in bpy.data.images if self.__same_image_file(i, filepath)), None)
         if img is None:
             try:
                 img = bpy.data.images.load(filepath)
@@ -124,14 +209,22 @@ class _FnMaterialBI:
                 img.use_alpha = use_alpha
             elif not use_alpha:
                 img.alpha_mode = 'NONE'
+            if index is not None:
+                index.add_image(img)
         return img
 
     def __load_texture(self, filepath):
-        tex = next((t for t in bpy.data.textures if t.type == 'IMAGE' and self.__same_image_file(t.image, filepath)), None)
+        index = _FnMaterialBI._image_index
+        if index is not None:
+            tex = index.find_texture(filepath)
+        else:
+            tex = next((t for t in bpy.data.textures if t.type == 'IMAGE' and self.__same_image_file(t.image, filepath)), None)
         if tex is None:
             tex = bpy.data.textures.new(name=bpy.path.display_name_from_filepath(filepath), type='IMAGE')
             tex.image = self._load_image(filepath)
             tex.use_alpha = tex.image.use_alpha
+            if index is not None:
+                index.add_texture(tex)
         return tex
 
     def __has_alpha_channel(self, texture):
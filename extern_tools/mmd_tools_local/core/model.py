@@ -146,28 +146,28 @@ class Model:
     def createRigidBodyPool(self, counts):
         if counts < 1:
             return []
-        obj = bpyutils.createObject(name='Rigidbody', object_data=bpy.data.meshes.new(name='Rigidbody'))
-        obj.parent = self.rigidGroupObject()
-        obj.mmd_type = 'RIGID_BODY'
-        obj.rotation_mode = 'YXZ'
-        obj.draw_type = 'SOLID'
-        #obj.show_wire = True
-        obj.show_transparent = True
-        obj.hide_render = True
-        if hasattr(obj, 'display'):
-            obj.display.show_shadows = False
-        if hasattr(obj, 'cycles_visibility'):
-            for attr_name in ('camera', 'diffuse', 'glossy', 'scatter', 'shadow', 'transmission'):
-                if hasattr(obj.cycles_visibility, attr_name):
-                    setattr(obj.cycles_visibility, attr_name, False)
-
-        if bpy.app.version < (2, 71, 0):
-            obj.mmd_rigid.shape = 'BOX'
-            obj.mmd_rigid.size = (1, 1, 1)
-        bpy.ops.rigidbody.object_add(type='ACTIVE')
-        if counts == 1:
-            return [obj]
-        return bpyutils.duplicateObject(obj, counts)
+        parent = self.rigidGroupObject()
+        objs = bpyutils.createObjects(name='Rigidbody', counts=counts, object_data_func=lambda: bpy.data.meshes.new(name='Rigidbody'))
+        for obj in objs:
+            obj.parent = parent
+            obj.mmd_type = 'RIGID_BODY'
+            obj.rotation_mode = 'YXZ'
+            obj.draw_type = 'SOLID'
+            #obj.show_wire = True
+            obj.show_transparent = True
+            obj.hide_render = True
+            if hasattr(obj, 'display'):
+                obj.display.show_shadows = False
+            if hasattr(obj, 'cycles_visibility'):
+                for attr_name in ('camera', 'diffuse', 'glossy', 'scatter', 'shadow', 'transmission'):
+                    if hasattr(obj.cycles_visibility, attr_name):
+                        setattr(obj.cycles_visibility, attr_name, False)
+
+            if bpy.app.version < (2, 71, 0):
+                obj.mmd_rigid.shape = 'BOX'
+                obj.mmd_rigid.size = (1, 1, 1)
+        rigid_body.addRigidBodies(objs, 'ACTIVE')
+        return objs
 
     def createRigidBody(self, **kwargs):
         ''' Create a object for MMD rigid body dynamics.
@@ -242,7 +242,7 @@ class Model:
     def createJointPool(self, counts):
         if counts < 1:
             return []
-        obj = bpyutils.createObject(name='Joint', object_data=None)
+        obj = bpyutils.createObjects(name='Joint')[0]
         obj.parent = self.jointGroupObject()
         obj.mmd_type = 'JOINT'
         obj.rotation_mode = 'YXZ'
@@ -250,10 +250,7 @@ class Model:
         obj.empty_draw_size = 0.1 * self.__root.empty_draw_size
         obj.hide_render = True
 
-        if bpy.ops.rigidbody.world_add.poll():
-            bpy.ops.rigidbody.world_add()
-        bpy.ops.rigidbody.constraint_add(type='GENERIC_SPRING')
-        rbc = obj.rigid_body_constraint
+        rbc = rigid_body.addRigidBodyConstraint(obj, 'GENERIC_SPRING')
         rbc.disable_collisions = False
         rbc.use_limit_ang_x = True
         rbc.use_limit_ang_y = True
@@ -268,9 +265,7 @@ class Model:
             rbc.use_spring_ang_x = True
             rbc.use_spring_ang_y = True
             rbc.use_spring_ang_z = True
-        if counts == 1:
-            return [obj]
-        return bpyutils.duplicateObject(obj, counts)
+        return rigid_body.duplicateRigidBodyConstraintObject(obj, counts)
 
     def createJoint(self, **kwargs):
         ''' Create a joint object for MMD rigid body dynamics.
@@ -834,7 +829,7 @@ class Model:
         logging.debug('-'*60)
         logging.debug(' creating ncc, counts: %d', total_len)
 
-        ncc_obj = bpyutils.createObject(name='ncc', object_data=None)
+        ncc_obj = bpyutils.createObjects(name='ncc')[0]
         ncc_obj.location = [0, 0, 0]
         ncc_obj.empty_draw_size = 0.5 * self.__root.empty_draw_size
         ncc_obj.empty_draw_type = 'ARROWS'
@@ -842,11 +837,10 @@ class Model:
         ncc_obj.hide_render = True
         ncc_obj.parent = self.temporaryGroupObject()
 
-        bpy.ops.rigidbody.constraint_add(type='GENERIC')
-        rb = ncc_obj.rigid_body_constraint
+        rb = rigid_body.addRigidBodyConstraint(ncc_obj, 'GENERIC')
         rb.disable_collisions = True
 
-        ncc_objs = bpyutils.duplicateObject(ncc_obj, total_len)
+        ncc_objs = rigid_body.duplicateRigidBodyConstraintObject(ncc_obj, total_len)
         logging.debug(' created %d ncc.', len(ncc_objs))
 
         for ncc_obj, pair in zip(ncc_objs, nonCollisionJointTable):
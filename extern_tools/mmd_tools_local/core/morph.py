@@ -2,6 +2,7 @@
 import re
 
 import bpy
+import numpy as np
 from mmd_tools_local import bpyutils
 from mmd_tools_local.bpyutils import SceneOp
 from mmd_tools_local.bpyutils import ObjectOp
@@ -142,52 +143,104 @@ class FnMorph(object):
             vertex_groups.remove(vg)
 
     @staticmethod
-    def get_uv_morph_offset_map(obj, morph):
-        offset_map = {} # offset_map[vertex_index] = offset_xyzw
+    def get_uv_morph_offset_arrays(obj, morph):
+        """
+        Returns the offsets of an uv morph as an index/offset array pair:
+        a sorted array of unique vertex indices and an (N, 4) array of the summed xyzw offsets
+        """
         if morph.data_type == 'VERTEX_GROUP':
             scale = morph.vertex_group_scale
             axis_map = {g.index:x for g, n, x in FnMorph.get_uv_morph_vertex_groups(obj, morph.name)}
-            for v in obj.data.vertices:
-                i = v.index
-                for x in v.groups:
-                    if x.group in axis_map and x.weight > 0:
-                        axis, weight = axis_map[x.group], x.weight
-                        d = offset_map.setdefault(i, [0, 0, 0, 0])
-                        d['XYZW'.index(axis[1])] += -weight*scale if axis[0] == '-' else weight*scale
+            if not axis_map:
+                return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float64)
+            group_sign = np.zeros(len(obj.vertex_groups), dtype=np.float64)
+            group_axis = np.zeros(len(obj.vertex_groups), dtype=np.int32)
+            for index, axis in axis_map.items():
+                group_sign[index] = -scale if axis[0] == '-' else scale
+                group_axis[index] = 'XYZW'.index(axis[1])
+            data = [(v.index, x.group, x.weight) for v in obj.data.vertices for x in v.groups if x.group in axis_map and x.weight > 0]
+            if not data:
+                return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float64)
+            data = np.array(data, dtype=np.float64)
+            vertex_indices, groups, weights = data[:, 0].astype(np.int32), data[:, 1].astype(np.int32), data[:, 2]
         else:
-            for val in morph.data:
-                i = val.index
-                if i in offset_map:
-                    offset_map[i] = [a+b for a, b in zip(offset_map[i], val.offset)]
-                else:
-                    offset_map[i] = val.offset
-        return offset_map
+            count = len(morph.data)
+            if count == 0:
+                return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float64)
+            vertex_indices = np.empty(count, dtype=np.int32)
+            morph.data.foreach_get('index', vertex_indices)
+            values = np.empty(count*4, dtype=np.float32)
+            morph.data.foreach_get('offset', values)
+            values = values.reshape(-1, 4).astype(np.float64)
+
+        indices, inverse = np.unique(vertex_indices, return_inverse=True)
+        offsets = np.zeros((len(indices), 4), dtype=np.float64)
+        if morph.data_type == 'VERTEX_GROUP':
+            np.add.at(offsets, (inverse.ravel(), group_axis[groups]), weights*group_sign[groups])
+        else:
+            np.add.at(offsets, inverse.ravel(), values)
+        return indices, offsets
+
+    @staticmethod
+    def get_uv_morph_offset_map(obj, morph):
+        indices, offsets = FnMorph.get_uv_morph_offset_arrays(obj, morph)
+        return dict(zip(indices.tolist(), offsets.tolist())) # offset_map[vertex_index] = offset_xyzw
 
     @staticmethod
     def store_uv_morph_data(obj, morph, offsets=None, offset_axes='XYZW'):
+        """
+        Stores the offsets of an uv morph as vertex groups "UV_<morph name><sign><axis>".
+        The offsets can be an iterable of (index, offset) items or an index/offset array pair.
+        All vertices of a vertex group sharing the same weight are added with a single call.
+        """
         vertex_groups = obj.vertex_groups
         morph_name = getattr(morph, 'name', None)
         if offset_axes:
             for vg, n, x in FnMorph.get_uv_morph_vertex_groups(obj, morph_name, offset_axes):
                 vertex_groups.remove(vg)
-        if not morph_name or not offsets:
+        if not morph_name or offsets is None:
+            return
+
+        if isinstance(offsets, tuple) and len(offsets) == 2 and isinstance(offsets[0], np.ndarray):
+            indices, values = offsets
+        else:
+            offsets = tuple(offsets)
+            indices = np.array([d.index for d in offsets], dtype=np.int32)
+            values = np.array([d.offset for d in offsets], dtype=np.float64).reshape(-1, 4)
+        if len(indices) == 0:
             return
 
         axis_indices = tuple('XYZW'.index(x) for x in offset_axes) or tuple(range(4))
-        offset_map = FnMorph.get_uv_morph_offset_map(obj, morph) if offset_axes else {}
-        for data in offsets:
-            idx, offset = data.index, data.offset
-            for i in axis_indices:
-                offset_map.setdefault(idx, [0, 0, 0, 0])[i] += round(offset[i], 5)
+        axis_mask = np.zeros(4, dtype=np.float64)
+        axis_mask[list(axis_indices)] = 1
+        values = np.round(np.asarray(values, dtype=np.float64), 5) * axis_mask
 
-        max_value = max(max(abs(x) for x in v) for v in offset_map.values() or ([0],))
+        if offset_axes:
+            base_indices, base_values = FnMorph.get_uv_morph_offset_arrays(obj, morph)
+            indices = np.concatenate((base_indices, indices))
+            values = np.concatenate((base_values, values))
+        indices, inverse = np.unique(indices, return_inverse=True)
+        offset_map = np.zeros((len(indices), 4), dtype=np.float64)
+        np.add.at(offset_map, inverse.ravel(), values)
+
+        max_value = np.max(np.abs(offset_map)) if offset_map.size else 0
         scale = morph.vertex_group_scale = max(abs(morph.vertex_group_scale), max_value)
-        for idx, offset in offset_map.items():
-            for val, axis in zip(offset, 'XYZW'):
-                if abs(val) > 1e-4:
-                    vg_name = 'UV_{0}{1}{2}'.format(morph_name, '-' if val < 0 else '+', axis)
-                    vg = vertex_groups.get(vg_name, None) or vertex_groups.new(name=vg_name)
-                    vg.add(index=[idx], weight=abs(val)/scale, type='REPLACE')
+        for axis_index, axis in enumerate('XYZW'):
+            axis_values = offset_map[:, axis_index]
+            for sign, sign_mask in (('-', axis_values < -1e-4), ('+', axis_values > 1e-4)):
+                if not sign_mask.any():
+                    continue
+                vg_name = 'UV_{0}{1}{2}'.format(morph_name, sign, axis)
+                vg = vertex_groups.get(vg_name, None) or vertex_groups.new(name=vg_name)
+                # weights are stored as float32, so grouping by the float32 value is lossless
+                weights = (np.abs(axis_values[sign_mask])/scale).astype(np.float32)
+                group_indices = indices[sign_mask]
+                unique_weights, weight_groups = np.unique(weights, return_inverse=True)
+                weight_groups = weight_groups.ravel()
+                order = np.argsort(weight_groups, kind='stable')
+                splits = np.cumsum(np.bincount(weight_groups, minlength=len(unique_weights)))[:-1]
+                for weight, vertex_indices in zip(unique_weights.tolist(), np.split(group_indices[order], splits)):
+                    vg.add(index=vertex_indices.tolist(), weight=weight, type='REPLACE')
 
     def update_mat_related_mesh(self, new_mesh=None):
         for offset in self.__morph.data:
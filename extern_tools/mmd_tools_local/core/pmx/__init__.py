@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import struct
 import os
+import mmap
 import logging
 
+import numpy as np
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -112,6 +115,12 @@ class FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+    def tell(self):
+        return self.__fin.tell()
+
+    def seek(self, offset):
+        self.__fin.seek(offset)
+
 class FileWriteStream(FileStream):
     def __init__(self, path, pmx_header=None):
         self.__fout = open(path, 'wb')
@@ -168,7 +177,7 @@ class FileWriteStream(FileStream):
         self.__fout.write(struct.pack('<f', float(v)))
 
     def writeVector(self, v):
-        self.__fout.write(struct.pack('<'+'f'*len(v), *v))
+        self.__fout.write(_vector_struct(len(v)).pack(*v))
 
     def writeByte(self, v):
         self.__fout.write(struct.pack('<B', int(v)))
@@ -179,6 +188,51 @@ class FileWriteStream(FileStream):
     def writeSignedByte(self, v):
         self.__fout.write(struct.pack('<b', int(v)))
 
+    def writeArray(self, v):
+        self.__fout.write(v.tobytes())
+
+    # Index arrays for writing whole sections at once
+    def vertexIndexArray(self, v):
+        return _index_array(v, self.header().vertex_index_size, False)
+
+    def boneIndexArray(self, v):
+        return _index_array(v, self.header().bone_index_size, True)
+
+
+_VECTOR_STRUCTS = {}
+
+def _vector_struct(size):
+    s = _VECTOR_STRUCTS.get(size)
+    if s is None:
+        s = _VECTOR_STRUCTS[size] = struct.Struct('<'+'f'*size)
+    return s
+
+def _index_dtype(size, signed):
+    if size not in (1, 2, 4):
+        raise ValueError('invalid data size %s'%str(size))
+    return np.dtype(('<i%d' if signed else '<u%d')%size)
+
+def _index_array(v, size, signed):
+    """ Converts indices the same way as the write*Index methods do, including their range checks.
+    """
+    dtype = _index_dtype(size, signed)
+    v = np.asarray(v)
+    if v.dtype.kind not in 'iu':
+        v = np.array([int(x) for x in v.ravel()], dtype=np.int64).reshape(v.shape)
+    if v.size:
+        info = np.iinfo(dtype)
+        if v.min() < info.min or v.max() > info.max:
+            raise struct.error('index out of range for %d byte(s)'%size)
+    return v.astype(dtype)
+
+def _float_array(v, shape):
+    """ Converts a list of vectors to a float32 array of the given shape, or raises ValueError.
+    """
+    v = np.array(v, dtype=np.float64)
+    if v.shape != shape:
+        raise ValueError('unexpected shape %s'%str(v.shape))
+    return v.astype('<f4')
+
 class Encoding:
     _MAP = [
         (0, 'utf-16-le'),
@@ -316,6 +370,8 @@ class Header:
             )
 
 class Model:
+    SECTIONS = ('info', 'vertices', 'faces', 'textures', 'materials', 'bones', 'morphs', 'display', 'rigids', 'joints')
+
     def __init__(self):
         self.filepath = ''
         self.header = None
@@ -351,6 +407,37 @@ class Model:
         self.filepath = fs.path()
         self.header = fs.header()
 
+        self.loadInfo(fs)
+        self.loadVertices(fs)
+        self.loadFaces(fs)
+        self.loadTextures(fs)
+        self.loadMaterials(fs, len(self.textures))
+        self.loadBones(fs)
+        self.loadMorphs(fs)
+        self.loadDisplay(fs)
+        self.loadRigids(fs)
+        self.loadJoints(fs)
+
+    def loadSections(self, fs, index, sections):
+        """ Loads only the given sections, the others keep their defaults.
+        Every section is read from its offset in the SectionIndex, so the data in front of it is never loaded.
+        """
+        unknown = set(sections) - set(self.SECTIONS)
+        if unknown:
+            raise ValueError('unknown pmx section(s) %s'%', '.join(sorted(unknown)))
+        self.filepath = fs.path()
+        self.header = fs.header()
+
+        for name in self.SECTIONS:
+            if name not in sections:
+                continue
+            fs.seek(index.offset(name))
+            if name == 'materials':
+                self.loadMaterials(fs, index.count('textures'))
+            else:
+                getattr(self, 'load' + name.capitalize())(fs)
+
+    def loadInfo(self, fs):
         self.name = fs.readStr()
         self.name_e = fs.readStr()
 
@@ -362,6 +449,7 @@ class Model:
         logging.info('Comment:%s', self.comment)
         logging.info('Comment(english):%s', self.comment_e)
 
+    def loadVertices(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info('Load Vertices')
@@ -374,6 +462,7 @@ class Model:
             self.vertices.append(v)
         logging.info('----- Loaded %d vertices', len(self.vertices))
 
+    def loadFaces(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Faces')
@@ -387,6 +476,7 @@ class Model:
             self.faces.append((f3, f2, f1))
         logging.info(' Load %d faces', len(self.faces))
 
+    def loadTextures(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Textures')
@@ -400,6 +490,7 @@ class Model:
             logging.info('Texture %d: %s', i, t.path)
         logging.info(' ----- Loaded %d textures', len(self.textures))
 
+    def loadMaterials(self, fs, num_textures):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Materials')
@@ -439,6 +530,7 @@ class Model:
 
         logging.info('----- Loaded %d  materials.', len(self.materials))
 
+    def loadBones(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Bones')
@@ -473,6 +565,7 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d bones.', len(self.bones))
 
+    def loadMorphs(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Morphs')
@@ -490,6 +583,7 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d morphs.', len(self.morphs))
 
+    def loadDisplay(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Display Items')
@@ -506,6 +600,7 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d display items.', len(self.display))
 
+    def loadRigids(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Rigid Bodies')
@@ -535,6 +630,7 @@ class Model:
 
         logging.info('----- Loaded %d rigid bodies.', len(self.rigids))
 
+    def loadJoints(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Joints')
@@ -578,16 +674,22 @@ comment(english):
 
         logging.info('exporting vertices... %d', len(self.vertices))
         fs.writeInt(len(self.vertices))
-        for i in self.vertices:
-            i.save(fs)
+        Vertex.saveAll(fs, self.vertices)
         logging.info('finished exporting vertices.')
 
         logging.info('exporting faces... %d', len(self.faces))
         fs.writeInt(len(self.faces)*3)
-        for f3, f2, f1 in self.faces:
-            fs.writeVertexIndex(f1)
-            fs.writeVertexIndex(f2)
-            fs.writeVertexIndex(f3)
+        try:
+            faces = fs.vertexIndexArray([(f1, f2, f3) for f3, f2, f1 in self.faces])
+        except (ValueError, TypeError, struct.error):
+            faces = None
+        if faces is not None:
+            fs.writeArray(faces)
+        else:
+            for f3, f2, f1 in self.faces:
+                fs.writeVertexIndex(f1)
+                fs.writeVertexIndex(f2)
+                fs.writeVertexIndex(f3)
         logging.info('finished exporting faces.')
 
         logging.info('exporting textures... %d', len(self.textures))
@@ -684,6 +786,88 @@ class Vertex:
         self.weight.save(fs)
         fs.writeFloat(self.edge_scale)
 
+    @staticmethod
+    def saveAll(fs, vertices):
+        """ Writes all vertices with one write call. Every weight type gets its own
+        structured array matching the on-disk layout, and their records are put together
+        in vertex order. Falls back to saving each vertex if the data doesn't fit the layout,
+        so invalid data fails the same way as before.
+        """
+        if len(vertices) == 0:
+            return
+        try:
+            buf = Vertex.__pack(fs, vertices)
+        except (ValueError, IndexError, TypeError, AttributeError, struct.error):
+            for v in vertices:
+                v.save(fs)
+            return
+        fs.writeArray(buf)
+
+    @staticmethod
+    def __pack(fs, vertices):
+        count = len(vertices)
+        num_uvs = fs.header().additional_uvs
+        co = _float_array([v.co for v in vertices], (count, 3))
+        normal = _float_array([v.normal for v in vertices], (count, 3))
+        uv = _float_array([v.uv for v in vertices], (count, 2))
+        edge_scale = _float_array([v.edge_scale for v in vertices], (count,))
+        additional_uvs = np.zeros((count, num_uvs, 4), dtype='<f4')
+        uv_counts = np.array([len(v.additional_uvs) for v in vertices])
+        for uv_count in set(uv_counts.tolist()) - {0}:
+            indices = np.flatnonzero(uv_counts == uv_count)
+            additional_uvs[indices, :uv_count] = _float_array([vertices[i].additional_uvs for i in indices], (len(indices), uv_count, 4))
+
+        weight_types = np.array([v.weight.type for v in vertices])
+        if not set(weight_types.tolist()) <= set(BoneWeight.LAYOUTS.keys()):
+            raise ValueError('invalid weight type')
+
+        bone_dtype = _index_dtype(fs.header().bone_index_size, True)
+        head = [('co', '<f4', (3,)), ('normal', '<f4', (3,)), ('uv', '<f4', (2,))]
+        if num_uvs:
+            head.append(('additional_uvs', '<f4', (num_uvs, 4)))
+        head.append(('type', 'u1'))
+
+        records = {}
+        sizes = np.zeros(count, dtype=np.int64)
+        for weight_type, (bone_count, weight_count) in BoneWeight.LAYOUTS.items():
+            indices = np.flatnonzero(weight_types == weight_type)
+            if len(indices) == 0:
+                continue
+            fields = head + [('bones', bone_dtype, (bone_count,))]
+            if weight_count:
+                fields.append(('weights', '<f4', (weight_count,)))
+            fields.append(('edge_scale', '<f4'))
+            rec = np.zeros(len(indices), dtype=np.dtype(fields))
+            rec['co'] = co[indices]
+            rec['normal'] = normal[indices]
+            rec['uv'] = uv[indices]
+            if num_uvs:
+                rec['additional_uvs'] = additional_uvs[indices]
+            rec['type'] = weight_type
+            weights = [vertices[i].weight for i in indices]
+            rec['bones'] = fs.boneIndexArray([w.bones[:bone_count] for w in weights])
+            if weight_type == BoneWeight.SDEF:
+                if not all(isinstance(w.weights, BoneWeightSDEF) for w in weights):
+                    raise ValueError
+                rec['weights'] = _float_array([(w.weights.weight,) + tuple(w.weights.c) + tuple(w.weights.r0) + tuple(w.weights.r1) for w in weights], (len(indices), 10))
+            elif weight_count:
+                rec['weights'] = _float_array([w.weights[:weight_count] for w in weights], (len(indices), weight_count))
+            rec['edge_scale'] = edge_scale[indices]
+            records[weight_type] = (indices, rec)
+            sizes[indices] = rec.dtype.itemsize
+
+        # Scatter the records of all weight types into one buffer, in chunks to keep the index arrays small
+        offsets = np.cumsum(sizes) - sizes
+        buf = np.empty(int(sizes.sum()), dtype=np.uint8)
+        for indices, rec in records.values():
+            item_size = rec.dtype.itemsize
+            raw = rec.view(np.uint8).reshape(len(indices), item_size)
+            byte_range = np.arange(item_size)
+            for start in range(0, len(indices), 16384):
+                chunk = slice(start, start+16384)
+                buf[(offsets[indices[chunk], None] + byte_range).ravel()] = raw[chunk].ravel()
+        return buf
+
 class BoneWeightSDEF:
     def __init__(self, weight=0, c=None, r0=None, r1=None):
         self.weight = weight
@@ -697,6 +881,14 @@ class BoneWeight:
     BDEF4 = 2
     SDEF  = 3
 
+    # Number of bone indices and floats that get stored for each weight type
+    LAYOUTS = {
+        BDEF1: (1, 0),
+        BDEF2: (2, 1),
+        BDEF4: (4, 4),
+        SDEF: (2, 10),
+        }
+
     TYPES = [
         (BDEF1, 'BDEF1'),
         (BDEF2, 'BDEF2'),
@@ -1181,9 +1373,25 @@ class Morph:
         fs.writeSignedByte(self.category)
         fs.writeSignedByte(self.type_index())
         fs.writeInt(len(self.offsets))
+        self.saveOffsets(fs)
+
+    def saveOffsets(self, fs):
         for i in self.offsets:
             i.save(fs)
 
+    def _saveOffsetArray(self, fs, size):
+        """ Writes (vertex index, offset vector) records with one write call
+        """
+        try:
+            indices = fs.vertexIndexArray([i.index for i in self.offsets])
+            offsets = _float_array([i.offset for i in self.offsets], (len(self.offsets), size))
+        except (ValueError, TypeError, struct.error):
+            return Morph.saveOffsets(self, fs)
+        rec = np.empty(len(self.offsets), dtype=[('index', indices.dtype), ('offset', '<f4', (size,))])
+        rec['index'] = indices
+        rec['offset'] = offsets
+        fs.writeArray(rec)
+
 class VertexMorph(Morph):
     def __init__(self, *args, **kwargs):
         Morph.__init__(self, *args, **kwargs)
@@ -1191,6 +1399,9 @@ class VertexMorph(Morph):
     def type_index(self):
         return 1
 
+    def saveOffsets(self, fs):
+        self._saveOffsetArray(fs, 3)
+
     def load(self, fs):
         num = fs.readInt()
         for i in range(num):
@@ -1219,6 +1430,9 @@ class UVMorph(Morph):
     def type_index(self):
         return self.uv_index + 3
 
+    def saveOffsets(self, fs):
+        self._saveOffsetArray(fs, 4)
+
     def load(self, fs):
         self.offsets = []
         num = fs.readInt()
@@ -1584,7 +1798,186 @@ class Joint:
 
 
 
-def load(path):
+class SectionIndex:
+    """ Byte offsets of the sections of a pmx file, for loading single sections.
+    The records in front of a section are skipped by their size. Only what decides the size gets read,
+    like the weight type of each vertex and the flags of each bone, nothing else is decoded.
+    Scanning stops at the last section that is needed.
+    """
+    # Sizes of the fixed parts of the records, without names and indices
+    MATERIAL_SIZE = 65 # diffuse, specular, shininess, ambient, flags, edge color, edge size
+    RIGID_SIZE = 61 # without the bone index
+
+    def __init__(self, path, header, start, sections=None):
+        self.header = header
+        self.__offsets = {}
+        self.__counts = {}
+
+        last = Model.SECTIONS[-1]
+        if sections is not None:
+            last = Model.SECTIONS[max([Model.SECTIONS.index(name) for name in sections if name in Model.SECTIONS] or [0])]
+        skips = {
+            'info': self.__skipInfo,
+            'vertices': self.__skipVertices,
+            'faces': self.__skipFaces,
+            'textures': self.__skipTextures,
+            'materials': self.__skipMaterials,
+            'bones': self.__skipBones,
+            'morphs': self.__skipMorphs,
+            'display': self.__skipDisplay,
+            'rigids': self.__skipRigids,
+            }
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            self.__buf = buf
+            try:
+                pos = start
+                for name in Model.SECTIONS:
+                    self.__offsets[name] = pos
+                    if name == last:
+                        break
+                    pos = skips[name](pos)
+                    if pos > len(buf):
+                        raise struct.error('the %s section is truncated'%name)
+            finally:
+                self.__buf = None
+
+    def __repr__(self):
+        return '<SectionIndex %s>'%', '.join('%s %d'%(name, self.__offsets[name]) for name in Model.SECTIONS if name in self.__offsets)
+
+    def offset(self, section):
+        return self.__offsets[section]
+
+    def count(self, section):
+        return self.__counts[section]
+
+    def __readInt(self, pos):
+        v, = struct.unpack_from('<i', self.__buf, pos)
+        return v
+
+    def __skipStr(self, pos):
+        return pos + 4 + self.__readInt(pos)
+
+    def __skipCount(self, name, pos):
+        self.__counts[name] = self.__readInt(pos)
+        return self.__counts[name], pos + 4
+
+    def __skipInfo(self, pos):
+        for i in range(4):
+            pos = self.__skipStr(pos)
+        return pos
+
+    def __skipVertices(self, pos):
+        num, pos = self.__skipCount('vertices', pos)
+        header = self.header
+        type_offset = 32 + 16*header.additional_uvs # co, normal, uv and additional uvs come before the weight type
+        sizes = [None]*len(BoneWeight.LAYOUTS)
+        for weight_type, (bone_count, weight_count) in BoneWeight.LAYOUTS.items():
+            sizes[weight_type] = type_offset + 1 + bone_count*header.bone_index_size + 4*weight_count + 4
+        buf = self.__buf
+        try:
+            for i in range(num):
+                pos += sizes[buf[pos + type_offset]]
+        except IndexError:
+            if pos + type_offset >= len(buf):
+                raise struct.error('the vertices section is truncated')
+            raise ValueError('invalid weight type %s'%str(buf[pos + type_offset]))
+        return pos
+
+    def __skipFaces(self, pos):
+        num, pos = self.__skipCount('faces', pos)
+        return pos + num*self.header.vertex_index_size
+
+    def __skipTextures(self, pos):
+        num, pos = self.__skipCount('textures', pos)
+        for i in range(num):
+            pos = self.__skipStr(pos)
+        return pos
+
+    def __skipMaterials(self, pos):
+        num, pos = self.__skipCount('materials', pos)
+        texture_index_size = self.header.texture_index_size
+        buf = self.__buf
+        for i in range(num):
+            pos = self.__skipStr(self.__skipStr(pos))
+            pos += self.MATERIAL_SIZE + 2*texture_index_size + 1 # texture, sphere texture and sphere mode
+            pos += 2 if buf[pos] == 1 else 1 + texture_index_size # shared or own toon texture
+            pos = self.__skipStr(pos) + 4 # comment and vertex count
+        return pos
+
+    def __skipBones(self, pos):
+        num, pos = self.__skipCount('bones', pos)
+        bone_index_size = self.header.bone_index_size
+        buf = self.__buf
+        for i in range(num):
+            pos = self.__skipStr(self.__skipStr(pos))
+            pos += 12 + bone_index_size + 4 # location, parent and transform order
+            flags, = struct.unpack_from('<h', buf, pos)
+            pos += 2
+            pos += bone_index_size if flags & 0x0001 else 12
+            if flags & 0x0300:
+                pos += bone_index_size + 4
+            if flags & 0x0400:
+                pos += 12
+            if flags & 0x0800:
+                pos += 24
+            if flags & 0x2000:
+                pos += 4
+            if flags & 0x0020:
+                pos += bone_index_size + 8 # target, loop count and rotation constraint
+                num_links = self.__readInt(pos)
+                pos += 4
+                for j in range(num_links):
+                    pos += bone_index_size
+                    pos += 25 if buf[pos] == 1 else 1
+        return pos
+
+    def __skipMorphs(self, pos):
+        num, pos = self.__skipCount('morphs', pos)
+        header = self.header
+        offset_sizes = {
+            0: header.morph_index_size + 4,
+            1: header.vertex_index_size + 12,
+            2: header.bone_index_size + 28,
+            8: header.material_index_size + 113,
+            }
+        for i in range(3, 8):
+            offset_sizes[i] = header.vertex_index_size + 16
+        buf = self.__buf
+        for i in range(num):
+            pos = self.__skipStr(self.__skipStr(pos))
+            morph_type, = struct.unpack_from('<b', buf, pos + 1)
+            if morph_type not in offset_sizes:
+                raise ValueError('invalid morph type %s'%str(morph_type))
+            pos += 2
+            pos += 4 + self.__readInt(pos)*offset_sizes[morph_type]
+        return pos
+
+    def __skipDisplay(self, pos):
+        num, pos = self.__skipCount('display', pos)
+        index_sizes = {0: self.header.bone_index_size, 1: self.header.morph_index_size}
+        buf = self.__buf
+        for i in range(num):
+            pos = self.__skipStr(self.__skipStr(pos)) + 1
+            num_items = self.__readInt(pos)
+            pos += 4
+            for j in range(num_items):
+                if buf[pos] not in index_sizes:
+                    raise ValueError('invalid display type %s'%str(buf[pos]))
+                pos += 1 + index_sizes[buf[pos]]
+        return pos
+
+    def __skipRigids(self, pos):
+        num, pos = self.__skipCount('rigids', pos)
+        for i in range(num):
+            pos = self.__skipStr(self.__skipStr(pos)) + self.header.bone_index_size + self.RIGID_SIZE
+        return pos
+
+
+def load(path, sections=None):
+    """ Loads a pmx file. With sections, only those sections of Model.SECTIONS are loaded,
+    e.g. ('bones', 'morphs') for the bone and morph tables without the vertex data.
+    """
     with FileReadStream(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmx module')
@@ -1597,7 +1990,12 @@ def load(path):
         fs.setHeader(header)
         model = Model()
         try:
-            model.load(fs)
+            if sections is None:
+                model.load(fs)
+            else:
+                index = SectionIndex(path, header, fs.tell(), sections)
+                logging.debug('%s', index)
+                model.loadSections(fs, index, sections)
         except struct.error as e:
             logging.error(' * Corrupted file: %s', e)
             #raise
@@ -5,6 +5,7 @@ import logging
 import time
 
 import bpy
+import numpy as np
 from mathutils import Vector, Matrix
 
 import mmd_tools_local.core.model as mmd_model
@@ -689,8 +690,7 @@ class PMXImporter:
     def __importUVMorphs(self):
         mmd_root = self.__root.mmd_root
         categories = self.CATEGORIES
-        __OffsetData = collections.namedtuple('OffsetData', 'index, offset')
-        __convert_offset = lambda x: (x[0], -x[1], x[2], -x[3])
+        __convert_offset = np.array((1, -1, 1, -1), dtype=np.float64)
         for morph in (x for x in self.__model.morphs if isinstance(x, pmx.UVMorph)):
             uv_morph = mmd_root.uv_morphs.add()
             uv_morph.name = morph.name
@@ -698,8 +698,9 @@ class PMXImporter:
             uv_morph.category = categories.get(morph.category, 'OTHER')
             uv_morph.uv_index = morph.uv_index
 
-            offsets = (__OffsetData(d.index, __convert_offset(d.offset)) for d in morph.offsets)
-            FnMorph.store_uv_morph_data(self.__meshObj, uv_morph, offsets, '')
+            indices = np.array([d.index for d in morph.offsets], dtype=np.int32)
+            offsets = np.array([d.offset for d in morph.offsets], dtype=np.float64).reshape(-1, 4) * __convert_offset
+            FnMorph.store_uv_morph_data(self.__meshObj, uv_morph, (indices, offsets), '')
             uv_morph.data_type = 'VERTEX_GROUP'
 
     def __importGroupMorphs(self):
@@ -822,7 +823,8 @@ class PMXImporter:
                 self.__vertex_map = _PMXCleaner.remove_doubles(self.__model, 'MORPHS' not in types)
             self.__createMeshObject()
             self.__importVertices()
-            self.__importMaterials()
+            with FnMaterial.image_index():
+                self.__importMaterials()
             self.__importFaces()
             self.__meshObj.data.update()
             self.__assignCustomNormals()
@@ -877,6 +879,15 @@ class PMXImporter:
         logging.info('****************************************')
 
 
+def _unique_rows(rows):
+    """ Compare the rows of a 2D array by their bytes and return the index of
+    the first occurrence of every distinct row and the inverse mapping. """
+    rows = np.ascontiguousarray(rows)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return first, inverse.ravel()
+
+
 class _PMXCleaner:
     @classmethod
     def clean(cls, pmx_model, mesh_only):
@@ -885,25 +896,20 @@ class _PMXCleaner:
         pmx_vertices = pmx_model.vertices
 
         # clean face/vertex
-        cls.__clean_pmx_faces(pmx_faces, pmx_model.materials, lambda f: frozenset(f))
+        cls.__clean_pmx_faces(pmx_faces, pmx_model.materials, lambda faces: faces)
 
-        index_map = {v:v for f in pmx_faces for v in f}
-        is_index_clean = len(index_map) == len(pmx_vertices)
+        faces = np.array(pmx_faces, dtype=np.int64).reshape(-1, 3)
+        used = np.unique(faces)
+        is_index_clean = len(used) == len(pmx_vertices)
         if is_index_clean:
             logging.info('   (vertices is clean)')
         else:
-            new_vertex_count = 0
-            for v in sorted(index_map):
-                if v != new_vertex_count:
-                    pmx_vertices[new_vertex_count] = pmx_vertices[v]
-                    index_map[v] = new_vertex_count
-                new_vertex_count += 1
-            logging.warning('   - removed %d vertices', len(pmx_vertices)-new_vertex_count)
-            del pmx_vertices[new_vertex_count:]
+            old_vertex_count = len(pmx_vertices)
+            pmx_vertices[:] = [pmx_vertices[v] for v in used.tolist()]
+            logging.warning('   - removed %d vertices', old_vertex_count-len(pmx_vertices))
 
             # update vertex indices of faces
-            for f in pmx_faces:
-                f[:] = [index_map[v] for v in f]
+            pmx_faces[:] = np.searchsorted(used, faces).tolist()
 
         if mesh_only:
             logging.info('   - Done (mesh only)!!')
@@ -911,95 +917,132 @@ class _PMXCleaner:
 
         if not is_index_clean:
             # clean vertex/uv morphs
-            def __update_index(x):
-                x.index = index_map.get(x.index, None)
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+            index_map = np.full(max(old_vertex_count, int(used[-1])+1 if len(used) else 0), -1, dtype=np.int64)
+            index_map[used] = np.arange(len(used))
+            cls.__clean_pmx_morphs(pmx_model.morphs, index_map)
         logging.info('   - Done!!')
 
     @classmethod
     def remove_doubles(cls, pmx_model, mesh_only):
         logging.info('Removing doubles...')
         pmx_vertices = pmx_model.vertices
+        vertex_count = len(pmx_vertices)
 
-        vertex_map = [None] * len(pmx_vertices)
-        # gather vertex data
-        for i, v in enumerate(pmx_vertices):
-            vertex_map[i] = [tuple(v.co)]
+        # gather vertex data, "+ 0.0" folds -0.0 into 0.0 so rows compare like python floats
+        rows = np.array([v.co for v in pmx_vertices], dtype=np.float64).reshape(vertex_count, 3) + 0.0
         if not mesh_only:
+            # every vertex is keyed by its position followed by the sequence of its morph offsets
+            offset_vertices = []
+            offset_values = []
             for m in pmx_model.morphs:
                 if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
                     continue
                 for x in m.offsets:
-                    vertex_map[x.index].append(tuple(x.offset))
+                    offset_vertices.append(x.index)
+                    offset = tuple(x.offset)
+                    offset_values.append((len(offset),) + offset + (0.0,) * (4 - len(offset)))
+            if offset_vertices:
+                offset_vertices = np.array(offset_vertices, dtype=np.int64)
+                if offset_vertices.min() < -vertex_count or offset_vertices.max() >= vertex_count:
+                    raise IndexError('list index out of range')
+                offset_vertices %= vertex_count
+                offset_ids = _unique_rows(np.array(offset_values, dtype=np.float64) + 0.0)[1]
+                order = np.argsort(offset_vertices, kind='mergesort')
+                offset_vertices, offset_ids = offset_vertices[order], offset_ids[order]
+                offset_counts = np.bincount(offset_vertices, minlength=vertex_count)
+                offset_pos = np.arange(len(offset_vertices)) - np.repeat(np.cumsum(offset_counts) - offset_counts, offset_counts)
+                # one column per offset slot, -1 marks an unused slot of a vertex with fewer offsets
+                columns = np.full((vertex_count, offset_counts.max()), -1, dtype=np.float64)
+                columns[offset_vertices, offset_pos] = offset_ids
+                rows = np.hstack((rows, columns))
         # generate vertex merging table
-        keys = {}
-        for i, v in enumerate(vertex_map):
-            k = tuple(v)
-            if k in keys:
-                vertex_map[i] = keys[k] # merge pmx_vertices[i] to pmx_vertices[keys[k][0]]
-            else:
-                vertex_map[i] = keys[k] = (i, len(keys)) # (pmx index, blender index)
-        counts = len(vertex_map) - len(keys)
-        keys.clear()
+        if vertex_count:
+            first, inverse = _unique_rows(rows)
+        else:
+            first = inverse = np.zeros(0, dtype=np.int64)
+        counts = vertex_count - len(first)
         if counts:
             logging.warning('   - %d vertices will be removed', counts)
         else:
             logging.info('   - Done (no changes)!!')
             return None
+        # (pmx index, blender index), blender indices follow the order of first appearance
+        blender_index = np.empty(len(first), dtype=np.int64)
+        blender_index[np.argsort(first)] = np.arange(len(first))
+        merged_index = first[inverse]
+        vertex_map = list(zip(merged_index.tolist(), blender_index[inverse].tolist()))
 
         # clean face
-        #face_key_func = lambda f: frozenset(vertex_map[x][0] for x in f)
-        face_key_func = lambda f: frozenset({vertex_map[x][0]:tuple(pmx_vertices[x].uv) for x in f}.items())
-        cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, face_key_func)
+        uvs = np.array([v.uv for v in pmx_vertices], dtype=np.float64).reshape(vertex_count, 2) + 0.0
+        cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, lambda faces: merged_index[faces], uvs)
 
         if mesh_only:
             logging.info('   - Done (mesh only)!!')
         else:
             # clean vertex/uv morphs
-            def __update_index(x):
-                indices = vertex_map[x.index]
-                x.index = indices[1] if x.index == indices[0] else None
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+            index_map = np.where(merged_index == np.arange(vertex_count), blender_index[inverse], -1)
+            cls.__clean_pmx_morphs(pmx_model.morphs, index_map)
             logging.info('   - Done!!')
         return vertex_map
 
 
     @staticmethod
-    def __clean_pmx_faces(pmx_faces, pmx_materials, face_key_func):
-        new_face_count = 0
-        face_iter = iter(pmx_faces)
-        for mat in pmx_materials:
-            used_faces = set()
-            new_vertex_count = 0
-            for i in range(int(mat.vertex_count/3)):
-                f = next(face_iter)
-
-                f_key = face_key_func(f)
-                if len(f_key) != 3 or f_key in used_faces:
-                    continue
-                used_faces.add(f_key)
+    def __clean_pmx_faces(pmx_faces, pmx_materials, face_ids_func, uvs=None):
+        """ Remove degenerate faces and faces repeated within a material.
 
-                pmx_faces[new_face_count] = list(f)
-                new_face_count += 1
-                new_vertex_count += 3
-            mat.vertex_count = new_vertex_count
-        face_iter = None
+        face_ids_func maps the (N, 3) face array to the vertex ids the faces are
+        compared by, faces are also compared by the uvs of their vertices if given.
+        """
+        face_counts = [int(mat.vertex_count/3) for mat in pmx_materials]
+        face_count = sum(face_counts)
+        if face_count > len(pmx_faces):
+            raise ValueError('materials use %d faces, only %d faces found'%(face_count, len(pmx_faces)))
+        faces = np.array(pmx_faces[:face_count], dtype=np.int64).reshape(face_count, 3)
+        face_materials = np.repeat(np.arange(len(face_counts)), face_counts)
+
+        ids = face_ids_func(faces)
+        keep = (ids[:, 0] != ids[:, 1]) & (ids[:, 1] != ids[:, 2]) & (ids[:, 0] != ids[:, 2])
+        valid = np.flatnonzero(keep)
+        if len(valid):
+            # faces match regardless of their winding, so compare the corners sorted by id
+            order = np.argsort(ids[valid], axis=1)
+            rows = np.arange(len(valid))[:, None]
+            key = [face_materials[valid, None], ids[valid][rows, order]]
+            if uvs is not None:
+                key.append(uvs[faces[valid][rows, order]].reshape(-1, 6))
+            first = _unique_rows(np.hstack(key).astype(np.float64))[0]
+            keep[:] = False
+            keep[valid[first]] = True
+
+        for mat, count in zip(pmx_materials, np.bincount(face_materials[keep], minlength=len(face_counts)).tolist()):
+            mat.vertex_count = count * 3
+        new_face_count = int(keep.sum())
         if new_face_count == len(pmx_faces):
             logging.info('   (faces is clean)')
         else:
             logging.warning('   - removed %d faces', len(pmx_faces)-new_face_count)
-            del pmx_faces[new_face_count:]
+        pmx_faces[:] = faces[keep].tolist()
 
     @staticmethod
-    def __clean_pmx_morphs(pmx_morphs, index_update_func):
+    def __clean_pmx_morphs(pmx_morphs, index_map):
+        """ Remap the offsets of vertex/uv morphs with index_map, dropping
+        offsets mapped to -1 or out of its range. """
         for m in pmx_morphs:
             if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
                 continue
             old_len = len(m.offsets)
-            m.offsets = [x for x in m.offsets if index_update_func(x)]
+            if not old_len:
+                continue
+            indices = np.array([x.index for x in m.offsets], dtype=np.int64)
+            in_range = (indices >= 0) & (indices < len(index_map))
+            new_indices = np.full(old_len, -1, dtype=np.int64)
+            new_indices[in_range] = index_map[indices[in_range]]
+            offsets = []
+            for x, i in zip(m.offsets, new_indices.tolist()):
+                if i >= 0:
+                    x.index = i
+                    offsets.append(x)
+            m.offsets = offsets
             counts = old_len - len(m.offsets)
             if counts:
                 logging.warning('   - removed %d (of %d) offsets of "%s"', counts, old_len, m.name)
-
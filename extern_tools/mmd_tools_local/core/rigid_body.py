@@ -27,6 +27,67 @@ def setRigidBodyWorldEnabled(enable):
     rigidbody_world.enabled = enable
     return enabled
 
+def getRigidBodyWorldObjects():
+    """ Return the objects of the rigid body and the constraint collections
+    (groups before 2.80) of the scene's rigid body world, creating them if needed.
+    """
+    if bpy.ops.rigidbody.world_add.poll():
+        bpy.ops.rigidbody.world_add()
+    rbw = bpy.context.scene.rigidbody_world
+    if bpy.app.version < (2, 80, 0):
+        if not rbw.group:
+            rbw.group = bpy.data.groups.new('RigidBodyWorld')
+            rbw.group.use_fake_user = True
+        if not rbw.constraints:
+            rbw.constraints = bpy.data.groups.new('RigidBodyConstraints')
+            rbw.constraints.use_fake_user = True
+        return rbw.group.objects, rbw.constraints.objects
+
+    if not rbw.collection:
+        rbw.collection = bpy.data.collections.new('RigidBodyWorld')
+        rbw.collection.use_fake_user = True
+    if not rbw.constraints:
+        rbw.constraints = bpy.data.collections.new('RigidBodyConstraints')
+        rbw.constraints.use_fake_user = True
+    return rbw.collection.objects, rbw.constraints.objects
+
+def addRigidBodies(objs, rb_type='ACTIVE'):
+    """ Add rigid body settings to objs with a single operator call instead of
+    running the operator on every object.
+    """
+    override = bpy.context.copy()
+    override['selected_objects'] = objs
+    bpy.ops.rigidbody.objects_add(override, type=rb_type)
+
+def addRigidBodyConstraint(obj, rbc_type='GENERIC_SPRING'):
+    getRigidBodyWorldObjects()
+    bpy.ops.rigidbody.constraint_add({'object':obj, 'scene':bpy.context.scene}, type=rbc_type)
+    return obj.rigid_body_constraint
+
+def duplicateRigidBodyConstraintObject(obj, counts):
+    """ Return obj and counts-1 copies of it.
+
+    constraint_add only works on the active object, but copying an object also
+    copies its constraint settings, so the copies only need to be linked to the
+    scene and the collections (groups before 2.80) of obj, which include the
+    constraint collection of the rigid body world.
+    """
+    objs = [obj]
+    if bpy.app.version < (2, 80, 0):
+        scene_objects = bpy.context.scene.objects
+        groups = list(obj.users_group)
+    else:
+        scene_objects = None
+        groups = list(obj.users_collection)
+    for i in range(counts - 1):
+        new_obj = obj.copy()
+        if scene_objects is not None:
+            scene_objects.link(new_obj)
+        for group in groups:
+            group.objects.link(new_obj)
+        objs.append(new_obj)
+    return objs
+
 
 class RigidBodyMaterial:
     COLORS = [
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import bpy
+import numpy as np
 from bpy.types import Operator
 from mathutils import Vector, Quaternion
 
@@ -582,15 +583,21 @@ class ViewUVMorph(Operator):
                 self.report({ 'ERROR' }, "Failed to create a temporary uv layer")
                 return { 'CANCELLED' }
 
-            offsets = FnMorph.get_uv_morph_offset_map(meshObj, morph).items()
-            offsets = {k:getattr(Vector(v), 'zw' if uv_layer_name.startswith('_') else 'xy') for k, v in offsets}
-            if len(offsets) > 0:
-                base_uv_data = mesh.uv_layers.active.data
+            indices, offsets = FnMorph.get_uv_morph_offset_arrays(meshObj, morph)
+            if len(indices) > 0:
+                vertex_offsets = np.zeros((len(mesh.vertices), 2), dtype=np.float32)
+                vertex_offsets[indices] = offsets[:, 2:4] if uv_layer_name.startswith('_') else offsets[:, 0:2]
+                vertex_selected = np.zeros(len(mesh.vertices), dtype=bool)
+                vertex_selected[indices] = True
+
+                loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+                mesh.loops.foreach_get('vertex_index', loop_vertices)
+                uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+                mesh.uv_layers.active.data.foreach_get('uv', uvs)
+
                 temp_uv_data = mesh.uv_layers[uv_tex.name].data
-                for i, l in enumerate(mesh.loops):
-                    select = temp_uv_data[i].select = (l.vertex_index in offsets)
-                    if select:
-                        temp_uv_data[i].uv = base_uv_data[i].uv + offsets[l.vertex_index]
+                temp_uv_data.foreach_set('uv', (uvs.reshape(-1, 2) + vertex_offsets[loop_vertices]).ravel())
+                temp_uv_data.foreach_set('select', vertex_selected[loop_vertices])
 
             uv_textures.active = uv_tex
             uv_tex.active_render = True
@@ -665,10 +672,14 @@ class EditUVMorph(Operator):
             bpy.ops.mesh.select_all(action='DESELECT')
             bpy.ops.object.mode_set(mode='OBJECT')
 
-            vertices = meshObj.data.vertices
-            for l, d in zip(meshObj.data.loops, meshObj.data.uv_layers.active.data):
-                if d.select:
-                    vertices[l.vertex_index].select = True
+            mesh = meshObj.data
+            loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get('vertex_index', loop_vertices)
+            loop_selected = np.empty(len(mesh.loops), dtype=bool)
+            mesh.uv_layers.active.data.foreach_get('select', loop_selected)
+            vertex_selected = np.zeros(len(mesh.vertices), dtype=bool)
+            vertex_selected[loop_vertices[loop_selected]] = True
+            mesh.vertices.foreach_set('select', vertex_selected)
 
             bpy.ops.object.mode_set(mode='EDIT')
         meshObj.select = selected
@@ -712,15 +723,24 @@ class ApplyUVMorph(Operator):
 
             from collections import namedtuple
             __OffsetData = namedtuple('OffsetData', 'index, offset')
-            offsets = {}
-            vertices = mesh.vertices
-            for l, i0, i1 in zip(mesh.loops, base_uv_data, temp_uv_data):
-                if vertices[l.vertex_index].select and l.vertex_index not in offsets:
-                    dx, dy = i1.uv - i0.uv
-                    if abs(dx) > 0.0001 or abs(dy) > 0.0001:
-                        offsets[l.vertex_index] = __OffsetData(l.vertex_index, (dx, dy, dx, dy))
-
-            FnMorph.store_uv_morph_data(meshObj, morph, offsets.values(), axis_type)
+
+            loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get('vertex_index', loop_vertices)
+            vertex_selected = np.empty(len(mesh.vertices), dtype=bool)
+            mesh.vertices.foreach_get('select', vertex_selected)
+            base_uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+            base_uv_data.foreach_get('uv', base_uvs)
+            temp_uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+            temp_uv_data.foreach_get('uv', temp_uvs)
+
+            # the first changed loop of each selected vertex defines its offset
+            deltas = (temp_uvs - base_uvs).reshape(-1, 2)
+            changed = vertex_selected[loop_vertices] & np.any(np.abs(deltas) > 0.0001, axis=1)
+            indices, first_loops = np.unique(loop_vertices[changed], return_index=True)
+            deltas = deltas[changed][first_loops].astype(np.float64)
+            offsets = [__OffsetData(i, (dx, dy, dx, dy)) for i, (dx, dy) in zip(indices.tolist(), deltas.tolist())]
+
+            FnMorph.store_uv_morph_data(meshObj, morph, offsets, axis_type)
             morph.data_type = 'VERTEX_GROUP'
 
         meshObj.select = selected
@@ -449,23 +449,7 @@ class UpdateRigidBodyWorld(Operator):
     @staticmethod
     def __get_rigid_body_world_objects():
         rigid_body.setRigidBodyWorldEnabled(True)
-        rbw = bpy.context.scene.rigidbody_world
-        if bpy.app.version < (2, 80, 0):
-            if not rbw.group:
-                rbw.group = bpy.data.groups.new('RigidBodyWorld')
-                rbw.group.use_fake_user = True
-            if not rbw.constraints:
-                rbw.constraints = bpy.data.groups.new('RigidBodyConstraints')
-                rbw.constraints.use_fake_user = True
-            return rbw.group.objects, rbw.constraints.objects
-
-        if not rbw.collection:
-            rbw.collection = bpy.data.collections.new('RigidBodyWorld')
-            rbw.collection.use_fake_user = True
-        if not rbw.constraints:
-            rbw.constraints = bpy.data.collections.new('RigidBodyConstraints')
-            rbw.constraints.use_fake_user = True
-        return rbw.collection.objects, rbw.constraints.objects
+        return rigid_body.getRigidBodyWorldObjects()
 
     def execute(self, context):
         scene_objs = (bpy.context.scene.objects,)
@@ -2,6 +2,7 @@
 
 import bpy
 import csv
+import re
 
 jp_half_to_full_tuples = (
     ('ｳﾞ', 'ヴ'), ('ｶﾞ', 'ガ'), ('ｷﾞ', 'ギ'), ('ｸﾞ', 'グ'), ('ｹﾞ', 'ゲ'),
@@ -178,11 +179,34 @@ def getTranslator(csvfile='', keep_order=False):
     translator.update()
     return translator
 
+class _ReplaceTable:
+    """
+    A compiled replace table. All keys are matched in a single pass, where the longest key wins at each position
+    (ties are resolved by the order of the tuples), instead of one str.replace pass per tuple.
+    """
+    def __init__(self, tuples):
+        self.__map = {}
+        for pair in tuples:
+            self.__map.setdefault(pair[0], pair[1])
+        keys = sorted(self.__map.keys(), key=len, reverse=True)
+        self.__pattern = re.compile('|'.join(re.escape(k) for k in keys)) if keys else None
+
+    def replace(self, name):
+        if self.__pattern is None:
+            return name
+        return self.__pattern.sub(lambda m: self.__map[m.group(0)], name)
+
+_half_to_full_table = _ReplaceTable(jp_half_to_full_tuples)
+
+
 class MMDTranslator:
 
     def __init__(self):
         self.__csv_tuples = []
         self.__fails = {}
+        self.__longest_match = False
+        self.__table = None
+        self.__cache = {}
 
     @staticmethod
     def default_csv_filepath():
@@ -213,6 +237,8 @@ class MMDTranslator:
 
     def sort(self):
         self.__csv_tuples.sort(key=lambda row: (-len(row[0]), row))
+        self.__longest_match = True
+        self.__reset()
 
     def update(self):
         from collections import OrderedDict
@@ -220,10 +246,24 @@ class MMDTranslator:
         tuples_dict = OrderedDict((row[0], row) for row in self.__csv_tuples if len(row) >= 2 and row[0])
         self.__csv_tuples.clear()
         self.__csv_tuples.extend(tuples_dict.values())
+        self.__reset()
         print(' - removed items:', count_old-len(self.__csv_tuples), '(of %d)'%count_old)
 
+    def __reset(self):
+        self.__table = None
+        self.__cache.clear()
+
+    def __replace(self, name):
+        # sorted tuples (longest first) are compiled into a single pass table,
+        # tuples in a custom order keep their sequential replace behavior
+        if not self.__longest_match:
+            return self.replace_from_tuples(name, self.__csv_tuples)
+        if self.__table is None:
+            self.__table = _ReplaceTable(self.__csv_tuples)
+        return self.__table.replace(name)
+
     def half_to_full(self, name):
-        return self.replace_from_tuples(name, jp_half_to_full_tuples)
+        return _half_to_full_table.replace(name)
 
     def is_translated(self, name):
         try:
@@ -233,9 +273,12 @@ class MMDTranslator:
         return True
 
     def translate(self, name, default=None, from_full_width=True):
-        if from_full_width:
-            name = self.half_to_full(name)
-        name_new = self.replace_from_tuples(name, self.__csv_tuples)
+        # repeated names (left/right pairs, numbered bones) are only translated once
+        key = (name, from_full_width)
+        if key not in self.__cache:
+            name_full = self.half_to_full(name) if from_full_width else name
+            self.__cache[key] = (name_full, self.__replace(name_full))
+        name, name_new = self.__cache[key]
         if default is not None and not self.is_translated(name_new):
             self.__fails[name] = name_new
             return default
@@ -256,6 +299,8 @@ class MMDTranslator:
         spamreader = csv.reader(csvfile, delimiter=',', skipinitialspace=True)
         csv_tuples = [tuple(row) for row in spamreader if len(row) >= 2]
         self.__csv_tuples = csv_tuples
+        self.__longest_match = False
+        self.__reset()
         print(' - load items:', len(self.__csv_tuples))
 
     def save_to_stream(self, csvfile=None):
@@ -8,7 +8,7 @@ root_bones_choices = {}
 testing = []
 
 dev_branch = False
-dict_found = False
+dict_found = None  # None until the dictionaries are loaded after startup
 version = None
 version_str = ''
 
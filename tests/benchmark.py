@@ -0,0 +1,279 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmarks for the PMX, PMD and VMD parsers and serializers on synthetic files.
+# Runs with plain Python and numpy, Blender is not needed.
+#
+#   python tests/benchmark.py -s tiny,small -o before.json
+#   python tests/benchmark.py -s tiny,small -o after.json -c before.json
+#
+# With --compare the exit code is 1 if any benchmark got slower than the threshold allows.
+# The translation lookups need bpy, so they are not covered here.
+
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import logging
+import platform
+import tempfile
+import contextlib
+import subprocess
+from optparse import OptionParser
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import generators
+
+results_version = 1
+benchmarks = []  # (Name, Function(files) that returns the function to time)
+
+
+def benchmark(name):
+    def decorator(func):
+        benchmarks.append((name, func))
+        return func
+    return decorator
+
+
+@benchmark('pmx.save')
+def bench_pmx_save(files):
+    core = generators.load_core()
+    model = generators.build_pmx(files.model, files.directory)
+    path = os.path.join(files.directory, 'save.pmx')
+    return lambda: core.pmx.save(path, model)
+
+
+@benchmark('pmx.load')
+def bench_pmx_load(files):
+    core = generators.load_core()
+    return lambda: core.pmx.load(files.pmx)
+
+
+@benchmark('pmx.load_sections')
+def bench_pmx_load_sections(files):
+    core = generators.load_core()
+    return lambda: core.pmx.load(files.pmx, sections=('bones', 'morphs'))
+
+
+@benchmark('pmx.load_physics')
+def bench_pmx_load_physics(files):
+    # Skips every section before the rigid bodies
+    core = generators.load_core()
+    return lambda: core.pmx.load(files.pmx, sections=('rigids', 'joints'))
+
+
+@benchmark('pmd.load')
+def bench_pmd_load(files):
+    if not files.pmd:
+        return None
+    core = generators.load_core()
+    return lambda: core.pmd.load(files.pmd)
+
+
+@benchmark('vmd.save')
+def bench_vmd_save(files):
+    vmd_file = generators.build_vmd(files.motion)
+    path = os.path.join(files.directory, 'save.vmd')
+    return lambda: vmd_file.save(filepath=path)
+
+
+@benchmark('vmd.load')
+def bench_vmd_load(files):
+    core = generators.load_core()
+
+    def load():
+        vmd_file = core.vmd.File()
+        vmd_file.load(filepath=files.vmd)
+    return load
+
+
+class Files:
+    # The generated files of one scale
+    def __init__(self, directory, scale, seed, overrides):
+        self.directory = directory
+        self.model, self.motion = generators.describe(scale, seed=seed, **overrides)
+        self.pmx = os.path.join(directory, 'model.pmx')
+        self.vmd = os.path.join(directory, 'motion.vmd')
+        self.pmd = None
+        generators.write_pmx(self.pmx, self.model)
+        generators.write_vmd(self.vmd, self.motion)
+        if self.model.vertex_count <= 0xffff:
+            self.pmd = os.path.join(directory, 'model.pmd')
+            generators.write_pmd(self.pmd, self.model)
+
+    def summary(self):
+        summary = self.model.summary()
+        summary['motion_keys'] = self.motion.key_count()
+        summary['pmx_bytes'] = os.path.getsize(self.pmx)
+        summary['vmd_bytes'] = os.path.getsize(self.vmd)
+        if self.pmd:
+            summary['pmd_bytes'] = os.path.getsize(self.pmd)
+        return summary
+
+
+@contextlib.contextmanager
+def quiet():
+    # The vmd parser prints its progress, it is hidden to keep the output readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def time_runs(func, repeat):
+    runs = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, seed, repeat, pattern, overrides, work_dir):
+    results = {
+        'version': results_version,
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'scales': {},
+    }
+
+    for scale in scales:
+        directory = os.path.join(work_dir, scale)
+        os.makedirs(directory, exist_ok=True)
+        print('Generating ' + scale + '...')
+        files = Files(directory, scale, seed, overrides)
+        scale_results = {'model': files.summary(), 'benchmarks': {}}
+        results['scales'][scale] = scale_results
+
+        for name, setup in benchmarks:
+            if not fnmatch.fnmatch(name, pattern):
+                continue
+            with quiet():
+                func = setup(files)
+                if func is None:
+                    continue
+                runs = time_runs(func, repeat)
+            scale_results['benchmarks'][name] = {
+                'min': min(runs),
+                'median': float(np.median(runs)),
+                'runs': runs,
+            }
+            print('  ' + name.ljust(24) + format_time(min(runs)))
+
+    return results
+
+
+def format_time(seconds):
+    if seconds < 1:
+        return str(round(seconds * 1000, 1)) + 'ms'
+    return str(round(seconds, 2)) + 's'
+
+
+def compare(results, old_results, threshold):
+    """
+    Prints the change of every benchmark that is in both results and returns the regressions.
+    The minimum of the runs is compared, it is the least affected by other processes.
+    """
+    regressions = []
+    print('')
+    print('Compared to ' + str(old_results.get('commit')))
+    for scale, scale_results in results['scales'].items():
+        old_scale = old_results.get('scales', {}).get(scale)
+        if not old_scale:
+            continue
+        if old_scale.get('model') != scale_results['model']:
+            print('  ' + scale + ': the generated model differs, skipped')
+            continue
+        for name, result in scale_results['benchmarks'].items():
+            old = old_scale['benchmarks'].get(name)
+            if not old:
+                continue
+            ratio = result['min'] / old['min'] if old['min'] else 1
+            line = '  ' + (scale + ' ' + name).ljust(32) + format_time(old['min']).rjust(9) + ' -> ' + format_time(result['min']).rjust(9) + '  x' + str(round(ratio, 2))
+            if ratio > 1 + threshold:
+                line += '  SLOWER'
+                regressions.append((scale, name, ratio))
+            elif ratio < 1 / (1 + threshold):
+                line += '  faster'
+            print(line)
+    return regressions
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-s', '--scale', dest='scales', help='comma separated scales: ' + ', '.join(generators.scales.keys()), metavar='SCALES', default='tiny,small')
+    parser.add_option('-b', '--benchmark', dest='pattern', help='only run benchmarks matching this pattern', metavar='PATTERN', default='*')
+    parser.add_option('-r', '--repeat', dest='repeat', help='runs per benchmark', metavar='N', type='int', default=5)
+    parser.add_option('--seed', dest='seed', help='seed of the generated files', metavar='SEED', type='int', default=0)
+    parser.add_option('--vertices', dest='vertices', help='override the vertex count of all scales', metavar='N', type='int')
+    parser.add_option('--bones', dest='bones', help='override the bone count of all scales', metavar='N', type='int')
+    parser.add_option('--morphs', dest='morphs', help='override the morph count of all scales', metavar='N', type='int')
+    parser.add_option('--frames', dest='frames', help='override the motion length of all scales', metavar='N', type='int')
+    parser.add_option('-o', '--output', dest='output', help='write the results as json to this file', metavar='FILE')
+    parser.add_option('-c', '--compare', dest='compare', help='compare with the json results of an earlier run', metavar='FILE')
+    parser.add_option('-t', '--threshold', dest='threshold', help='slowdown that counts as regression, 0.2 = 20%', metavar='RATIO', type='float', default=0.2)
+    parser.add_option('-k', '--keep', dest='keep', help='keep the generated files in this directory', metavar='DIR')
+    (options, args) = parser.parse_args()
+
+    scales = [scale.strip() for scale in options.scales.split(',') if scale.strip()]
+    for scale in scales:
+        if scale not in generators.scales:
+            parser.error('unknown scale ' + scale)
+    overrides = {key: getattr(options, key) for key in ['vertices', 'bones', 'morphs', 'frames'] if getattr(options, key) is not None}
+
+    # The parsers log every bone and morph, that would be measured too
+    logging.disable(logging.WARNING)
+
+    work_dir = options.keep or tempfile.mkdtemp(prefix='cats_benchmark_')
+    try:
+        results = run(scales, options.seed, max(1, options.repeat), options.pattern, overrides, work_dir)
+    finally:
+        if not options.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, 'w', encoding='utf8') as file:
+            json.dump(results, file, indent=2)
+
+    if options.compare:
+        with open(options.compare, encoding='utf8') as file:
+            old_results = json.load(file)
+        if compare(results, old_results, options.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import sys
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import unittest
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from cats import downloader
+
+
+def make_zip():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as zip_ref:
+        zip_ref.writestr('cats/__init__.py', 'bl_info = {}\n')
+        zip_ref.writestr('cats/resources/dictionary.json', '{}' + ' ' * 200000)
+    return data.getvalue()
+
+
+class StandInServer(socketserver.ThreadingMixIn, HTTPServer):
+    # Serves self.content like Github, with range requests and an ETag.
+    # The first self.drops responses are cut off after self.drop_after bytes.
+    daemon_threads = True
+    content = b''
+    etag = '"1"'
+    drops = 0
+    drop_after = 0
+    requests = []
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.path != '/cats.zip':
+            self.send_error(404)
+            return
+
+        content = server.content
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == server.etag:
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */' + str(len(content)))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(len(content) - 1) + '/' + str(len(content)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.send_header('ETag', server.etag)
+        self.end_headers()
+
+        if server.drops:
+            server.drops -= 1
+            self.wfile.write(content[start:start + server.drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content[start:])
+
+
+class TestAddon(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        self.server.content = make_zip()
+        self.server.requests = []
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/cats.zip'
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_download_verified(self):
+        sha256 = hashlib.sha256(self.server.content).hexdigest()
+        file = downloader.download(self.url, self.cache_dir, sha256=sha256, retry_delay=0)
+        with open(file, 'rb') as f:
+            self.assertEqual(f.read(), self.server.content)
+
+    def test_download_resumed(self):
+        self.server.drops = 2
+        self.server.drop_after = 50000
+        file = downloader.download(self.url, self.cache_dir, retry_delay=0)
+        with open(file, 'rb') as f:
+            self.assertEqual(f.read(), self.server.content)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.requests[1].get('Range'), 'bytes=50000-')
+        self.assertEqual(self.server.requests[2].get('Range'), 'bytes=100000-')
+
+    def test_download_resumed_next_call(self):
+        self.server.drops = 1
+        self.server.drop_after = 50000
+        with self.assertRaises(downloader.DownloadError):
+            downloader.download(self.url, self.cache_dir, retries=0, retry_delay=0)
+        file = downloader.download(self.url, self.cache_dir, retries=0, retry_delay=0)
+        with open(file, 'rb') as f:
+            self.assertEqual(f.read(), self.server.content)
+        self.assertEqual(self.server.requests[1].get('Range'), 'bytes=50000-')
+
+    def test_download_restarted_if_changed(self):
+        self.server.drops = 1
+        self.server.drop_after = 50000
+        with self.assertRaises(downloader.DownloadError):
+            downloader.download(self.url, self.cache_dir, retries=0, retry_delay=0)
+        self.server.content = make_zip() + b'changed'
+        self.server.etag = '"2"'
+        file = downloader.download(self.url, self.cache_dir, retries=0, retry_delay=0)
+        with open(file, 'rb') as f:
+            self.assertEqual(f.read(), self.server.content)
+
+    def test_download_damaged(self):
+        with self.assertRaises(downloader.DownloadError):
+            downloader.download(self.url, self.cache_dir, sha256='0' * 64, retry_delay=0)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_download_missing(self):
+        with self.assertRaises(downloader.DownloadError):
+            downloader.download(self.url[:-4] + '.rar', self.cache_dir, retry_delay=0)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_download_cached(self):
+        file = downloader.download(self.url, self.cache_dir, cache_key='v1', retry_delay=0)
+        cached_file = downloader.download(self.url, self.cache_dir, cache_key='v1', retry_delay=0)
+        self.assertEqual(file, cached_file)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_prune_cache(self):
+        files = [downloader.download(self.url, self.cache_dir, cache_key='v' + str(i), retry_delay=0) for i in range(4)]
+        for i, file in enumerate(files):
+            os.utime(file, (1000 + i, 1000 + i))
+
+        downloader.prune_cache(self.cache_dir, keep=2, keep_file=files[0])
+        self.assertEqual([os.path.isfile(file) for file in files], [True, False, True, True])
+
+    def test_extract_and_swap(self):
+        file = downloader.download(self.url, self.cache_dir, retry_delay=0)
+        staging_dir = os.path.join(self.temp_dir, 'staging')
+        addon_dir = os.path.join(self.temp_dir, 'cats')
+        os.makedirs(addon_dir)
+        with open(os.path.join(addon_dir, 'old.py'), 'w') as f:
+            f.write('')
+
+        downloader.extract_zip(file, staging_dir)
+        downloader.swap_directories(os.path.join(staging_dir, 'cats'), addon_dir)
+        self.assertTrue(os.path.isfile(os.path.join(addon_dir, '__init__.py')))
+        self.assertFalse(os.path.isfile(os.path.join(addon_dir, 'old.py')))
+        self.assertFalse(os.path.exists(addon_dir + '.old'))
+
+    def test_extract_damaged(self):
+        file = os.path.join(self.temp_dir, 'damaged.zip')
+        with open(file, 'wb') as f:
+            f.write(self.server.content[:1000])
+        with self.assertRaises(downloader.DownloadError):
+            downloader.extract_zip(file, os.path.join(self.temp_dir, 'staging'))
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
@@ -0,0 +1,483 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Synthetic MMD models and motions for tests and benchmarks.
+# Everything is generated from a seed with numpy's RandomState, so the same seed and scale
+# always give byte identical files, on every machine and numpy version.
+# The mmd_tools parsers are loaded without bpy if Blender isn't available.
+
+import os
+import sys
+import types
+import struct
+import importlib
+import importlib.util
+
+import numpy as np
+
+extern_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'extern_tools')
+
+# Name = (Vertices, Bones, Morphs, Motion frames)
+scales = {
+    'tiny': (1000, 10, 0, 30),
+    'small': (10000, 100, 20, 300),
+    'medium': (100000, 400, 100, 1000),
+    'large': (300000, 1000, 250, 3000),
+    'huge': (1000000, 2000, 500, 6000),
+}
+
+# The first bones get the names real models use, so name based code paths are hit too
+standard_bones = ['全ての親', 'センター', '下半身', '上半身', '上半身2', '首', '頭', '左目', '右目', '両目',
+                  '左肩', '左腕', '左ひじ', '左手首', '右肩', '右腕', '右ひじ', '右手首',
+                  '左足', '左ひざ', '左足首', '右足', '右ひざ', '右足首']
+standard_morphs = ['あ', 'い', 'う', 'え', 'お', 'まばたき', '笑い', 'ウィンク', 'ウィンク右', 'にこり', '怒り', '困る']
+
+core = None
+
+
+def load_core():
+    """
+    Returns the mmd_tools_local.core package with pmx, pmd and vmd imported.
+    Outside of Blender the package __init__ can't be imported, so an empty package is registered instead.
+    """
+    global core
+    if core is not None:
+        return core
+
+    if extern_dir not in sys.path:
+        sys.path.append(extern_dir)
+    if importlib.util.find_spec('bpy') is None:
+        for name in ['mmd_tools_local', 'mmd_tools_local.core']:
+            if name not in sys.modules:
+                package = types.ModuleType(name)
+                package.__path__ = [os.path.join(extern_dir, *name.split('.'))]
+                sys.modules[name] = package
+
+    for name in ['pmx', 'pmd', 'vmd']:
+        importlib.import_module('mmd_tools_local.core.' + name)
+    core = sys.modules['mmd_tools_local.core']
+    return core
+
+
+class ModelDescription:
+    """
+    The armature and mesh of a synthetic model as plain numpy arrays.
+    The mesh is a bumpy grid wrapped around the bones, split into materials by rows.
+    The second half of the bones gets rigid bodies, chained together by joints.
+    """
+    def __init__(self, vertices=1000, bones=10, morphs=0, materials=None, seed=0):
+        rng = np.random.RandomState(seed)
+        self.seed = seed
+        self.name = 'Synthetic ' + str(vertices)
+
+        # Armature: a chain down the spine and random branches off it, parents always come first
+        bones = max(1, bones)
+        self.bone_names = [standard_bones[i] if i < len(standard_bones) else 'ボーン' + str(i) for i in range(bones)]
+        self.bone_parents = np.full(bones, -1, dtype=np.int32)
+        for i in range(1, bones):
+            self.bone_parents[i] = i - 1 if i < 8 else rng.randint(0, i)
+        offsets = rng.uniform(-0.5, 0.5, (bones, 3)).astype(np.float32)
+        offsets[:, 1] = np.abs(offsets[:, 1]) + 0.1
+        self.bone_locations = np.zeros((bones, 3), dtype=np.float32)
+        for i in range(bones):
+            parent = self.bone_parents[i]
+            self.bone_locations[i] = offsets[i] if parent < 0 else self.bone_locations[parent] + offsets[i]
+
+        # Mesh: a grid with cols*rows >= vertices, the last row is cut off to hit the exact count
+        cols = max(2, int(np.ceil(np.sqrt(vertices))))
+        rows = max(2, int(np.ceil(vertices / cols)))
+        vertices = max(vertices, cols * 2)
+        index = np.arange(vertices)
+        u = (index % cols) / (cols - 1)
+        v = (index // cols) / (rows - 1)
+        angle = u * 2 * np.pi
+        radius = 1 + rng.uniform(-0.05, 0.05, vertices)
+        self.co = np.column_stack((np.cos(angle) * radius, v * 20, np.sin(angle) * radius)).astype(np.float32)
+        self.normal = np.column_stack((np.cos(angle), np.zeros(vertices), np.sin(angle))).astype(np.float32)
+        self.uv = np.column_stack((u, 1 - v)).astype(np.float32)
+        self.edge_scale = np.ones(vertices, dtype=np.float32)
+
+        corners = (np.arange(rows - 1)[:, None] * cols + np.arange(cols - 1)).ravel()
+        quads = np.column_stack((corners, corners + 1, corners + cols, corners + cols + 1))
+        quads = quads[quads[:, 3] < vertices]
+        self.faces = np.concatenate((quads[:, [0, 2, 1]], quads[:, [1, 2, 3]]))
+        self.faces = self.faces[np.argsort(self.faces.min(axis=1), kind='stable')].astype(np.int32)
+
+        # Materials own consecutive face ranges, like in real files
+        if materials is None:
+            materials = int(np.clip(vertices // 20000, 1, 30))
+        bounds = np.linspace(0, len(self.faces), materials + 1).astype(np.int64)
+        self.material_names = ['材質' + str(i) for i in range(materials)]
+        self.material_face_counts = np.diff(bounds)
+
+        # Every material has its own texture, the last texture is a sphere map they all share
+        self.texture_paths = ['tex' + str(i) + '.png' for i in range(materials)] + ['sphere.spa']
+
+        # Weights: mostly BDEF2 with some BDEF1, BDEF4 and SDEF, to the closest bones by height
+        self.weight_types = rng.choice(4, vertices, p=[0.2, 0.6, 0.15, 0.05]).astype(np.uint8)
+        order = np.argsort(self.bone_locations[:, 1], kind='stable')
+        nearest = np.searchsorted(self.bone_locations[order, 1], self.co[:, 1] / 20 * self.bone_locations[:, 1].max())
+        nearest = np.clip(nearest, 0, bones - 1)
+        self.weight_bones = np.column_stack([order[np.clip(nearest - i, 0, bones - 1)] for i in range(4)]).astype(np.int32)
+        weights = rng.uniform(0.1, 1, (vertices, 4)).astype(np.float32)
+        self.weights = weights / weights.sum(axis=1)[:, None]
+        self.sdef = rng.uniform(-1, 1, (vertices, 9)).astype(np.float32)
+
+        # Vertex morphs move a random window of vertices, bigger models get bigger windows
+        self.morph_names = [standard_morphs[i] if i < len(standard_morphs) else 'モーフ' + str(i) for i in range(morphs)]
+        self.morph_indices = []
+        self.morph_offsets = []
+        window = int(np.clip(vertices // 20, 1, 5000))
+        for i in range(morphs):
+            start = rng.randint(0, vertices - window + 1)
+            self.morph_indices.append(np.arange(start, start + window, dtype=np.int32))
+            self.morph_offsets.append(rng.uniform(-0.01, 0.01, (window, 3)).astype(np.float32))
+
+        # Rigid bodies are generated last, so that they don't change the random values of the rest
+        rigids = bones // 2
+        self.rigid_names = ['剛体' + str(i) for i in range(rigids)]
+        self.rigid_bones = np.arange(bones - rigids, bones, dtype=np.int32)
+        self.rigid_shapes = rng.randint(0, 3, rigids).astype(np.uint8)
+        self.rigid_sizes = rng.uniform(0.05, 0.5, (rigids, 3)).astype(np.float32)
+        self.rigid_groups = rng.randint(0, 16, rigids).astype(np.uint8)
+        self.rigid_modes = rng.choice(3, rigids, p=[0.2, 0.6, 0.2]).astype(np.uint8)
+        self.joint_names = ['ジョイント' + str(i) for i in range(max(0, rigids - 1))]
+        self.joint_rigids = np.column_stack((np.arange(rigids - 1), np.arange(1, rigids))).astype(np.int32).reshape(-1, 2)
+
+    @property
+    def vertex_count(self):
+        return len(self.co)
+
+    @property
+    def bone_count(self):
+        return len(self.bone_names)
+
+    @property
+    def morph_count(self):
+        return len(self.morph_names)
+
+    @property
+    def rigid_count(self):
+        return len(self.rigid_names)
+
+    @property
+    def joint_count(self):
+        return len(self.joint_names)
+
+    def summary(self):
+        return {
+            'seed': self.seed,
+            'vertices': self.vertex_count,
+            'faces': len(self.faces),
+            'materials': len(self.material_names),
+            'textures': len(self.texture_paths),
+            'bones': self.bone_count,
+            'morphs': self.morph_count,
+            'morph_offsets': sum(len(i) for i in self.morph_indices),
+            'rigids': self.rigid_count,
+            'joints': self.joint_count,
+        }
+
+
+class MotionDescription:
+    """
+    Bone and morph keyframes for a model description, every bone and morph gets keys at random frames.
+    """
+    def __init__(self, model, frames=300, seed=0):
+        rng = np.random.RandomState(seed)
+        self.seed = seed
+        self.model_name = model.name
+        self.frames = frames
+
+        self.bone_keys = []  # (Name, frame numbers, locations, rotations)
+        for name in model.bone_names:
+            count = max(2, frames // 10)
+            numbers = np.sort(rng.choice(frames + 1, min(count, frames + 1), replace=False)).astype(np.uint32)
+            locations = rng.uniform(-1, 1, (len(numbers), 3)).astype(np.float32)
+            rotations = rng.normal(size=(len(numbers), 4)).astype(np.float32)
+            rotations /= np.linalg.norm(rotations, axis=1)[:, None]
+            self.bone_keys.append((name, numbers, locations, rotations))
+
+        self.morph_keys = []  # (Name, frame numbers, weights)
+        for name in model.morph_names:
+            count = max(2, frames // 20)
+            numbers = np.sort(rng.choice(frames + 1, min(count, frames + 1), replace=False)).astype(np.uint32)
+            self.morph_keys.append((name, numbers, rng.uniform(0, 1, len(numbers)).astype(np.float32)))
+
+        self.interp = [20, 20, 0, 0, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107] * 4
+
+    def key_count(self):
+        return sum(len(i[1]) for i in self.bone_keys) + sum(len(i[1]) for i in self.morph_keys)
+
+
+def describe(scale='tiny', seed=0, **overrides):
+    # Returns the model and motion description of a named scale, single values can be overridden
+    vertices, bones, morphs, frames = scales[scale]
+    model = ModelDescription(vertices=overrides.get('vertices', vertices), bones=overrides.get('bones', bones),
+                             morphs=overrides.get('morphs', morphs), seed=seed)
+    motion = MotionDescription(model, frames=overrides.get('frames', frames), seed=seed)
+    return model, motion
+
+
+def build_pmx(desc, directory=''):
+    # The texture paths are relative to directory, where the model is going to be saved
+    pmx = load_core().pmx
+    model = pmx.Model()
+    model.name = desc.name
+    model.name_e = desc.name
+    model.comment = 'Generated with seed ' + str(desc.seed)
+    model.comment_e = model.comment
+
+    co = desc.co.tolist()
+    normal = desc.normal.tolist()
+    uv = desc.uv.tolist()
+    weight_bones = desc.weight_bones.tolist()
+    weights = desc.weights.tolist()
+    sdef = desc.sdef.tolist()
+    for i, weight_type in enumerate(desc.weight_types.tolist()):
+        vertex = pmx.Vertex()
+        vertex.co = co[i]
+        vertex.normal = normal[i]
+        vertex.uv = uv[i]
+        vertex.weight = pmx.BoneWeight()
+        vertex.weight.type = weight_type
+        if weight_type == pmx.BoneWeight.BDEF1:
+            vertex.weight.bones = weight_bones[i][:1]
+        elif weight_type == pmx.BoneWeight.BDEF2:
+            vertex.weight.bones = weight_bones[i][:2]
+            vertex.weight.weights = weights[i][:1]
+        elif weight_type == pmx.BoneWeight.BDEF4:
+            vertex.weight.bones = weight_bones[i]
+            vertex.weight.weights = weights[i]
+        else:
+            vertex.weight.bones = weight_bones[i][:2]
+            vertex.weight.weights = pmx.BoneWeightSDEF(weights[i][0], sdef[i][0:3], sdef[i][3:6], sdef[i][6:9])
+        model.vertices.append(vertex)
+
+    model.faces = [tuple(f) for f in desc.faces.tolist()]
+
+    for path in desc.texture_paths:
+        texture = pmx.Texture()
+        texture.path = os.path.join(directory, path)
+        model.textures.append(texture)
+
+    for i, (name, face_count) in enumerate(zip(desc.material_names, desc.material_face_counts.tolist())):
+        material = pmx.Material()
+        material.name = name
+        material.name_e = name
+        material.diffuse = [0.8, 0.8, 0.8, 1.0]
+        material.specular = [0.0, 0.0, 0.0]
+        material.ambient = [0.4, 0.4, 0.4]
+        material.edge_color = [0.0, 0.0, 0.0, 1.0]
+        material.texture = i
+        material.sphere_texture = len(desc.texture_paths) - 1
+        material.sphere_texture_mode = pmx.Material.SPHERE_MODE_ADD
+        material.vertex_count = face_count * 3
+        model.materials.append(material)
+
+    locations = desc.bone_locations.tolist()
+    for i, (name, parent) in enumerate(zip(desc.bone_names, desc.bone_parents.tolist())):
+        bone = pmx.Bone()
+        bone.name = name
+        bone.name_e = 'bone' + str(i)
+        bone.location = locations[i]
+        bone.parent = parent if parent >= 0 else None
+        bone.displayConnection = [0.0, 0.1, 0.0]
+        model.bones.append(bone)
+        model.display[0].data.append((0, i))
+
+    for name, indices, offsets in zip(desc.morph_names, desc.morph_indices, desc.morph_offsets):
+        morph = pmx.VertexMorph(name, name, pmx.Morph.CATEGORY_OHTER)
+        for index, offset in zip(indices.tolist(), offsets.tolist()):
+            morph_offset = pmx.VertexMorphOffset()
+            morph_offset.index = index
+            morph_offset.offset = offset
+            morph.offsets.append(morph_offset)
+        model.morphs.append(morph)
+        model.display[1].data.append((1, len(model.morphs) - 1))
+
+    sizes = desc.rigid_sizes.tolist()
+    rigid_bones = desc.rigid_bones.tolist()
+    for i, name in enumerate(desc.rigid_names):
+        rigid = pmx.Rigid()
+        rigid.name = name
+        rigid.name_e = 'rigid' + str(i)
+        rigid.bone = rigid_bones[i]
+        rigid.collision_group_number = int(desc.rigid_groups[i])
+        rigid.collision_group_mask = 0
+        rigid.type = int(desc.rigid_shapes[i])
+        rigid.size = sizes[i]
+        rigid.location = locations[rigid_bones[i]]
+        rigid.rotation = [0.0, 0.0, 0.0]
+        rigid.velocity_attenuation = 0.5
+        rigid.rotation_attenuation = 0.5
+        rigid.bounce = 0.0
+        rigid.friction = 0.5
+        rigid.mode = int(desc.rigid_modes[i])
+        model.rigids.append(rigid)
+
+    for i, (name, (src, dest)) in enumerate(zip(desc.joint_names, desc.joint_rigids.tolist())):
+        joint = pmx.Joint()
+        joint.name = name
+        joint.name_e = 'joint' + str(i)
+        joint.src_rigid = src
+        joint.dest_rigid = dest
+        joint.location = locations[rigid_bones[dest]]
+        joint.rotation = [0.0, 0.0, 0.0]
+        joint.minimum_location = [0.0, 0.0, 0.0]
+        joint.maximum_location = [0.0, 0.0, 0.0]
+        joint.minimum_rotation = [-0.2, -0.2, -0.2]
+        joint.maximum_rotation = [0.2, 0.2, 0.2]
+        joint.spring_constant = [0.0, 0.0, 0.0]
+        joint.spring_rotation_constant = [10.0, 10.0, 10.0]
+        model.joints.append(joint)
+
+    return model
+
+
+def write_pmx(path, desc):
+    load_core().pmx.save(path, build_pmx(desc, os.path.dirname(path)))
+
+
+def write_pmd(path, desc):
+    """
+    Writes the description as a PMD file. There is no PMD exporter, so the format is written here directly.
+    PMD only has 16 bit vertex and bone indices, so it is limited to 65535 vertices and bones.
+    """
+    if desc.vertex_count > 0xffff or desc.bone_count >= 0xffff:
+        raise ValueError('PMD files are limited to 65535 vertices and bones')
+
+    def pmd_str(string, size):
+        return struct.pack('<' + str(size) + 's', string.encode('shift_jis', errors='replace')[:size - 1])
+
+    with open(path, 'wb') as file:
+        file.write(b'Pmd' + struct.pack('<f', 1.0))
+        file.write(pmd_str(desc.name, 20) + pmd_str('Generated with seed ' + str(desc.seed), 256))
+
+        # Bone weights of PMD vertices are always two bones and a percentage
+        vertices = np.zeros(desc.vertex_count, dtype=[('co', '<f4', (3,)), ('normal', '<f4', (3,)), ('uv', '<f4', (2,)),
+                                                      ('bones', '<u2', (2,)), ('weight', 'u1'), ('edge', 'u1')])
+        vertices['co'] = desc.co
+        vertices['normal'] = desc.normal
+        vertices['uv'] = desc.uv
+        vertices['bones'] = desc.weight_bones[:, :2]
+        vertices['weight'] = np.round(desc.weights[:, 0] / desc.weights[:, :2].sum(axis=1) * 100)
+        file.write(struct.pack('<I', len(vertices)))
+        file.write(vertices.tobytes())
+
+        file.write(struct.pack('<I', desc.faces.size))
+        file.write(desc.faces[:, ::-1].astype('<u2').tobytes())
+
+        file.write(struct.pack('<I', len(desc.material_names)))
+        for i, face_count in enumerate(desc.material_face_counts.tolist()):
+            file.write(struct.pack('<4ff3f3fbBI', 0.8, 0.8, 0.8, 1.0, 5.0, 0, 0, 0, 0.4, 0.4, 0.4, -1, 1, face_count * 3))
+            file.write(pmd_str(desc.texture_paths[i] + '*' + desc.texture_paths[-1], 20))
+
+        file.write(struct.pack('<H', desc.bone_count))
+        locations = desc.bone_locations.tolist()
+        for i, (name, parent) in enumerate(zip(desc.bone_names, desc.bone_parents.tolist())):
+            file.write(pmd_str(name, 20))
+            file.write(struct.pack('<HHBH3f', parent & 0xffff, 0xffff, 1, 0, *locations[i]))
+
+        file.write(struct.pack('<H', 0))  # IKs
+
+        # The first morph is the base morph with the positions of all morphed vertices,
+        # the others store indices into the base morph
+        morphed = np.unique(np.concatenate(desc.morph_indices)) if desc.morph_indices else np.zeros(0, dtype=np.int32)
+        file.write(struct.pack('<H', desc.morph_count + 1 if desc.morph_count else 0))
+        if desc.morph_count:
+            base = np.zeros(len(morphed), dtype=[('index', '<u4'), ('offset', '<f4', (3,))])
+            base['index'] = morphed
+            base['offset'] = desc.co[morphed]
+            file.write(pmd_str('base', 20) + struct.pack('<IB', len(base), 0) + base.tobytes())
+            for name, indices, offsets in zip(desc.morph_names, desc.morph_indices, desc.morph_offsets):
+                data = np.zeros(len(indices), dtype=base.dtype)
+                data['index'] = np.searchsorted(morphed, indices)
+                data['offset'] = offsets
+                file.write(pmd_str(name, 20) + struct.pack('<IB', len(data), 4) + data.tobytes())
+
+        # Display items: morphs in the facial frame, all bones in one frame
+        facial_count = min(desc.morph_count, 255)
+        file.write(struct.pack('<B', facial_count))
+        file.write(struct.pack('<' + str(facial_count) + 'H', *range(1, facial_count + 1)))
+        file.write(struct.pack('<B', 1) + pmd_str('Bones', 50))
+        file.write(struct.pack('<I', desc.bone_count))
+        for i in range(desc.bone_count):
+            file.write(struct.pack('<HB', i, 1))
+
+        # English names
+        file.write(struct.pack('<B', 1))
+        file.write(pmd_str(desc.name, 20) + pmd_str('', 256))
+        for i in range(desc.bone_count):
+            file.write(pmd_str('bone' + str(i), 20))
+        for i in range(desc.morph_count):
+            file.write(pmd_str('morph' + str(i), 20))
+        file.write(pmd_str('Bones', 50))
+
+        for i in range(10):
+            file.write(pmd_str('toon' + str(i + 1).zfill(2) + '.bmp', 100))
+
+        # Rigid bodies and joints store their position relative to the bone
+        file.write(struct.pack('<I', desc.rigid_count))
+        sizes = desc.rigid_sizes.tolist()
+        for i, name in enumerate(desc.rigid_names):
+            file.write(pmd_str(name, 20))
+            file.write(struct.pack('<HBHB3f3f3f5fB', desc.rigid_bones[i], desc.rigid_groups[i], 0xffff, desc.rigid_shapes[i],
+                                   *sizes[i], 0, 0, 0, 0, 0, 0, 1.0, 0.5, 0.5, 0.0, 0.5, desc.rigid_modes[i]))
+
+        file.write(struct.pack('<I', desc.joint_count))
+        for name, (src, dest) in zip(desc.joint_names, desc.joint_rigids.tolist()):
+            file.write(pmd_str(name, 20))
+            file.write(struct.pack('<II24f', src, dest, *[0.0] * 12, *[-0.2] * 3, *[0.2] * 3, *[0.0] * 3, *[10.0] * 3))
+
+
+def build_vmd(desc):
+    vmd = load_core().vmd
+    vmd_file = vmd.File()
+    vmd_file.header = vmd.Header()
+    vmd_file.header.model_name = desc.model_name
+    vmd_file.boneAnimation = vmd.BoneAnimation()
+    vmd_file.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+
+    for name, numbers, locations, rotations in desc.bone_keys:
+        keys = vmd_file.boneAnimation[name]
+        for number, location, rotation in zip(numbers.tolist(), locations.tolist(), rotations.tolist()):
+            key = vmd.BoneFrameKey()
+            key.frame_number = number
+            key.location = location
+            key.rotation = rotation
+            key.interp = desc.interp
+            keys.append(key)
+
+    for name, numbers, weights in desc.morph_keys:
+        keys = vmd_file.shapeKeyAnimation[name]
+        for number, weight in zip(numbers.tolist(), weights.tolist()):
+            key = vmd.ShapeKeyFrameKey()
+            key.frame_number = number
+            key.weight = weight
+            keys.append(key)
+
+    return vmd_file
+
+
+def write_vmd(path, desc):
+    build_vmd(desc).save(filepath=path)
@@ -0,0 +1,94 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import bpy
+import unittest
+
+from cats.tools import common as Common
+from cats.tools import importer as Importer
+
+
+def add_mesh_object(name):
+    # Two quads with different materials, a wire chain on the second quad, a loose wire edge and a loose vertex
+    verts = [(x, y, 0) for x, y in [(0, 0), (1, 0), (1, 1), (0, 1), (3, 0), (4, 0), (4, 1), (3, 1), (5, 0), (6, 0), (8, 0), (9, 0), (10, 0)]]
+    edges = [(5, 8), (8, 9), (10, 11)]
+    faces = [(0, 1, 2, 3), (4, 5, 6, 7)]
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(verts, edges, faces)
+    mesh.materials.append(bpy.data.materials.new(name + '_A'))
+    mesh.materials.append(bpy.data.materials.new(name + '_B'))
+    mesh.polygons[1].material_index = 1
+    mesh.update()
+
+    obj = bpy.data.objects.new(name, mesh)
+    link_object(obj)
+    return obj
+
+
+def link_object(obj):
+    if Common.version_2_79_or_older():
+        bpy.context.scene.objects.link(obj)
+    else:
+        bpy.context.scene.collection.objects.link(obj)
+
+
+class TestAddon(unittest.TestCase):
+    def check_split(self, objects):
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(sum(len(obj.data.vertices) for obj in objects), 13)
+        self.assertEqual(sum(len(obj.data.edges) for obj in objects), 11)
+        self.assertEqual(sum(len(obj.data.polygons) for obj in objects), 2)
+
+        # The wire chain stays with the second quad, the other loose geometry stays in the original object
+        self.assertEqual(len(objects[0].data.vertices), 7)
+        self.assertEqual(len(objects[1].data.vertices), 6)
+
+    def test_split_by_material_keeps_loose_geometry(self):
+        obj = add_mesh_object('SplitMaterial')
+        self.check_split(Common.split_mesh_data(obj, by_material=True))
+
+    def test_split_by_loose_parts_keeps_loose_geometry(self):
+        obj = add_mesh_object('SplitLoose')
+        self.check_split(Common.split_mesh_data(obj, by_material=False, by_loose_parts=True))
+
+    def test_extreme_shape_key_offsets(self):
+        # A 2 unit tall quad, the size of a small avatar. Pushing a vertex 100 units away is broken, moving it a bit isn't
+        mesh = bpy.data.meshes.new('ShapeDelta')
+        mesh.from_pydata([(0, 0, 0), (0.5, 0, 0), (0.5, 0, 2), (0, 0, 2)], [], [(0, 1, 2, 3)])
+        mesh.update()
+        obj = bpy.data.objects.new('ShapeDelta', mesh)
+        link_object(obj)
+
+        obj.shape_key_add(name='Basis')
+        for name, offset in [('Smile', 0.5), ('Broken', 100)]:
+            shapekey = obj.shape_key_add(name=name)
+            shapekey.data[0].co = (0, offset, 0)
+
+        broken = [(shapekey, issue) for mesh_name, shapekey, issue in Importer.validate_meshes([obj])['broken_shapes']]
+        self.assertEqual(broken, [('Broken', 'extreme values')])
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
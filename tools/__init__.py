@@ -7,6 +7,7 @@ if "bpy" not in locals():
     from . import armature_manual
     from . import armature_custom
     from . import atlas
+    from . import batch
     from . import bonemerge
     from . import common
     from . import copy_protection
@@ -19,6 +20,7 @@ if "bpy" not in locals():
     from . import rootbone
     from . import settings
     from . import shapekey
+    from . import startup
     from . import supporter
     from . import translate
     from . import viseme
@@ -31,6 +33,7 @@ else:
     importlib.reload(armature_manual)
     importlib.reload(armature_custom)
     importlib.reload(atlas)
+    importlib.reload(batch)
     importlib.reload(bonemerge)
     importlib.reload(common)
     importlib.reload(copy_protection)
@@ -43,6 +46,7 @@ else:
     importlib.reload(rootbone)
     importlib.reload(settings)
     importlib.reload(shapekey)
+    importlib.reload(startup)
     importlib.reload(supporter)
     importlib.reload(translate)
     importlib.reload(viseme)
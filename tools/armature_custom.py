@@ -23,9 +23,11 @@
 # Code author: Hotox
 # Repo: https://github.com/michaeldegroot/cats-blender-plugin
 
+import re
 import bpy
 import copy
 import webbrowser
+from mathutils.kdtree import KDTree
 
 from . import common as Common
 from . import armature_bones as Bones
@@ -200,6 +202,60 @@ class CustomModelTutorialButton(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def match_bones(armature, tolerance=0.0001, ignore=None):
+    """
+    Finds the bones of a joined armature that are at the same position as a base bone, using a KD-tree over the bone heads.
+    Merge bones are the ones ending with '.merge'. A base bone within the tolerance only matches if the names
+    are the same when ignoring case, separators and number suffixes. Ties are broken by name similarity,
+    parent consistency and distance, and every base bone gets matched at most once.
+
+    :param armature: the armature in edit mode
+    :param tolerance: the max distance between the bone heads
+    :param ignore: dict of already matched merge bone names: base bone names
+    :return: dict of merge bone name: base bone name
+    """
+    ignore = ignore or {}
+    used_base_bones = set(ignore.values())
+    edit_bones = armature.data.edit_bones
+    base_bones = [bone for bone in edit_bones if not bone.name.endswith('.merge') and bone.name not in used_base_bones]
+    merge_bones = [bone for bone in edit_bones if bone.name.endswith('.merge') and bone.name not in ignore]
+    if not base_bones or not merge_bones:
+        return {}
+
+    tree = KDTree(len(base_bones))
+    for i, bone in enumerate(base_bones):
+        tree.insert(bone.head, i)
+    tree.balance()
+
+    def simplify(name):
+        name = name.replace('.merge', '')
+        name = re.sub(r'\.\d{3}$', '', name)
+        return re.sub(r'[^a-z0-9]', '', name.lower())
+
+    # Score every candidate pair, better matches get merged first
+    candidates = []
+    for bone in merge_bones:
+        name = bone.name[:-len('.merge')]
+        parent_name = simplify(bone.parent.name) if bone.parent else ''
+        for _, index, dist in tree.find_range(bone.head, tolerance):
+            base_bone = base_bones[index]
+            if base_bone.name == name:
+                name_score = 2
+            elif simplify(base_bone.name) == simplify(name):
+                name_score = 1
+            else:
+                continue
+            parent_score = int(parent_name == (simplify(base_bone.parent.name) if base_bone.parent else ''))
+            candidates.append((name_score, parent_score, -dist, bone.name, base_bone.name))
+
+    matches = {}
+    for _, _, _, bone_name, base_bone_name in sorted(candidates, reverse=True):
+        if bone_name not in matches and base_bone_name not in used_base_bones:
+            matches[bone_name] = base_bone_name
+            used_base_bones.add(base_bone_name)
+    return matches
+
+
 def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_name=None, merge_same_bones=False):
     tolerance = 0.00008726647  # around 0.005 degrees
     base_armature = Common.get_objects()[base_armature_name]
@@ -353,33 +409,22 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
     Common.set_active(armature)
     Common.switch('EDIT')
 
-    # Reparent all bones
+    # Find the bones of the merge armature that get merged into bones of the base armature
+    edit_bones = armature.data.edit_bones
     if merge_same_bones:
-        bones_to_merge = []
-        for bone in armature.data.edit_bones:
-            if bone.name.endswith('.merge'):
-                new_bone = armature.data.edit_bones.get(bone.name.replace('.merge', ''))
-                if new_bone:
-                    bone.parent = new_bone
-                    bones_to_merge.append(new_bone.name)
+        bones_to_merge = {bone.name: bone.name[:-len('.merge')] for bone in edit_bones
+                          if bone.name.endswith('.merge') and bone.name[:-len('.merge')] in edit_bones}
     else:
         # Merge base bones
-        for bone_name in bones_to_merge:
-            old = bone_name + '.merge'
-            new = bone_name
-            if old in armature.data.edit_bones and new in armature.data.edit_bones:
-                armature.data.edit_bones.get(old).parent = armature.data.edit_bones.get(new)
-
-        # Merge all bones that have the exact same position and name
-        for bone in armature.data.edit_bones:
-            if bone.name.endswith('.merge'):
-                new_bone = armature.data.edit_bones.get(bone.name.replace('.merge', ''))
-                if new_bone and new_bone.name not in bones_to_merge \
-                        and round(bone.head[0], 4) == round(new_bone.head[0], 4)\
-                        and round(bone.head[1], 4) == round(new_bone.head[1], 4)\
-                        and round(bone.head[2], 4) == round(new_bone.head[2], 4):
-                    bone.parent = new_bone
-                    bones_to_merge.append(new_bone.name)
+        bones_to_merge = {bone_name + '.merge': bone_name for bone_name in bones_to_merge
+                          if bone_name + '.merge' in edit_bones and bone_name in edit_bones}
+
+        # Merge all bones that have the same position and a matching name
+        bones_to_merge.update(match_bones(armature, ignore=bones_to_merge))
+
+    # Reparent all bones
+    for bone_merge, bone_base in bones_to_merge.items():
+        edit_bones.get(bone_merge).parent = edit_bones.get(bone_base)
 
     # Remove all unused bones, constraints and vertex groups
     Common.set_default_stage()
@@ -393,30 +438,15 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
 
     # Merge bones into existing bones
     if not mesh_only:
-        to_delete = []
-        for bone_name in bones_to_merge:
-            bone_base = bone_name
-            bone_merge = bone_name + '.merge'
-
-            for mesh_merged in meshes_merged:
-                Common.set_active(mesh_merged)
-                vg_base = mesh_merged.vertex_groups.get(bone_base)
-                vg_merge = mesh_merged.vertex_groups.get(bone_merge)
-
-                if not vg_base:
-                    mesh_merged.vertex_groups.new(name=bone_base)
-                if not vg_merge:
-                    mesh_merged.vertex_groups.new(name=bone_merge)
-
-                Common.mix_weights(mesh_merged, bone_merge, bone_base)
-            to_delete.append(bone_merge)
+        for mesh_merged in meshes_merged:
+            Common.merge_vertex_groups(mesh_merged, bones_to_merge)
 
         Common.set_active(armature)
         Common.switch('EDIT')
 
-        for bone_name in to_delete:
-            bone = armature.data.edit_bones.get(bone_name)
-            bone_base = armature.data.edit_bones.get(bone_name.replace('.merge', ''))
+        for bone_merge, bone_base in bones_to_merge.items():
+            bone = armature.data.edit_bones.get(bone_merge)
+            bone_base = armature.data.edit_bones.get(bone_base)
             if bone and bone_base:
                 armature.data.edit_bones.remove(bone)
 
@@ -0,0 +1,252 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The stages of a batch conversion. This runs inside of a background Blender process
+# started by batch.py in the addon folder, with one model per process.
+# Each stage sets the scene properties of its options and runs the same operators as the buttons.
+
+import os
+import bpy
+import json
+import time
+import traceback
+from collections import OrderedDict
+
+from . import common as Common
+from . import importer as Importer
+from . import fbx_patch as Fbx_patch
+from . import startup
+
+stages = OrderedDict()  # Stage name = Function(job, entry, stage_report)
+
+
+class BatchError(Exception):
+    pass
+
+
+def stage(name):
+    def decorator(func):
+        stages[name] = func
+        return func
+    return decorator
+
+
+def run_job(job_file):
+    with open(job_file, encoding='utf8') as file:
+        job = json.load(file)
+
+    report = OrderedDict()
+    report['model'] = job.get('model')
+    report['status'] = 'ok'
+    report['seconds'] = 0
+    report['setup_seconds'] = 0
+    report['warnings'] = []
+    report['outputs'] = []
+    report['stages'] = []
+    start = time.perf_counter()
+
+    # Batch workers never draw anything, so only the dictionary and mmd_tools are loaded.
+    # The dictionary was already compiled by the preparation job and is only mapped here
+    startup.discard(['icons', 'supporters'])
+    startup.run_deferred()
+    apply_options(job.get('settings', {}), report['warnings'], strict=False)
+    report['setup_seconds'] = time.perf_counter() - start
+
+    failed = False
+    for entry in job.get('stages', []):
+        name = entry['stage']
+        options = entry.get('options', {})
+
+        stage_report = OrderedDict()
+        stage_report['stage'] = name
+        stage_report['status'] = 'skipped'
+        stage_report['seconds'] = 0
+        stage_report['warnings'] = []
+        report['stages'].append(stage_report)
+        if failed:
+            continue
+
+        print('\n### BATCH STAGE:', name)
+        stage_start = time.perf_counter()
+        Common.collected_errors = stage_report['warnings']
+        try:
+            apply_options(options, stage_report['warnings'], strict=True)
+            outputs = stages[name](job, entry, stage_report)
+            report['outputs'] += outputs or []
+            stage_report['status'] = 'ok'
+        except Exception as e:
+            traceback.print_exc()
+            stage_report['status'] = 'failed'
+            stage_report['error'] = ' '.join(str(e).split()) or e.__class__.__name__
+            if not entry.get('optional'):
+                failed = True
+                report['status'] = 'failed'
+        finally:
+            Common.collected_errors = None
+            stage_report['seconds'] = time.perf_counter() - stage_start
+
+    report['seconds'] = time.perf_counter() - start
+    report['warnings'] += [stage_report['stage'] + ': ' + warning for stage_report in report['stages'] for warning in stage_report['warnings']]
+
+    with open(job['report'], 'w', encoding='utf8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=4)
+    return report
+
+
+def apply_options(options, warnings, strict):
+    # Options are scene properties, like max_tris for decimation or mouth_a for visemes
+    scene = bpy.context.scene
+    for key, value in options.items():
+        if not hasattr(scene, key):
+            if strict:
+                raise BatchError('Unknown option "' + key + '"')
+            warnings.append('Unknown setting "' + key + '"')
+            continue
+        try:
+            setattr(scene, key, value)
+        except (TypeError, ValueError) as e:
+            if strict:
+                raise BatchError('Invalid value for "' + key + '": ' + str(e))
+            warnings.append('Invalid value for setting "' + key + '": ' + str(e))
+
+
+def check_result(result, name):
+    if 'FINISHED' not in result:
+        raise BatchError(name + ' was cancelled')
+
+
+def choose_default(prop, options, choices_func):
+    # Uses the first suggested choice for properties that are not set by the recipe
+    if prop in options:
+        return True
+    choices = choices_func(None, bpy.context)
+    if not choices:
+        return False
+    setattr(bpy.context.scene, prop, choices[0][0])
+    return True
+
+
+def get_tris_count():
+    return sum(len(mesh.data.polygons) for mesh in Common.get_meshes_objects(check=False))
+
+
+@stage('prepare')
+def prepare(job, entry, stage_report):
+    # Runs once before the models, so that the dictionary gets compiled only once for all workers
+    from . import translate as Translate
+    Translate.ensure_translations()
+    stage_report['dictionary'] = len(Translate.dictionary)
+
+
+@stage('import')
+def import_model(job, entry, stage_report):
+    path = job['model']
+    result = bpy.ops.cats_importer.import_any_model(directory=os.path.dirname(path), files=[{'name': os.path.basename(path)}])
+    check_result(result, 'Import')
+    if not Common.get_armature_objects():
+        raise BatchError('No armature was imported')
+    stage_report['meshes'] = len(Common.get_meshes_objects(check=False))
+    stage_report['tris'] = get_tris_count()
+
+
+@stage('fix_model')
+def fix_model(job, entry, stage_report):
+    check_result(bpy.ops.cats_armature.fix(), 'Fix Model')
+
+
+@stage('translate')
+def translate(job, entry, stage_report):
+    check_result(bpy.ops.cats_translate.all(), 'Translate')
+
+
+@stage('visemes')
+def visemes(job, entry, stage_report):
+    options = entry.get('options', {})
+    Common.reset_context_scenes()
+    apply_options(options, stage_report['warnings'], strict=True)  # The recipe wins over the suggested mesh
+    for prop, choices_func in [('mouth_a', Common.get_shapekeys_mouth_ah),
+                               ('mouth_o', Common.get_shapekeys_mouth_oh),
+                               ('mouth_ch', Common.get_shapekeys_mouth_ch)]:
+        if not choose_default(prop, options, choices_func):
+            raise BatchError('The mesh "' + bpy.context.scene.mesh_name_viseme + '" has no shape keys')
+    check_result(bpy.ops.cats_viseme.create(), 'Create Visemes')
+
+
+@stage('eye_tracking')
+def eye_tracking(job, entry, stage_report):
+    options = entry.get('options', {})
+    scene = bpy.context.scene
+    Common.reset_context_scenes()
+    apply_options(options, stage_report['warnings'], strict=True)  # The recipe wins over the suggested bones and mesh
+    if not scene.disable_eye_blinking:
+        for prop, choices_func in [('wink_left', Common.get_shapekeys_eye_blink_l),
+                                   ('wink_right', Common.get_shapekeys_eye_blink_r),
+                                   ('lowerlid_left', Common.get_shapekeys_eye_low_l),
+                                   ('lowerlid_right', Common.get_shapekeys_eye_low_r)]:
+            if not choose_default(prop, options, choices_func):
+                stage_report['warnings'].append('The mesh "' + scene.mesh_name_eye + '" has no shape keys, eye blinking is disabled')
+                scene.disable_eye_blinking = True
+                break
+    check_result(bpy.ops.cats_eyes.create_eye_tracking(), 'Create Eye Tracking')
+
+
+@stage('decimate')
+def decimate(job, entry, stage_report):
+    stage_report['tris_before'] = get_tris_count()
+    check_result(bpy.ops.cats_decimation.auto_decimate(), 'Decimation')
+    stage_report['tris_after'] = get_tris_count()
+
+
+@stage('export')
+def export(job, entry, stage_report):
+    # Runs the checks of the export button and reports what it would show as warnings
+    meshes = Common.get_meshes_objects()
+    issues = Importer.validate_meshes(meshes, Common.get_armature())
+    warnings = stage_report['warnings']
+    for mesh_name, shapekey, issue in issues['broken_shapes']:
+        warnings.append('Broken shape key ' + shapekey + ' (' + mesh_name + ': ' + issue + ')')
+    for mesh_name, count in issues['unweighted_vertices'].items():
+        warnings.append(mesh_name + ' has ' + str(count) + ' vertices without weights')
+    for mesh_name, count in issues['uv_layers'].items():
+        warnings.append(mesh_name + ' has ' + str(count) + ' UV maps')
+    tris = get_tris_count()
+    if tris > Importer.max_tris:
+        warnings.append(str(tris) + ' tris are more than the ' + str(Importer.max_tris) + ' that are allowed')
+
+    textures_found = any(image.filepath and os.path.isfile(bpy.path.abspath(image.filepath)) for image in bpy.data.images)
+    path = os.path.join(job['output_dir'], entry.get('filename') or job['name'] + '.fbx')
+
+    Fbx_patch.patch_fbx_exporter()
+    try:
+        result = bpy.ops.export_scene.fbx(filepath=path, **Importer.get_fbx_export_settings(meshes, textures_found))
+    except (TypeError, ValueError) as e:
+        warnings.append('Exported with the default FBX settings, this Blender version rejected the CATS settings: ' + ' '.join(str(e).split()))
+        result = bpy.ops.export_scene.fbx(filepath=path)
+    check_result(result, 'Export')
+    return [path]
+
+
+@stage('save_blend')
+def save_blend(job, entry, stage_report):
+    path = os.path.join(job['output_dir'], entry.get('filename') or job['name'] + '.blend')
+    check_result(bpy.ops.wm.save_as_mainfile(filepath=path, copy=True), 'Save')
+    return [path]
@@ -25,6 +25,7 @@
 # Edits by: GiveMeAllYourCats
 
 import bpy
+from collections import OrderedDict
 
 from . import common as Common
 from .register import register_wrap
@@ -60,91 +61,66 @@ class BoneMergeButton(bpy.types.Operator):
         # debug
         print(ratio)
 
-        did = 0
-        todo = 0
-        for bone_name in parent_bones:
-            bone = armature.data.bones.get(bone_name)
-            if not bone:
-                continue
-
-            for child in bone.children:
-                todo += 1
-
         wm = bpy.context.window_manager
-        wm.progress_begin(did, todo)
-
-        # Start the bone check for every parent
-        for bone_name in parent_bones:
-            print('\nPARENT: ' + bone_name)
-            bone = armature.data.bones.get(bone_name)
-            if not bone:
-                continue
-
-            children = []
-            for child in bone.children:
-                children.append(child.name)
-
-            for child_name in children:
-                child = armature.data.bones.get(child_name)
-                print('CHILD: ' + child.name)
-                self.check_bone(mesh, child, ratio, ratio)
-                did += 1
-                wm.progress_update(did)
+        wm.progress_begin(0, 3)
+
+        # Plan which bone gets merged into which ancestor before changing anything
+        merge_plan = get_merge_plan(armature, parent_bones, ratio)
+        wm.progress_update(1)
+
+        # Fold the weights of all merged bones into their new bones in one pass.
+        # Weights only get moved if both vertex groups exist, just like when mixing them one by one
+        group_map = {bone_name: parent_name for bone_name, parent_name in merge_plan.items()
+                     if bone_name in mesh.vertex_groups and parent_name in mesh.vertex_groups}
+        Common.merge_vertex_groups(mesh, group_map)
+        wm.progress_update(2)
+
+        # We are done, remove all merged bones at once
+        Common.set_active(armature)
+        Common.switch('EDIT')
+        for bone_name in merge_plan.keys():
+            bone = armature.data.edit_bones.get(bone_name)
+            if bone:
+                armature.data.edit_bones.remove(bone)
+        Common.set_default_stage()
 
         saved_data.load()
 
         wm.progress_end()
-        self.report({'INFO'}, 'Merged bones.')
+        self.report({'INFO'}, 'Merged ' + str(len(merge_plan)) + ' bones.')
         return {'FINISHED'}
 
-    # Go through this until the last child is reached
-    def check_bone(self, mesh, bone, ratio, i):
-        if bone is None:
-            print('END FOUND')
-            return
-
-        # Increase number by the ratio
-        i += ratio
-        bone_name = bone.name
-
-        # Get all children names
-        children = []
-        for child in bone.children:
-            children.append(child.name)
 
-        # Check if bone will be merged
-        if i >= 100:
-            i -= 100
+def get_merge_plan(armature, parent_bones, ratio):
+    """
+    Walks down the children of the parent bones and picks the bones that get merged according to the merge ratio.
+    Every picked bone gets merged into its closest ancestor that is not merged itself.
 
-            if bone.parent is not None:
-                parent_name = bone.parent.name
+    :return: OrderedDict of bone name: name of the bone it gets merged into
+    """
+    merge_plan = OrderedDict()
+    for parent_name in parent_bones:
+        parent = armature.data.bones.get(parent_name)
+        if not parent:
+            continue
+        print('\nPARENT: ' + parent_name)
 
-                print('Merging ' + bone_name + ' into ' + parent_name+ ' with ratio ' + str(i) )
+        # Go through this until the last child is reached
+        stack = [(child, parent_name, ratio) for child in reversed(parent.children)]
+        while stack:
+            bone, target_name, i = stack.pop()
 
-                # # Set new parent bone position
-                # armature = Common.set_default_stage()
-                # Common.switch('EDIT')
-                #
-                # child = armature.data.edit_bones.get(bone_name)
-                # parent = armature.data.edit_bones.get(parent_name)
-                # parent.tail = child.tail
+            # Increase number by the ratio
+            i += ratio
 
-                # Mix the weights
-                Common.set_default_stage()
-                Common.set_active(mesh)
+            # Check if bone will be merged
+            if i >= 100:
+                i -= 100
+                print('Merging ' + bone.name + ' into ' + target_name + ' with ratio ' + str(i))
+                merge_plan[bone.name] = target_name
+            else:
+                target_name = bone.name
 
-                vg = mesh.vertex_groups.get(bone_name)
-                vg2 = mesh.vertex_groups.get(parent_name)
-                if vg is not None and vg2 is not None:
-                    Common.mix_weights(mesh, bone_name, parent_name)
+            stack.extend((child, target_name, i) for child in reversed(bone.children))
 
-                Common.set_default_stage()
-
-                # We are done, remove the bone
-                Common.remove_bone(bone_name)
-
-        armature = Common.set_default_stage()
-        for child in children:
-            bone = armature.data.bones.get(child)
-            if bone is not None:
-                self.check_bone(mesh, bone, ratio, i)
+    return merge_plan
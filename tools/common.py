@@ -27,10 +27,12 @@ import re
 import os
 import bpy
 import time
+import numpy as np
 
 from math import degrees
 from mathutils import Vector
 from datetime import datetime
+from contextlib import contextmanager
 from html.parser import HTMLParser
 from html.entities import name2codepoint
 
@@ -731,30 +733,80 @@ def get_meshes_objects(armature_name=None, mode=0, check=True):
 
     # Check for broken meshes and delete them
     if check:
-        current_active = get_active()
-        to_remove = []
-        for mesh in meshes:
-            selected = is_selected(mesh)
-            # print(mesh.name, mesh.users)
-            set_active(mesh)
-
-            if not get_active():
-                to_remove.append(mesh)
-
-            if not selected:
-                select(mesh, False)
-
+        to_remove = [mesh for mesh in meshes if not check_mesh_health(mesh)]
         for mesh in to_remove:
             print('DELETED CORRUPTED MESH:', mesh.name, mesh.users)
             meshes.remove(mesh)
             delete(mesh)
 
-        if current_active:
-            set_active(current_active)
-
     return meshes
 
 
+mesh_health = None  # Set to a set while an operator runs, so that every mesh only gets checked once per operator
+
+
+@contextmanager
+def cache_mesh_health():
+    # Operators called by other operators share the cache of the outer one
+    global mesh_health
+    if mesh_health is not None:
+        yield
+        return
+    mesh_health = set()
+    try:
+        yield
+    finally:
+        mesh_health = None
+
+
+def check_mesh_health(mesh):
+    # Returns False if the mesh object is broken and should be deleted. Broken geometry gets repaired instead.
+    # This doesn't change the active object or the selection
+    data = mesh.data
+    if data is None or mesh.users == 0 or get_objects().get(mesh.name) != mesh:
+        return False
+
+    # The key changes when the geometry of the mesh changes during the operator
+    key = (mesh.as_pointer(), data.as_pointer(), len(data.vertices), len(data.edges), len(data.loops), len(data.polygons))
+    if mesh_health is not None and key in mesh_health:
+        return True
+
+    if not has_valid_geometry(data) and not data.library:
+        print('REPAIRED CORRUPTED MESH:', mesh.name)
+        data.validate(verbose=False)
+        key = (mesh.as_pointer(), data.as_pointer(), len(data.vertices), len(data.edges), len(data.loops), len(data.polygons))
+
+    if mesh_health is not None:
+        mesh_health.add(key)
+    return True
+
+
+def has_valid_geometry(data):
+    # The index checks of mesh.validate(), but without changing anything
+    vertex_count = len(data.vertices)
+    edge_count = len(data.edges)
+    loop_count = len(data.loops)
+
+    edges = np.empty(edge_count * 2, dtype=np.int32)
+    data.edges.foreach_get('vertices', edges)
+    loop_vertices = np.empty(loop_count, dtype=np.int32)
+    data.loops.foreach_get('vertex_index', loop_vertices)
+    loop_edges = np.empty(loop_count, dtype=np.int32)
+    data.loops.foreach_get('edge_index', loop_edges)
+    loop_starts = np.empty(len(data.polygons), dtype=np.int32)
+    data.polygons.foreach_get('loop_start', loop_starts)
+    loop_totals = np.empty(len(data.polygons), dtype=np.int32)
+    data.polygons.foreach_get('loop_total', loop_totals)
+    coords = np.empty(vertex_count * 3, dtype=np.float32)
+    data.vertices.foreach_get('co', coords)
+
+    return bool(np.all((edges >= 0) & (edges < vertex_count))
+                and np.all((loop_vertices >= 0) & (loop_vertices < vertex_count))
+                and np.all((loop_edges >= 0) & (loop_edges < edge_count))
+                and np.all((loop_starts >= 0) & (loop_totals >= 3) & (loop_starts + loop_totals <= loop_count))
+                and np.all(np.isfinite(coords)))
+
+
 def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_shape_keys=True):
     # Modes:
     # 0 - Join all meshes
@@ -815,10 +867,11 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
 
     # Get the name of the active mesh in order to check if it was deleted later
     active_mesh_name = get_active().name
+    meshes_to_join_names = [mesh.name for mesh in meshes_to_join]
 
     # Join the meshes
-    if bpy.ops.object.join.poll():
-        bpy.ops.object.join()
+    if len(meshes_to_join) > 1:
+        join_mesh_data(get_active(), meshes_to_join)
     else:
         print('NO MESH COMBINED!')
 
@@ -826,9 +879,9 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
     for mesh in get_meshes_objects(armature_name=armature_name):
         if mesh.name == active_mesh_name:
             set_active(mesh)
-        elif mesh.name in meshes_to_join:
-            delete(mesh)
+        elif mesh.name in meshes_to_join_names:
             print('DELETED', mesh.name, mesh.users)
+            delete(mesh)
 
     # Rename result to Body and correct modifiers
     mesh = get_active()
@@ -851,6 +904,651 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
     return mesh
 
 
+def _get_data(collection, attr, dtype, width=1):
+    data = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, data)
+    return data
+
+
+def read_mesh_arrays(obj, custom_normals=None):
+    """
+    Reads all the data of a mesh object into numpy arrays, which can be turned back into a mesh with build_mesh.
+
+    :param obj: the mesh object
+    :param custom_normals: read the loop normals, by default only if the mesh has custom normals
+    :return: dict of arrays
+    """
+    data = obj.data
+    if custom_normals is None:
+        custom_normals = data.has_custom_normals
+
+    arrays = {
+        'co': _get_data(data.vertices, 'co', np.float32, 3),
+        'edges': _get_data(data.edges, 'vertices', np.int32, 2),
+        'edge_sharp': _get_data(data.edges, 'use_edge_sharp', bool),
+        'edge_seam': _get_data(data.edges, 'use_seam', bool),
+        'loop_verts': _get_data(data.loops, 'vertex_index', np.int32),
+        'loop_edges': _get_data(data.loops, 'edge_index', np.int32),
+        'loop_starts': _get_data(data.polygons, 'loop_start', np.int32),
+        'loop_totals': _get_data(data.polygons, 'loop_total', np.int32),
+        'mat_indices': _get_data(data.polygons, 'material_index', np.int32),
+        'smooth': _get_data(data.polygons, 'use_smooth', bool),
+        'materials': list(data.materials),
+        'uvs': {},
+        'colors': {},
+        'color_width': 4,
+        'normals': None,
+        'shapes': [],
+        'weights': None,
+        'group_names': [vg.name for vg in obj.vertex_groups],
+    }
+
+    for index, uv_layer in enumerate(data.uv_layers):
+        arrays['uvs'][uv_layer.name] = _get_data(uv_layer.data, 'uv', np.float32, 2)
+
+    for color_layer in data.vertex_colors:
+        if len(color_layer.data):
+            arrays['color_width'] = len(color_layer.data[0].color)
+        arrays['colors'][color_layer.name] = _get_data(color_layer.data, 'color', np.float32, arrays['color_width'])
+
+    if custom_normals:
+        if hasattr(data, 'calc_normals_split'):
+            data.calc_normals_split()
+        arrays['normals'] = _get_data(data.loops, 'normal', np.float32, 3)
+
+    if has_shapekeys(obj):
+        for kb in data.shape_keys.key_blocks:
+            arrays['shapes'].append((kb.name, _get_data(kb.data, 'co', np.float32, 3), {
+                'relative_key': kb.relative_key.name,
+                'slider_min': kb.slider_min,
+                'slider_max': kb.slider_max,
+                'value': kb.value,
+                'mute': kb.mute,
+                'interpolation': kb.interpolation,
+                'vertex_group': kb.vertex_group,
+                'use_relative': data.shape_keys.use_relative,
+            }))
+
+    if obj.vertex_groups:
+        arrays['weights'] = get_weight_arrays(obj)
+
+    return arrays
+
+
+def get_weight_arrays(obj):
+    """
+    Reads all vertex weights of a mesh object.
+
+    :param obj: the mesh object
+    :return: tuple of the vertex index, group index and weight arrays, one entry per vertex group assignment
+    """
+    # Vertex weights can't be read with foreach_get, so they get collected once per vertex
+    vert_indices, group_indices, weights = [], [], []
+    for vertex in obj.data.vertices:
+        for group in vertex.groups:
+            vert_indices.append(vertex.index)
+            group_indices.append(group.group)
+            weights.append(group.weight)
+    return (np.array(vert_indices, dtype=np.int32),
+            np.array(group_indices, dtype=np.int32),
+            np.array(weights, dtype=np.float32))
+
+
+def build_mesh(name, arrays):
+    """
+    Creates a new mesh datablock from the arrays. Vertex groups and shape keys are object data
+    and have to be added afterwards with write_weights_and_shapes.
+
+    :param name: the name of the new mesh
+    :param arrays: dict of arrays in the format returned by read_mesh_arrays
+    :return: the new mesh datablock
+    """
+    mesh = bpy.data.meshes.new(name)
+    for mat in arrays['materials']:
+        mesh.materials.append(mat)
+
+    mesh.vertices.add(len(arrays['co']) // 3)
+    mesh.vertices.foreach_set('co', arrays['co'])
+    mesh.edges.add(len(arrays['edges']) // 2)
+    mesh.edges.foreach_set('vertices', arrays['edges'])
+    mesh.edges.foreach_set('use_edge_sharp', arrays['edge_sharp'])
+    mesh.edges.foreach_set('use_seam', arrays['edge_seam'])
+    mesh.loops.add(len(arrays['loop_verts']))
+    mesh.loops.foreach_set('vertex_index', arrays['loop_verts'])
+    mesh.loops.foreach_set('edge_index', arrays['loop_edges'])
+    mesh.polygons.add(len(arrays['loop_starts']))
+    mesh.polygons.foreach_set('loop_start', arrays['loop_starts'])
+    mesh.polygons.foreach_set('loop_total', arrays['loop_totals'])
+    mesh.polygons.foreach_set('material_index', arrays['mat_indices'])
+    mesh.polygons.foreach_set('use_smooth', arrays['smooth'])
+
+    for uv_name, uv_data in arrays['uvs'].items():
+        if version_2_79_or_older():
+            mesh.uv_textures.new(name=uv_name)
+            uv_layer = mesh.uv_layers[uv_name]
+        else:
+            uv_layer = mesh.uv_layers.new(name=uv_name)
+        uv_layer.data.foreach_set('uv', uv_data)
+
+    for color_name, color_data in arrays['colors'].items():
+        color_layer = mesh.vertex_colors.new(name=color_name)
+        color_layer.data.foreach_set('color', color_data)
+
+    mesh.update(calc_edges=False)
+
+    # The arrays come from valid meshes, so this only repairs anything if the source mesh was already broken
+    if not has_valid_geometry(mesh):
+        print('REPAIRED CORRUPTED MESH:', name)
+        mesh.validate(verbose=False)
+
+    if arrays['normals'] is not None:
+        if len(arrays['normals']) == len(mesh.loops) * 3:
+            mesh.use_auto_smooth = True
+            mesh.normals_split_custom_set(arrays['normals'].reshape(-1, 3))
+        else:
+            print('Custom normals of', name, 'were lost while repairing the mesh')
+
+    return mesh
+
+
+def write_weights_and_shapes(obj, arrays):
+    """
+    Adds the vertex weights and shape keys from the arrays to the object.
+    Weights are added with one call per vertex group and weight value instead of one call per vertex.
+    """
+    if arrays['weights'] is not None and len(arrays['weights'][0]):
+        group_names = arrays['group_names']
+        for name in group_names:
+            if name not in obj.vertex_groups:
+                obj.vertex_groups.new(name=name)
+        add_weight_arrays(obj, group_names, *arrays['weights'])
+
+    if arrays['shapes']:
+        for name, co, _ in arrays['shapes']:
+            kb = obj.shape_key_add(name=name, from_mix=False)
+            kb.data.foreach_set('co', co)
+
+        key_blocks = obj.data.shape_keys.key_blocks
+        for name, _, settings in arrays['shapes']:
+            kb = key_blocks[name]
+            kb.slider_min = settings['slider_min']
+            kb.slider_max = settings['slider_max']
+            kb.value = settings['value']
+            kb.mute = settings['mute']
+            kb.interpolation = settings['interpolation']
+            kb.vertex_group = settings['vertex_group']
+            if settings['relative_key'] in key_blocks:
+                kb.relative_key = key_blocks[settings['relative_key']]
+        obj.data.shape_keys.use_relative = arrays['shapes'][0][2]['use_relative']
+
+
+def add_weight_arrays(obj, group_names, vert_indices, group_indices, weights):
+    """
+    Sets the weights of the vertex groups with one call per vertex group and weight value instead of one call per vertex.
+    The group indices point into group_names and all of these groups have to exist already.
+    """
+    if not len(weights):
+        return
+    order = np.lexsort((weights, group_indices))
+    vert_indices, group_indices, weights = vert_indices[order], group_indices[order], weights[order]
+    splits = np.flatnonzero((np.diff(group_indices) != 0) | (np.diff(weights) != 0)) + 1
+    for start, end in zip(np.concatenate(([0], splits)), np.concatenate((splits, [len(weights)]))):
+        vg = obj.vertex_groups[group_names[group_indices[start]]]
+        vg.add(vert_indices[start:end].tolist(), float(weights[start]), 'REPLACE')
+
+
+def merge_vertex_groups(mesh, group_map):
+    """
+    Adds the weights of multiple vertex groups onto other vertex groups in one pass and removes the merged groups.
+    Gives the same result as calling mix_weights for each pair, but without applying a modifier per group.
+
+    :param mesh: the mesh object
+    :param group_map: dict of the name of the group to merge: the name of the group it gets merged into
+    """
+    vertex_groups = mesh.vertex_groups
+
+    # Groups without an existing target only have to be renamed
+    to_mix = {}
+    for vg_from, vg_to in group_map.items():
+        if vg_from not in vertex_groups:
+            continue
+        if vg_to not in vertex_groups and vg_to not in to_mix.values():
+            vertex_groups[vg_from].name = vg_to
+            continue
+        if vg_to not in vertex_groups:
+            vertex_groups.new(name=vg_to)
+        to_mix[vg_from] = vg_to
+
+    if not to_mix:
+        return
+
+    # Map the merged groups onto their targets and sum up all weights per vertex and target group
+    group_names = [vg.name for vg in vertex_groups]
+    target_indices = np.arange(len(group_names))
+    for vg_from, vg_to in to_mix.items():
+        target_indices[vertex_groups[vg_from].index] = vertex_groups[vg_to].index
+    is_from = np.zeros(len(group_names), dtype=bool)
+    is_from[[vertex_groups[vg_from].index for vg_from in to_mix.keys()]] = True
+    is_to = np.zeros(len(group_names), dtype=bool)
+    is_to[target_indices[is_from]] = True
+
+    vert_indices, group_indices, weights = get_weight_arrays(mesh)
+    mask = is_from[group_indices] | is_to[group_indices]
+    vert_indices, group_indices, weights = vert_indices[mask], group_indices[mask], weights[mask]
+    from_mask = is_from[group_indices]
+    group_indices = target_indices[group_indices]
+
+    keys = vert_indices.astype(np.int64) * len(group_names) + group_indices
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.minimum(np.bincount(inverse, weights=weights), 1).astype(np.float32)
+
+    # Only the vertices that are in one of the merged groups get changed
+    changed = np.zeros(len(unique_keys), dtype=bool)
+    changed[inverse[from_mask]] = True
+    unique_keys, summed = unique_keys[changed], summed[changed]
+    add_weight_arrays(mesh, group_names, unique_keys // len(group_names), unique_keys % len(group_names), summed)
+
+    for vg_from in to_mix.keys():
+        vertex_groups.remove(vertex_groups[vg_from])
+
+
+def replace_mesh_data(obj, arrays):
+    """
+    Builds a new mesh from the arrays and swaps it into the object.
+    The custom properties and auto smooth settings of the old mesh are kept.
+    """
+    old_data = obj.data
+    new_data = build_mesh(old_data.name, arrays)
+    for key in old_data.keys():
+        new_data[key] = old_data[key]
+    if old_data.use_auto_smooth:
+        new_data.use_auto_smooth = True
+        new_data.auto_smooth_angle = old_data.auto_smooth_angle
+
+    obj.data = new_data
+    if old_data.users == 0:
+        bpy.data.meshes.remove(old_data)
+
+    write_weights_and_shapes(obj, arrays)
+    return obj
+
+
+def join_mesh_data(target, meshes):
+    """
+    Joins the meshes into the target object by concatenating their data arrays into a new mesh datablock.
+    This replaces bpy.ops.object.join, which gets very slow with a lot of meshes.
+    Vertices, edges, polygons, UV maps, vertex colors, custom normals, vertex groups, shape keys and materials are carried over.
+    The target object keeps its name, modifiers and custom properties, the other meshes get deleted.
+
+    :param target: the mesh object the other meshes get joined into
+    :param meshes: all meshes to join, the target included
+    :return: the target object
+    """
+    meshes = [target] + [mesh for mesh in meshes if mesh != target]
+    use_custom_normals = any(mesh.data.has_custom_normals for mesh in meshes)
+    target_matrix_inv = target.matrix_world.inverted()
+
+    parts = []
+    for mesh in meshes:
+        arrays = read_mesh_arrays(mesh, custom_normals=use_custom_normals)
+
+        # The first UV map is always called UVMap
+        if arrays['uvs']:
+            first_name = next(iter(arrays['uvs']))
+            arrays['uvs'] = {('UVMap' if name == first_name else name): uv for name, uv in arrays['uvs'].items()}
+
+        # Bring all coordinates into the space of the target object
+        matrix = matmul(target_matrix_inv, mesh.matrix_world)
+        rotation = np.array(matrix.to_3x3(), dtype=np.float64)
+        translation = np.array(matrix.translation, dtype=np.float64)
+        arrays['co'] = (arrays['co'].reshape(-1, 3) @ rotation.T + translation).ravel().astype(np.float32)
+        arrays['shapes'] = [(name, (co.reshape(-1, 3) @ rotation.T + translation).ravel().astype(np.float32), settings)
+                            for name, co, settings in arrays['shapes']]
+        if arrays['normals'] is not None:
+            normal_matrix = np.linalg.inv(rotation).T if np.linalg.det(rotation) != 0 else rotation
+            normals = arrays['normals'].reshape(-1, 3) @ normal_matrix.T
+            lengths = np.linalg.norm(normals, axis=1)
+            lengths[lengths == 0] = 1
+            arrays['normals'] = (normals / lengths[:, None]).ravel().astype(np.float32)
+
+        parts.append(arrays)
+
+    joined = concatenate_mesh_arrays(parts)
+    replace_mesh_data(target, joined)
+
+    # Delete the now joined meshes
+    for mesh in meshes[1:]:
+        mesh_data = mesh.data
+        delete(mesh)
+        if mesh_data.users == 0:
+            bpy.data.meshes.remove(mesh_data)
+
+    return target
+
+
+def concatenate_mesh_arrays(parts):
+    """
+    Concatenates the arrays of multiple meshes into the arrays of one mesh.
+    Materials, UV maps, vertex colors, vertex groups and shape keys are matched by name (materials by identity).
+    Missing UV maps are filled with zeros and missing shape keys with the basis of the mesh.
+    """
+    materials = []
+    uv_names = []
+    color_names = []
+    group_names = []
+    shape_settings = {}
+    shape_names = []
+    color_width = 4
+    for arrays in parts:
+        for mat in arrays['materials']:
+            if mat not in materials:
+                materials.append(mat)
+        for name in arrays['uvs']:
+            if name not in uv_names:
+                uv_names.append(name)
+        for name in arrays['colors']:
+            if name not in color_names:
+                color_names.append(name)
+                color_width = arrays['color_width']
+        for name in arrays['group_names']:
+            if name not in group_names:
+                group_names.append(name)
+        for name, _, settings in arrays['shapes']:
+            if name not in shape_settings:
+                shape_names.append(name)
+                shape_settings[name] = settings
+    use_normals = any(arrays['normals'] is not None for arrays in parts)
+
+    joined = {key: [] for key in ('co', 'edges', 'edge_sharp', 'edge_seam', 'loop_verts', 'loop_edges',
+                                  'loop_starts', 'loop_totals', 'mat_indices', 'smooth', 'normals')}
+    uvs = {name: [] for name in uv_names}
+    colors = {name: [] for name in color_names}
+    shapes = {name: [] for name in shape_names}
+    weights = ([], [], [])
+    vert_offset = 0
+    edge_offset = 0
+    loop_offset = 0
+
+    for arrays in parts:
+        vert_count = len(arrays['co']) // 3
+        loop_count = len(arrays['loop_verts'])
+
+        joined['co'].append(arrays['co'])
+        joined['edges'].append(arrays['edges'] + vert_offset)
+        joined['edge_sharp'].append(arrays['edge_sharp'])
+        joined['edge_seam'].append(arrays['edge_seam'])
+        joined['loop_verts'].append(arrays['loop_verts'] + vert_offset)
+        joined['loop_edges'].append(arrays['loop_edges'] + edge_offset)
+        joined['loop_starts'].append(arrays['loop_starts'] + loop_offset)
+        joined['loop_totals'].append(arrays['loop_totals'])
+        joined['smooth'].append(arrays['smooth'])
+
+        # Remap material indices to the joined material list
+        mat_indices = arrays['mat_indices']
+        if arrays['materials']:
+            remap = np.array([materials.index(mat) for mat in arrays['materials']], dtype=np.int32)
+            mat_indices = remap[np.clip(mat_indices, 0, len(remap) - 1)]
+        else:
+            mat_indices = np.zeros_like(mat_indices)
+        joined['mat_indices'].append(mat_indices)
+
+        for name in uv_names:
+            uvs[name].append(arrays['uvs'].get(name, np.zeros(loop_count * 2, dtype=np.float32)))
+        for name in color_names:
+            colors[name].append(arrays['colors'].get(name, np.ones(loop_count * color_width, dtype=np.float32)))
+
+        if use_normals:
+            normals = arrays['normals']
+            if normals is None:
+                normals = np.zeros(loop_count * 3, dtype=np.float32)
+            joined['normals'].append(normals)
+
+        if shape_names:
+            local_shapes = {name: co for name, co, _ in arrays['shapes']}
+            basis_co = arrays['shapes'][0][1] if arrays['shapes'] else arrays['co']
+            for index, name in enumerate(shape_names):
+                if index == 0 and arrays['shapes']:
+                    shapes[name].append(basis_co)
+                else:
+                    shapes[name].append(local_shapes.get(name, basis_co))
+
+        if arrays['weights'] is not None:
+            vert_indices, group_indices, group_weights = arrays['weights']
+            remap = np.array([group_names.index(name) for name in arrays['group_names']], dtype=np.int32)
+            weights[0].append(vert_indices + vert_offset)
+            weights[1].append(remap[group_indices])
+            weights[2].append(group_weights)
+
+        vert_offset += vert_count
+        edge_offset += len(arrays['edges']) // 2
+        loop_offset += loop_count
+
+    result = {key: np.concatenate(value) if value else None for key, value in joined.items()}
+    result['materials'] = materials
+    result['uvs'] = {name: np.concatenate(value) for name, value in uvs.items()}
+    result['colors'] = {name: np.concatenate(value) for name, value in colors.items()}
+    result['color_width'] = color_width
+    result['group_names'] = group_names
+    result['shapes'] = [(name, np.concatenate(shapes[name]), shape_settings[name]) for name in shape_names]
+    result['weights'] = tuple(np.concatenate(value) for value in weights) if weights[0] else None
+    return result
+
+
+def get_polygon_parts(arrays, by_material=True, by_loose_parts=False):
+    """
+    Assigns every polygon to a part without entering edit mode.
+    Parts are either split by material index, by connected components or by both.
+
+    :param arrays: dict of arrays from read_mesh_arrays
+    :return: array with one part label per polygon, labels start at 0 and are ordered by their first polygon
+    """
+    loop_totals = arrays['loop_totals']
+    poly_count = len(loop_totals)
+    if poly_count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    mat_indices = arrays['mat_indices'] if by_material else np.zeros(poly_count, dtype=np.int32)
+    if not by_loose_parts:
+        return np.unique(mat_indices, return_inverse=True)[1].ravel()
+
+    # Every (material, vertex) pair is a node, so that parts don't connect through polygons of other materials
+    loop_starts = arrays['loop_starts']
+    poly_of_loop = np.repeat(np.arange(poly_count), loop_totals)
+    corner = np.arange(poly_of_loop.size) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_index = np.repeat(loop_starts, loop_totals) + corner
+    next_index = np.repeat(loop_starts, loop_totals) + (corner + 1) % np.repeat(loop_totals, loop_totals)
+
+    vert_count = len(arrays['co']) // 3
+    loop_verts = arrays['loop_verts'].astype(np.int64)
+    node_keys = mat_indices[poly_of_loop].astype(np.int64) * vert_count
+    nodes_a = node_keys + loop_verts[loop_index]
+    nodes_b = node_keys + loop_verts[next_index]
+    unique_nodes, inverse = np.unique(np.concatenate((nodes_a, nodes_b)), return_inverse=True)
+    inverse = inverse.ravel()
+    edges_a, edges_b = inverse[:nodes_a.size], inverse[nodes_a.size:]
+
+    # Union-find by label propagation with pointer jumping
+    labels = np.arange(unique_nodes.size)
+    while True:
+        lowest = np.minimum(labels[edges_a], labels[edges_b])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, edges_a, lowest)
+        np.minimum.at(new_labels, edges_b, lowest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    first_loops = np.searchsorted(poly_of_loop, np.arange(poly_count))
+    poly_labels = labels[edges_a[first_loops]]
+
+    # Relabel so that the parts are ordered by their first polygon
+    _, first_polys, poly_parts = np.unique(poly_labels, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first_polys))
+    return order[poly_parts.ravel()]
+
+
+def get_loose_geometry_parts(arrays, poly_parts):
+    """
+    Assigns the edges and vertices that are not used by any polygon to the parts, so that splitting doesn't lose them.
+    Wire edges go to the part of the polygons they are connected to, loose geometry that isn't connected to any polygon goes to the first part.
+
+    :param arrays: dict of arrays from read_mesh_arrays
+    :param poly_parts: part index of every polygon
+    :return: tuple of the part index of every edge and vertex, -1 for the ones that are used by polygons
+    """
+    vert_count = len(arrays['co']) // 3
+    edges = arrays['edges'].reshape(-1, 2)
+    loop_starts = arrays['loop_starts']
+    loop_totals = arrays['loop_totals']
+    corner = np.arange(np.sum(loop_totals)) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_index = np.repeat(loop_starts, loop_totals) + corner
+    loop_parts = np.repeat(poly_parts, loop_totals)
+
+    vert_parts = np.full(vert_count, -1, dtype=np.int64)
+    vert_parts[arrays['loop_verts'][loop_index]] = loop_parts
+    edge_parts = np.full(len(edges), -1, dtype=np.int64)
+    edge_parts[arrays['loop_edges'][loop_index]] = loop_parts
+    loose_verts = vert_parts < 0
+    loose_edge_mask = edge_parts < 0
+    loose_edges = np.flatnonzero(loose_edge_mask)
+
+    # Wire edges take the part of a connected vertex, one step along every chain of wire edges per iteration
+    while True:
+        pending = loose_edges[edge_parts[loose_edges] < 0]
+        parts = np.maximum(vert_parts[edges[pending, 0]], vert_parts[edges[pending, 1]])
+        found = parts >= 0
+        if not found.any():
+            break
+        pending, parts = pending[found], parts[found]
+        edge_parts[pending] = parts
+        ends = edges[pending].ravel()
+        end_parts = np.repeat(parts, 2)
+        unassigned = vert_parts[ends] < 0
+        vert_parts[ends[unassigned]] = end_parts[unassigned]
+
+    vert_parts[loose_verts & (vert_parts < 0)] = 0
+    edge_parts[loose_edge_mask & (edge_parts < 0)] = 0
+
+    # Everything else comes with the polygons
+    vert_parts[~loose_verts] = -1
+    edge_parts[~loose_edge_mask] = -1
+    return edge_parts, vert_parts
+
+
+def extract_mesh_part(arrays, poly_mask, single_material=False, edge_mask=None, vert_mask=None):
+    """
+    Extracts the polygons in the mask into new arrays, carrying over all data of the used vertices and loops.
+
+    :param arrays: dict of arrays from read_mesh_arrays
+    :param poly_mask: bool array with one entry per polygon
+    :param single_material: only keep the material of the part, like separating by material does
+    :param edge_mask: bool array of additional edges to keep, like wire edges
+    :param vert_mask: bool array of additional vertices to keep, like loose vertices
+    :return: dict of arrays for the part
+    """
+    loop_starts = arrays['loop_starts'][poly_mask]
+    loop_totals = arrays['loop_totals'][poly_mask]
+    corner = np.arange(np.sum(loop_totals)) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_index = np.repeat(loop_starts, loop_totals) + corner
+
+    vert_count = len(arrays['co']) // 3
+    edge_count = len(arrays['edges']) // 2
+
+    # Only keep the vertices and edges that are used by the polygons of the part or are in the masks
+    vert_indices = [arrays['loop_verts'][loop_index]]
+    edge_indices = [arrays['loop_edges'][loop_index]]
+    if edge_mask is not None:
+        edge_indices.append(np.flatnonzero(edge_mask))
+        vert_indices.append(arrays['edges'].reshape(-1, 2)[edge_mask].ravel())
+    if vert_mask is not None:
+        vert_indices.append(np.flatnonzero(vert_mask))
+    old_verts = np.unique(np.concatenate(vert_indices))
+    vert_map = np.full(vert_count, -1, dtype=np.int32)
+    vert_map[old_verts] = np.arange(old_verts.size, dtype=np.int32)
+    old_edges = np.unique(np.concatenate(edge_indices))
+    edge_map = np.full(edge_count, -1, dtype=np.int32)
+    edge_map[old_edges] = np.arange(old_edges.size, dtype=np.int32)
+
+    part = {
+        'co': arrays['co'].reshape(-1, 3)[old_verts].ravel(),
+        'edges': vert_map[arrays['edges'].reshape(-1, 2)[old_edges]].ravel(),
+        'edge_sharp': arrays['edge_sharp'][old_edges],
+        'edge_seam': arrays['edge_seam'][old_edges],
+        'loop_verts': vert_map[arrays['loop_verts'][loop_index]],
+        'loop_edges': edge_map[arrays['loop_edges'][loop_index]],
+        'loop_starts': (np.cumsum(loop_totals) - loop_totals).astype(np.int32),
+        'loop_totals': loop_totals,
+        'mat_indices': arrays['mat_indices'][poly_mask],
+        'smooth': arrays['smooth'][poly_mask],
+        'materials': arrays['materials'],
+        'uvs': {name: uv.reshape(-1, 2)[loop_index].ravel() for name, uv in arrays['uvs'].items()},
+        'colors': {name: color.reshape(-1, arrays['color_width'])[loop_index].ravel() for name, color in arrays['colors'].items()},
+        'color_width': arrays['color_width'],
+        'normals': arrays['normals'].reshape(-1, 3)[loop_index].ravel() if arrays['normals'] is not None else None,
+        'shapes': [(name, co.reshape(-1, 3)[old_verts].ravel(), settings) for name, co, settings in arrays['shapes']],
+        'weights': None,
+        'group_names': arrays['group_names'],
+    }
+
+    if single_material and arrays['materials'] and len(part['mat_indices']):
+        mat_index = min(part['mat_indices'][0], len(arrays['materials']) - 1)
+        part['materials'] = [arrays['materials'][mat_index]]
+        part['mat_indices'] = np.zeros_like(part['mat_indices'])
+
+    if arrays['weights'] is not None:
+        vert_indices, group_indices, weights = arrays['weights']
+        new_indices = vert_map[vert_indices]
+        used = new_indices >= 0
+        part['weights'] = (new_indices[used], group_indices[used], weights[used])
+
+    return part
+
+
+def split_mesh_data(obj, by_material=True, by_loose_parts=False):
+    """
+    Splits a mesh object into multiple objects without using edit mode or the separate operator.
+    The polygon partition is calculated once and every part is built directly from the arrays of the original mesh.
+    Wire edges stay with the polygons they are connected to, other loose geometry stays in the original object.
+    The original object keeps the first part, all new objects are copies of it with the same modifiers, vertex groups and properties.
+
+    :return: list of all resulting objects, the original first
+    """
+    arrays = read_mesh_arrays(obj)
+    poly_parts = get_polygon_parts(arrays, by_material=by_material, by_loose_parts=by_loose_parts)
+    part_count = int(poly_parts.max()) + 1 if poly_parts.size else 0
+    if part_count <= 1:
+        return [obj]
+
+    edge_parts, vert_parts = get_loose_geometry_parts(arrays, poly_parts)
+
+    # The new objects share the original mesh until they get their own, so the original object is rebuilt last
+    source_data = obj.data
+    collections = obj.users_collection if hasattr(obj, 'users_collection') else [bpy.context.scene]
+    objects = []
+    for part_index in list(range(1, part_count)) + [0]:
+        part = extract_mesh_part(arrays, poly_parts == part_index, single_material=by_material,
+                                 edge_mask=edge_parts == part_index, vert_mask=vert_parts == part_index)
+
+        if part_index == 0:
+            part_obj = obj
+        else:
+            part_obj = obj.copy()
+            part_obj.data = source_data
+            for collection in collections:
+                collection.objects.link(part_obj)
+
+        replace_mesh_data(part_obj, part)
+
+        if by_material:
+            materials = part_obj.data.materials
+            part_obj.name = getattr(materials[0], 'name', 'None') if len(materials) else 'None'
+        objects.append(part_obj)
+
+    objects.insert(0, objects.pop())
+    return objects
+
+
 def repair_mesh(mesh, armature_name):
     mesh.parent_type = 'OBJECT'
 
@@ -927,12 +1625,10 @@ def reset_transforms(armature_name=None):
 def separate_by_materials(context, mesh):
     prepare_separation(mesh)
 
-    utils.separateByMaterials(mesh)
-
-    for ob in context.selected_objects:
-        if ob.type == 'MESH':
-            hide(ob, False)
-            clean_shapekeys(ob)
+    for ob in split_mesh_data(mesh, by_material=True):
+        hide(ob, False)
+        select(ob)
+        clean_shapekeys(ob)
 
     utils.clearUnusedMeshes()
 
@@ -947,44 +1643,11 @@ def separate_by_loose_parts(context, mesh):
     # This essentially does nothing but merges the extremely small parts together.
     remove_doubles(mesh, 0, save_shapes=True)
 
-    utils.separateByMaterials(mesh)
-
-    meshes = []
-    for ob in context.selected_objects:
-        if ob.type == 'MESH':
-            hide(ob, False)
-            meshes.append(ob)
-
-    wm = bpy.context.window_manager
-    current_step = 0
-    wm.progress_begin(current_step, len(meshes))
-
-    for mesh in meshes:
-        unselect_all()
-        set_active(mesh)
-        bpy.ops.mesh.separate(type='LOOSE')
-
-        meshes2 = []
-        for ob in context.selected_objects:
-            if ob.type == 'MESH':
-                meshes2.append(ob)
-
-        ## This crashes blender, but would be better
-        # unselect_all()
-        # for mesh2 in meshes2:
-        #     if len(mesh2.data.vertices) <= 3:
-        #         select(mesh2)
-        #     elif bpy.ops.object.join.poll():
-        #         bpy.ops.object.join()
-        #         unselect_all()
-
-        for mesh2 in meshes2:
-            clean_shapekeys(mesh2)
-
-        current_step += 1
-        wm.progress_update(current_step)
-
-    wm.progress_end()
+    # Split by materials and loose parts at the same time
+    for ob in split_mesh_data(mesh, by_material=True, by_loose_parts=True):
+        hide(ob, False)
+        select(ob)
+        clean_shapekeys(ob)
 
     utils.clearUnusedMeshes()
 
@@ -1597,6 +2260,7 @@ def correct_bone_positions(armature_name=None):
 dpi_scale = 3
 error = []
 override = False
+collected_errors = None  # Set to a list by batch workers, errors are collected there instead of shown in a popup
 
 
 def show_error(scale, error_list, override_header=False):
@@ -1605,6 +2269,13 @@ def show_error(scale, error_list, override_header=False):
     dpi_scale = scale
     error = error_list
 
+    if collected_errors is not None:
+        collected_errors.append(' '.join(line.strip() for line in error_list if line.strip()))
+        print('Report: Error')
+        for line in error:
+            print('    ' + line)
+        return
+
     header = 'Report: Error'
     if override:
         header = error_list[0]
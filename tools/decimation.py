@@ -25,6 +25,9 @@
 # Edits by:
 
 import bpy
+import numpy as np
+
+from math import log1p, sqrt
 
 from . import common as Common
 from . import armature_bones as Bones
@@ -154,6 +157,12 @@ class AutoDecimateButton(bpy.types.Operator):
     bl_description = 'This will automatically decimate your model while preserving the shape keys.\n' \
                      'You should manually remove unimportant meshes first.'
     bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+    dry_run = bpy.props.BoolProperty(
+        name='Dry Run',
+        description='Only calculate and show the decimation plan without changing the meshes',
+        default=False,
+        options={'SKIP_SAVE'}
+    )
 
     def execute(self, context):
         meshes = Common.get_meshes_objects()
@@ -161,6 +170,10 @@ class AutoDecimateButton(bpy.types.Operator):
             self.report({'ERROR'}, 'No meshes found!')
             return {'FINISHED'}
 
+        if self.dry_run:
+            self.decimate(context)
+            return {'FINISHED'}
+
         saved_data = Common.SavedData()
 
         if context.scene.decimation_mode != 'CUSTOM':
@@ -177,7 +190,6 @@ class AutoDecimateButton(bpy.types.Operator):
 
     def decimate(self, context):
         print('START DECIMATION')
-        Common.set_default_stage()
 
         custom_decimation = context.scene.decimation_mode == 'CUSTOM'
         full_decimation = context.scene.decimation_mode == 'FULL'
@@ -185,83 +197,60 @@ class AutoDecimateButton(bpy.types.Operator):
         safe_decimation = context.scene.decimation_mode == 'SAFE'
         save_fingers = context.scene.decimate_fingers
         max_tris = context.scene.max_tris
+        dry_run = self.dry_run
         meshes = []
         current_tris_count = 0
         tris_count = 0
 
         meshes_obj = Common.get_meshes_objects()
 
-        for mesh in meshes_obj:
-            Common.set_active(mesh)
-            Common.switch('EDIT')
-            bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY')
-            Common.switch('OBJECT')
-            if context.scene.decimation_remove_doubles:
-                Common.remove_doubles(mesh, 0.00001, save_shapes=True)
-            current_tris_count += len(mesh.data.polygons)
-
-        if save_fingers:
+        # The dry run only reads the meshes, so it doesn't change the mode, selection or active object either
+        if not dry_run:
+            Common.set_default_stage()
             for mesh in meshes_obj:
-                if len(mesh.vertex_groups) > 0:
-                    Common.set_active(mesh)
-                    Common.switch('EDIT')
-
-                    bpy.ops.mesh.select_mode(type='VERT')
-
-                    for finger in Bones.bone_finger_list:
-                        print(finger)
-                        vgs = [mesh.vertex_groups.get(finger + 'L'), mesh.vertex_groups.get(finger + 'R')]
-                        for vg in vgs:
-                            if vg:
-                                bpy.ops.object.vertex_group_set_active(group=vg.name)
-                                bpy.ops.object.vertex_group_select()
-                                try:
-                                    bpy.ops.mesh.separate(type='SELECTED')
-                                except RuntimeError:
-                                    pass
-
-                    bpy.ops.object.mode_set(mode='OBJECT')
-
-                    Common.unselect_all()
-
-        for mesh in meshes_obj:
-            Common.set_active(mesh)
-            tris = len(mesh.data.polygons)
-
-            if custom_decimation and mesh.name in ignore_meshes:
-                Common.unselect_all()
+                Common.set_active(mesh)
+                Common.switch('EDIT')
+                bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY')
+                Common.switch('OBJECT')
+                if context.scene.decimation_remove_doubles:
+                    Common.remove_doubles(mesh, 0.00001, save_shapes=True)
+
+        # Fingers are protected by a vertex mask on the decimation modifier instead of separating them
+        protected_groups = []
+        if save_fingers:
+            for finger in Bones.bone_finger_list:
+                protected_groups += [finger + 'L', finger + 'R']
+
+        # Measure every mesh once. The planner only works with these numbers from here on.
+        # The real run joins the meshes and separates them by material before this, so the dry run measures these parts instead
+        if dry_run and not custom_decimation:
+            measurements = measure_material_parts(meshes_obj, protected_groups=protected_groups)
+        else:
+            measurements = [measure_mesh(mesh, protected_groups=protected_groups) for mesh in meshes_obj]
+        for measurement in measurements:
+            current_tris_count += measurement['tris']
+
+        # Sort the meshes into the ones that get decimated and the ones that stay untouched
+        for measurement in measurements:
+            if custom_decimation and measurement['name'] in ignore_meshes:
                 continue
 
-            if Common.has_shapekeys(mesh):
+            key_blocks = measurement['shape_keys']
+            if key_blocks:
                 if full_decimation:
-                    bpy.ops.object.shape_key_remove(all=True)
-                    meshes.append((mesh, tris))
-                    tris_count += tris
+                    pass
                 elif custom_decimation:
-                    found = False
-                    for shape in ignore_shapes:
-                        if shape in mesh.data.shape_keys.key_blocks:
-                            found = True
-                            break
-                    if found:
-                        Common.unselect_all()
+                    if any(shape in key_blocks for shape in ignore_shapes):
                         continue
-                    bpy.ops.object.shape_key_remove(all=True)
-                    meshes.append((mesh, tris))
-                    tris_count += tris
-                elif half_decimation and len(mesh.data.shape_keys.key_blocks) < 4:
-                    bpy.ops.object.shape_key_remove(all=True)
-                    meshes.append((mesh, tris))
-                    tris_count += tris
-                elif len(mesh.data.shape_keys.key_blocks) == 1:
-                    bpy.ops.object.shape_key_remove(all=True)
-                    meshes.append((mesh, tris))
-                    tris_count += tris
-            else:
-                meshes.append((mesh, tris))
-                tris_count += tris
+                elif half_decimation and len(key_blocks) < 4:
+                    pass
+                elif len(key_blocks) == 1:
+                    pass
+                else:
+                    continue
 
-            Common.unselect_all()
+            meshes.append(measurement)
+            tris_count += measurement['tris'] - measurement['protected_tris']
 
         print(current_tris_count)
         print(tris_count)
@@ -285,81 +274,357 @@ class AutoDecimateButton(bpy.types.Operator):
             Common.show_error(6, message)
             return
 
-        try:
-            decimation = (max_tris - current_tris_count + tris_count) / tris_count
-        except ZeroDivisionError:
-            decimation = 1
-        if decimation >= 1:
+        budget = max_tris - current_tris_count + tris_count
+        if tris_count == 0 or budget >= tris_count:
             Common.show_error(6, ['The model already has less than ' + str(max_tris) + ' tris. Nothing had to be decimated.'])
             return
-        elif decimation <= 0:
-            Common.show_error(4.5, ['The model could not be decimated to ' + str(max_tris) + ' tris.',
-                                          'It got decimated as much as possible within the limits.'])
 
-        meshes.sort(key=lambda x: x[1])
+        plan = plan_decimation(meshes, budget)
+
+        if dry_run:
+            message = ['Decimation Plan', '',
+                       'Current tris: ' + str(current_tris_count) + ', target tris: ' + str(max_tris), '']
+            for measurement, ratio in sorted(zip(meshes, plan), key=lambda x: x[0]['tris'], reverse=True):
+                protected_tris = measurement['protected_tris']
+                tris_after = protected_tris + int(round((measurement['tris'] - protected_tris) * ratio))
+                line = measurement['name'] + ': ' + str(measurement['tris']) + ' -> ' + str(tris_after) + ' tris (' + str(round(ratio * 100, 1)) + '%)'
+                if protected_tris:
+                    line += ', ' + str(protected_tris) + ' protected'
+                message.append(line)
+            Common.show_error(7, message, override_header=True)
+            return
 
-        for mesh in reversed(meshes):
-            mesh_obj = mesh[0]
-            tris = mesh[1]
+        if budget <= 0:
+            Common.show_error(4.5, ['The model could not be decimated to ' + str(max_tris) + ' tris.',
+                                    'It got decimated as much as possible within the limits.'])
 
+        for measurement, ratio in zip(meshes, plan):
+            mesh_obj = measurement['mesh']
+            Common.unselect_all()
             Common.set_active(mesh_obj)
-            print(mesh_obj.name)
 
-            # Calculate new decimation ratio
-            try:
-                decimation = (max_tris - current_tris_count + tris_count) / tris_count
-            except ZeroDivisionError:
-                decimation = 1
-            print(decimation)
+            if measurement['shape_keys']:
+                bpy.ops.object.shape_key_remove(all=True)
+
+            if ratio >= 1:
+                continue
+
+            # The ratio of the modifier is relative to all tris, including the protected ones
+            protected_tris = measurement['protected_tris']
+            free_tris = measurement['tris'] - protected_tris
+            mod_ratio = (protected_tris + free_tris * ratio) / measurement['tris']
 
             # Apply decimation mod
             mod = mesh_obj.modifiers.new("Decimate", 'DECIMATE')
-            mod.ratio = decimation
+            mod.ratio = mod_ratio
             mod.use_collapse_triangulate = True
+            mask = None
+            if protected_tris:
+                mask = add_protection_mask(mesh_obj, measurement['protected_vertices'])
+                mod.vertex_group = mask.name
+                mod.invert_vertex_group = True
+                if hasattr(mod, 'vertex_group_factor'):
+                    mod.vertex_group_factor = 1000
             bpy.ops.object.modifier_apply(apply_as='DATA', modifier=mod.name)
-
-            tris_after = len(mesh_obj.data.polygons)
-            print(tris)
-            print(tris_after)
-
-            current_tris_count = current_tris_count - tris + tris_after
-            tris_count = tris_count - tris
-
-            Common.unselect_all()
-
-        # # Check if decimated correctly
-        # if decimation < 0:
-        #     print('')
-        #     print('RECHECK!')
-        #
-        #     current_tris_count = 0
-        #     tris_count = 0
-        #
-        #     for mesh in Common.get_meshes_objects():
-        #         Common.select(mesh)
-        #         tris = len(bpy.context.active_object.data.polygons)
-        #         tris_count += tris
-        #         print(tris_count)
-        #
-        #     for mesh in reversed(meshes):
-        #         mesh_obj = mesh[0]
-        #         Common.select(mesh_obj)
-        #
-        #         # Calculate new decimation ratio
-        #         decimation = (max_tris - tris_count) / tris_count
-        #         print(decimation)
-        #
-        #         # Apply decimation mod
-        #         mod = mesh_obj.modifiers.new("Decimate", 'DECIMATE')
-        #         mod.ratio = decimation
-        #         mod.use_collapse_triangulate = True
-        #         bpy.ops.object.modifier_apply(apply_as='DATA', modifier=mod.name)
-        #
-        #         Common.unselect_all()
-        #         break
-
-
-
-
-
-
+            if mask:
+                mesh_obj.vertex_groups.remove(mask)
+
+        Common.unselect_all()
+
+
+def get_protected_vertices(mesh, group_names):
+    """
+    Finds all vertices that are weighted to one of the given vertex groups, without entering edit mode
+
+    :return: numpy bool array with one entry per vertex
+    """
+    protected = np.zeros(len(mesh.data.vertices), dtype=bool)
+    group_indices = [vg.index for vg in mesh.vertex_groups if vg.name in group_names]
+    if not group_indices:
+        return protected
+
+    vert_indices, vert_groups, weights = Common.get_weight_arrays(mesh)
+    used = np.isin(vert_groups, group_indices) & (weights > 0)
+    protected[vert_indices[used]] = True
+    return protected
+
+
+def add_protection_mask(mesh, protected):
+    """
+    Creates a vertex group containing all protected vertices with a weight of 1.
+    Used inverted on a decimation modifier it keeps these vertices from being collapsed
+
+    :param protected: numpy bool array from get_protected_vertices
+    """
+    mask = mesh.vertex_groups.new(name='CATS_Decimation_Mask')
+    mask.add(np.flatnonzero(protected).tolist(), 1.0, 'REPLACE')
+    return mask
+
+
+def read_polygon_stats(mesh, protected_groups=None):
+    """
+    Reads the per polygon numbers the measurements are summed up from, without changing the mesh
+
+    :return: dict of arrays with one entry per polygon, the loop arrays and the protected vertices, if there are any
+    """
+    data = mesh.data
+    poly_count = len(data.polygons)
+
+    loop_totals = np.empty(poly_count, dtype=np.int32)
+    data.polygons.foreach_get('loop_total', loop_totals)
+    loop_starts = np.empty(poly_count, dtype=np.int32)
+    data.polygons.foreach_get('loop_start', loop_starts)
+    mat_indices = np.empty(poly_count, dtype=np.int32)
+    data.polygons.foreach_get('material_index', mat_indices)
+    areas = np.empty(poly_count, dtype=np.float32)
+    data.polygons.foreach_get('area', areas)
+    poly_normals = np.empty(poly_count * 3, dtype=np.float32)
+    data.polygons.foreach_get('normal', poly_normals)
+    vert_normals = np.empty(len(data.vertices) * 3, dtype=np.float32)
+    data.vertices.foreach_get('normal', vert_normals)
+    loop_verts = np.empty(len(data.loops), dtype=np.int32)
+    data.loops.foreach_get('vertex_index', loop_verts)
+
+    # Loop indices of every polygon corner, ordered by polygon
+    poly_of_loop = np.repeat(np.arange(poly_count), loop_totals)
+    first_loops = np.cumsum(loop_totals) - loop_totals
+    loop_index = np.repeat(loop_starts - first_loops, loop_totals) + np.arange(poly_of_loop.size)
+    corner_verts = loop_verts[loop_index]
+
+    stats = {
+        # Every ngon turns into (corners - 2) tris after triangulation
+        'tris': loop_totals - 2,
+        'loop_totals': loop_totals,
+        'areas': areas,
+        'mat_indices': mat_indices,
+        'protected': np.zeros(poly_count, dtype=bool),
+        'protected_vertices': None,
+        'first_loops': first_loops,
+        'corner_verts': corner_verts,
+    }
+    if poly_count == 0:
+        stats['deviation'] = np.zeros(0, dtype=np.float32)
+        return stats
+
+    # Faces with only protected vertices are kept as they are
+    if protected_groups:
+        protected = get_protected_vertices(mesh, protected_groups)
+        if protected.any():
+            corner_counts = np.add.reduceat(protected[corner_verts].astype(np.int32), first_loops)
+            stats['protected'] = corner_counts == loop_totals
+            stats['protected_vertices'] = protected
+
+    # Curvature proxy: How much the smooth vertex normals deviate from the flat face normals, summed per polygon
+    dots = np.sum(vert_normals.reshape(-1, 3)[corner_verts] * poly_normals.reshape(-1, 3)[poly_of_loop], axis=1)
+    stats['deviation'] = np.add.reduceat(1 - np.clip(dots, -1, 1), first_loops)
+    return stats
+
+
+def summarize_polygon_stats(name, stats, poly_mask, shape_keys):
+    """
+    Sums up the polygon stats in the mask into a measurement
+
+    :param shape_keys: names of the shape keys the measured mesh has, the basis included
+    """
+    tris = stats['tris'][poly_mask]
+    loop_totals = stats['loop_totals'][poly_mask]
+    areas = stats['areas'][poly_mask]
+    deviation = stats['deviation'][poly_mask]
+
+    # Flat surfaces score 0, strongly curved or detailed surfaces score closer to 1.
+    # Every corner is weighted by the area of its polygon
+    weight = float(np.sum(areas * loop_totals))
+    corners = int(np.sum(loop_totals))
+    if weight > 0:
+        curvature = float(np.sum(deviation * areas)) / weight
+    elif corners:
+        curvature = float(np.sum(deviation)) / corners
+    else:
+        curvature = 0.0
+
+    return {
+        'name': name,
+        'mesh': None,
+        'tris': int(np.sum(tris)),
+        'protected_tris': int(np.sum(tris[stats['protected'][poly_mask]])),
+        'shapes': max(len(shape_keys) - 1, 0),
+        'shape_keys': shape_keys,
+        'area': float(np.sum(areas)),
+        'curvature': curvature,
+        'curvature_weight': weight,
+        'corners': corners,
+        'protected_vertices': None,
+    }
+
+
+def measure_mesh(mesh, protected_groups=None):
+    """
+    Measures everything the decimation planner needs to know about a mesh without changing it
+
+    :param mesh: the mesh object
+    :param protected_groups: names of vertex groups whose faces should not be decimated
+    :return: dict with the tris count, protected tris count, shape keys, surface area, a curvature proxy
+             and the protected vertices, if there are any
+    """
+    stats = read_polygon_stats(mesh, protected_groups)
+    shape_keys = [kb.name for kb in mesh.data.shape_keys.key_blocks] if Common.has_shapekeys(mesh) else []
+    measurement = summarize_polygon_stats(mesh.name, stats, slice(None), shape_keys)
+    measurement['mesh'] = mesh
+    if measurement['protected_tris']:
+        measurement['protected_vertices'] = stats['protected_vertices']
+    return measurement
+
+
+def measure_material_parts(meshes, protected_groups=None):
+    """
+    Measures the meshes the way Common.join_meshes and Common.separate_by_materials would leave them, without applying either.
+    Every material becomes one part. A part only keeps the shape keys that move one of its vertices, like Common.clean_shapekeys does
+
+    :return: list of measurements, one per material. They can't be decimated, they have no mesh
+    """
+    # The joined mesh starts with the last mesh, which is the active one at that point
+    meshes = meshes[-1:] + meshes[:-1]
+    joined_materials = []
+    for mesh in meshes:
+        for mat in mesh.data.materials:
+            if mat not in joined_materials:
+                joined_materials.append(mat)
+
+    parts = {}
+    for mesh in meshes:
+        stats = read_polygon_stats(mesh, protected_groups)
+        materials = list(mesh.data.materials)
+        if materials:
+            part_materials = [materials[index] for index in np.clip(stats['mat_indices'], 0, len(materials) - 1)]
+        else:
+            # Polygons of meshes without materials get the first material of the joined mesh
+            part_materials = [joined_materials[0] if joined_materials else None] * len(stats['mat_indices'])
+        part_materials = np.array([joined_materials.index(mat) if mat in joined_materials else -1 for mat in part_materials], dtype=np.int64)
+
+        moved_keys = get_moved_shape_keys(mesh, stats)
+        for mat_index in np.unique(part_materials).tolist():
+            poly_mask = part_materials == mat_index
+            shape_keys = [name for name, moved_polys in moved_keys if moved_polys[poly_mask].any()]
+            measurement = summarize_polygon_stats('', stats, poly_mask, shape_keys)
+            if mat_index in parts:
+                parts[mat_index] = merge_measurements(parts[mat_index], measurement)
+            else:
+                parts[mat_index] = measurement
+
+    result = []
+    for mat_index in sorted(parts):
+        measurement = parts[mat_index]
+        mat = joined_materials[mat_index] if mat_index >= 0 else None
+        measurement['name'] = getattr(mat, 'name', 'None')
+        # Common.clean_shapekeys also removes the basis if there are no other shape keys left
+        if measurement['shape_keys']:
+            measurement['shape_keys'] = ['Basis'] + measurement['shape_keys']
+        measurement['shapes'] = max(len(measurement['shape_keys']) - 1, 0)
+        result.append(measurement)
+    return result
+
+
+def get_moved_shape_keys(mesh, stats):
+    """
+    Finds the polygons that every shape key moves, mmd_ shape keys are skipped because separating removes them
+
+    :return: list of the shape key name and a bool array with one entry per polygon
+    """
+    if not Common.has_shapekeys(mesh) or not len(stats['loop_totals']):
+        return []
+
+    key_blocks = mesh.data.shape_keys.key_blocks
+    coords = {}
+
+    def get_coords(key_block):
+        if key_block.name not in coords:
+            co = np.empty(len(key_block.data) * 3, dtype=np.float32)
+            key_block.data.foreach_get('co', co)
+            coords[key_block.name] = co.reshape(-1, 3)
+        return coords[key_block.name]
+
+    moved_keys = []
+    for key_block in key_blocks:
+        if 'mmd_' in key_block.name or key_block.relative_key == key_block:
+            continue
+        moved_verts = np.any(get_coords(key_block) != get_coords(key_block.relative_key), axis=1)
+        moved_polys = np.logical_or.reduceat(moved_verts[stats['corner_verts']], stats['first_loops'])
+        moved_keys.append((key_block.name, moved_polys))
+    return moved_keys
+
+
+def merge_measurements(first, second):
+    # Adds up the measurements of two pieces of the same part
+    weight = first['curvature_weight'] + second['curvature_weight']
+    corners = first['corners'] + second['corners']
+    if weight > 0:
+        curvature = (first['curvature'] * first['curvature_weight'] + second['curvature'] * second['curvature_weight']) / weight
+    elif corners:
+        curvature = (first['curvature'] * first['corners'] + second['curvature'] * second['corners']) / corners
+    else:
+        curvature = 0.0
+    merged = dict(first)
+    merged.update({
+        'tris': first['tris'] + second['tris'],
+        'protected_tris': first['protected_tris'] + second['protected_tris'],
+        'shape_keys': first['shape_keys'] + [name for name in second['shape_keys'] if name not in first['shape_keys']],
+        'area': first['area'] + second['area'],
+        'curvature': curvature,
+        'curvature_weight': weight,
+        'corners': corners,
+    })
+    return merged
+
+
+def get_importance(measurement, mean_density):
+    """
+    Small detailed meshes (faces, hands) get a higher importance than large flat ones.
+    The importance is relative, only the ratio between the meshes matters
+    """
+    density = measurement['tris'] / measurement['area'] if measurement['area'] > 0 else mean_density
+    density_factor = sqrt(density / mean_density) if mean_density > 0 else 1
+    return (1 + 4 * measurement['curvature']) * (1 + log1p(measurement['shapes'])) * density_factor
+
+
+def plan_decimation(measurements, budget):
+    """
+    Solves for one decimation ratio per mesh so that the summed tris hit the budget.
+    Each ratio is proportional to the importance of the mesh and capped at 1.
+    Meshes that would be capped are left undecimated and their tris are taken out of the budget.
+    Protected tris are never part of the budget.
+
+    :param measurements: list of dicts from measure_mesh or measure_material_parts
+    :param budget: the amount of tris these meshes are allowed to have after decimation
+    :return: list of ratios in the same order as the measurements
+    """
+    ratios = [1.0] * len(measurements)
+    free_tris = [measurement['tris'] - measurement.get('protected_tris', 0) for measurement in measurements]
+    total_tris = sum(free_tris)
+    if total_tris <= budget:
+        return ratios
+    if budget <= 0:
+        return [0.0] * len(measurements)
+
+    total_area = sum(measurement['area'] for measurement in measurements)
+    mean_density = total_tris / total_area if total_area > 0 else 0
+    importance = [get_importance(measurement, mean_density) for measurement in measurements]
+
+    # Water filling: ratio = scale * importance, with every ratio capped at 1
+    active = [i for i, tris in enumerate(free_tris) if tris > 0]
+    remaining_budget = budget
+    while active:
+        weighted_tris = sum(free_tris[i] * importance[i] for i in active)
+        if weighted_tris <= 0:
+            break
+        scale = remaining_budget / weighted_tris
+        capped = [i for i in active if scale * importance[i] >= 1]
+        if not capped:
+            for i in active:
+                ratios[i] = scale * importance[i]
+            break
+        for i in capped:
+            ratios[i] = 1.0
+            remaining_budget -= free_tris[i]
+            active.remove(i)
+
+    return ratios
@@ -24,12 +24,18 @@
 # Repo: https://github.com/michaeldegroot/cats-blender-plugin
 
 import os
+import re
 import bpy
+import numpy as np
 import copy
+import time
+import struct
 import zipfile
+import posixpath
 import webbrowser
 import addon_utils
 import bpy_extras.io_utils
+from collections import OrderedDict
 
 from .. import globs
 from . import armature_manual
@@ -55,6 +61,7 @@ formats_279 = '*.pm*;*.xps;*.mesh;*.ascii;*.smd;*.qc;*.fbx;*.dae;*.vrm;*.zip'
 formats = '*.pmx;*.pmd;*.xps;*.mesh;*.ascii;*.smd;*.qc;*.qci;*.vta;*.dmx;*.fbx;*.dae;*.vrm;*.zip'
 format_list = formats.replace('*.', '').split(';')
 zip_files = {}
+zip_indexes = {}
 
 
 @register_wrap
@@ -247,35 +254,192 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
 
         # ZIP
         elif file_ending == 'zip':
-            with zipfile.ZipFile(file_path, 'r') as zipObj:
-                global zip_files
-
-                # Check content of zip for importable models
-                for content in zipObj.namelist():
-                    content_name = os.path.basename(content)
-                    content_format = content_name.split('.')[-1]
-                    if content_format.lower() in format_list:
-                        if not zip_files.get(file_path):
-                            zip_files[file_path] = []
-                        zip_files[file_path].append(content)
+            global zip_files
+
+            # Check content of zip for importable models
+            for member in get_zip_index(file_path).values():
+                content_name = os.path.basename(member.filename)
+                content_format = content_name.split('.')[-1]
+                if content_format.lower() in format_list:
+                    if not zip_files.get(file_path):
+                        zip_files[file_path] = []
+                    zip_files[file_path].append(member.filename)
 
     @staticmethod
     def extract_file():
         zip_id = bpy.context.scene.zip_content.split(' ||| ')
         zip_path = zip_id[0]
-        zip_extract_path = '.'.join(zip_path.split('.')[:-1])
-        model_path = encode_str(zip_id[1])
-        model_path_full = os.path.join(zip_extract_path, model_path)
-        model_dir = os.path.dirname(model_path_full)
-        model_file_name = os.path.basename(model_path_full)
+        zip_extract_path = os.path.splitext(zip_path)[0]
+        zip_index = get_zip_index(zip_path)
+        model_member = zip_index[normalize_zip_path(encode_str(zip_id[1]))]
 
-        # Extract the
+        # Only extract the selected model and the files it references, files from earlier imports are reused
         with zipfile.ZipFile(zip_path, 'r') as zipObj:
-            for member in zipObj.infolist():
-                member.filename = encode_str(member.filename)
-                zipObj.extract(member, path=zip_extract_path)
+            model_path_full = extract_zip_member(zipObj, model_member, zip_extract_path)
+            for member in get_referenced_members(zip_index, model_member, model_path_full):
+                extract_zip_member(zipObj, member, zip_extract_path)
+
+        ImportAnyModel.import_file(os.path.dirname(model_path_full), os.path.basename(model_path_full))
+
+
+def normalize_zip_path(path):
+    return posixpath.normpath(path.replace('\\', '/')).lstrip('/').lower()
+
+
+def get_zip_index(zip_path):
+    # The central directory of every zip is only read once and then reused as long as the zip file doesn't change
+    zip_stat = os.stat(zip_path)
+    zip_key = (zip_stat.st_size, zip_stat.st_mtime)
+    cached = zip_indexes.get(zip_path)
+    if cached and cached[0] == zip_key:
+        return cached[1]
+
+    zip_index = OrderedDict()
+    with zipfile.ZipFile(zip_path, 'r') as zipObj:
+        for member in zipObj.infolist():
+            if member.filename.endswith('/'):
+                continue
+            member.filename = encode_str(member.filename)
+            zip_index[normalize_zip_path(member.filename)] = member
+
+    zip_indexes[zip_path] = (zip_key, zip_index)
+    return zip_index
+
+
+def extract_zip_member(zipObj, member, zip_extract_path):
+    # Build the target path the same way zipfile does it
+    parts = [part for part in member.filename.replace('/', os.path.sep).split(os.path.sep) if part not in ('', '.', '..')]
+    target_path = os.path.join(zip_extract_path, *parts)
+    member_time = time.mktime(member.date_time + (0, 0, -1))
+
+    # Reuse files that were already extracted by an earlier import
+    if os.path.isfile(target_path) \
+            and os.path.getsize(target_path) == member.file_size \
+            and int(os.path.getmtime(target_path)) == int(member_time):
+        return target_path
+
+    target_path = zipObj.extract(member, path=zip_extract_path)
+    os.utime(target_path, (member_time, member_time))
+    return target_path
 
-        ImportAnyModel.import_file(model_dir, model_file_name)
+
+def get_referenced_members(zip_index, model_member, model_path_full):
+    model_key = normalize_zip_path(model_member.filename)
+    model_dir = posixpath.dirname(model_key)
+
+    references = None
+    if model_key.endswith('.pmx'):
+        references = get_pmx_texture_paths(model_path_full)
+    if references is None:
+        references = scan_file_references(model_path_full)
+
+    members_by_name = {}
+    for key in zip_index.keys():
+        members_by_name.setdefault(posixpath.basename(key), []).append(key)
+
+    keys = []
+    for reference in references:
+        key = resolve_zip_reference(zip_index, members_by_name, model_dir, reference)
+        if key and key != model_key and key not in keys:
+            keys.append(key)
+
+    # FBX files can store their textures in a sidecar folder next to them
+    if model_key.endswith('.fbx'):
+        fbm_dir = posixpath.splitext(model_key)[0] + '.fbm/'
+        keys += [key for key in zip_index.keys() if key.startswith(fbm_dir) and key not in keys]
+
+    return [zip_index[key] for key in keys]
+
+
+def resolve_zip_reference(zip_index, members_by_name, model_dir, reference):
+    reference = reference.replace('\\', '/').strip()
+    if not reference:
+        return None
+
+    # References are usually relative to the model file
+    key = normalize_zip_path(posixpath.join(model_dir, reference))
+    if key in zip_index:
+        return key
+
+    # Otherwise look for the file name anywhere in the zip and prefer the one closest to the model.
+    # Scanned references can contain leading garbage, so shorten the name until it matches
+    name = posixpath.basename(reference).lower()
+    while name and not name.startswith('.'):
+        candidates = members_by_name.get(name)
+        if candidates:
+            return max(candidates, key=lambda candidate: len(os.path.commonprefix([candidate, model_dir + '/'])))
+        name = name[1:]
+    return None
+
+
+def get_pmx_texture_paths(file_path):
+    # Reads the texture table of a pmx file without loading the whole model. Returns None if the file can't be read
+    try:
+        with open(file_path, 'rb') as file:
+            data = file.read()
+        if data[:4] != b'PMX ':
+            return None
+
+        offset = 8
+        globals_count = data[offset]
+        pmx_globals = data[offset + 1:offset + 1 + globals_count]
+        offset += 1 + globals_count
+        encoding = 'utf-16-le' if pmx_globals[0] == 0 else 'utf-8'
+        additional_uvs = pmx_globals[1]
+        vertex_index_size = pmx_globals[2]
+        bone_index_size = pmx_globals[5]
+
+        def read_text():
+            nonlocal offset
+            length = struct.unpack_from('<i', data, offset)[0]
+            text = data[offset + 4:offset + 4 + length].decode(encoding, errors='replace')
+            offset += 4 + length
+            return text
+
+        # Model name and comments
+        for _ in range(4):
+            read_text()
+
+        # Vertices have a variable size, depending on their weight type
+        weight_sizes = {
+            0: bone_index_size,
+            1: bone_index_size * 2 + 4,
+            2: bone_index_size * 4 + 16,
+            3: bone_index_size * 2 + 4 + 36,
+            4: bone_index_size * 4 + 16,
+        }
+        vertex_base_size = 32 + 16 * additional_uvs
+        vertex_count = struct.unpack_from('<i', data, offset)[0]
+        offset += 4
+        for _ in range(vertex_count):
+            offset += vertex_base_size
+            offset += 1 + weight_sizes[data[offset]] + 4
+
+        face_count = struct.unpack_from('<i', data, offset)[0]
+        offset += 4 + face_count * vertex_index_size
+
+        texture_count = struct.unpack_from('<i', data, offset)[0]
+        offset += 4
+        return [read_text() for _ in range(texture_count)]
+    except (OSError, IndexError, KeyError, struct.error):
+        return None
+
+
+reference_pattern = re.compile(rb'[^\x00-\x1f"\'<>|*?:]{1,255}?\.(?:png|jpe?g|bmp|tga|dds|gif|tiff?|spa|sph|psd|smd|vta|dmx|qci)(?![a-z0-9])', re.IGNORECASE)
+
+
+def scan_file_references(file_path):
+    # Finds everything that looks like a texture or sidecar file name in the model file
+    with open(file_path, 'rb') as file:
+        data = file.read()
+
+    references = []
+    for match in set(reference_pattern.findall(data)):
+        try:
+            references.append(match.decode('utf8'))
+        except UnicodeDecodeError:
+            references.append(match.decode('cp932', errors='replace'))
+    return references
 
 
 def fix_bone_orientations(armature):
@@ -796,11 +960,15 @@ _mat_list = []
 _broken_shapes = []
 _textures_found = False
 _eye_meshes_not_named_body = []
+_export_report = None
 
 max_mats = 4
 max_tris = 70000
 max_meshes_light = 2
 max_meshes_hard = 8
+max_bone_weights = 4
+max_uv_layers = 8
+max_shape_delta_factor = 10  # Times the bounding box diagonal of the mesh
 
 
 @register_wrap
@@ -821,16 +989,19 @@ class ExportModel(bpy.types.Operator):
 
         # Check for warnings
         if not self.action == 'NO_CHECK':
-            global _meshes_count, _tris_count, _mat_list, _broken_shapes, _textures_found, _eye_meshes_not_named_body
+            global _meshes_count, _tris_count, _mat_list, _broken_shapes, _textures_found, _eye_meshes_not_named_body, _export_report
 
             # Reset export checks
             _meshes_count = 0
             _tris_count = 0
             _mat_list = []
-            _broken_shapes = []
             _textures_found = False
             _eye_meshes_not_named_body = []
 
+            # Check the geometry, shapekeys and weights of every vertex
+            _export_report = validate_meshes(meshes, Common.get_armature())
+            _broken_shapes = [shapekey + ' (' + mesh_name + ': ' + issue + ')' for mesh_name, shapekey, issue in _export_report['broken_shapes']]
+
             body_extists = False
             for mesh in meshes:
                 if mesh.name == 'Body':
@@ -864,20 +1035,6 @@ class ExportModel(bpy.types.Operator):
                             # TODO
 
                 if Common.has_shapekeys(mesh):
-                    # Check if there are broken shapekeys
-                    for shapekey in mesh.data.shape_keys.key_blocks[1:]:
-                        vert_count = 0
-                        for vert in shapekey.data:
-                            vert_count += 1
-                            for coord in vert.co:
-                                if coord >= 10000:
-                                    _broken_shapes.append(shapekey.name)
-                                    vert_count = 1000
-                                    break
-                            # Only check the first 10 vertices of this shapekey
-                            if vert_count == 1000:
-                                break
-
                     # Check if there are meshes with eye tracking, but are not named Body
                     if not body_extists:
                         for shapekey in mesh.data.shape_keys.key_blocks[1:]:
@@ -891,6 +1048,8 @@ class ExportModel(bpy.types.Operator):
                     or _tris_count > max_tris \
                     or len(_mat_list) > max_mats \
                     or len(_broken_shapes) > 0 \
+                    or _export_report['unweighted_vertices'] \
+                    or _export_report['uv_layers'] \
                     or not _textures_found and Settings.get_embed_textures()\
                     or len(_eye_meshes_not_named_body) > 0:
                 bpy.ops.cats_importer.display_error('INVOKE_DEFAULT')
@@ -901,36 +1060,9 @@ class ExportModel(bpy.types.Operator):
         # Monkey patch FBX exporter again to import empty shape keys
         Fbx_patch.patch_fbx_exporter()
 
-        # Check if copy protection is enabled
-        mesh_smooth_type = 'OFF'
-        protected_export = False
-        for mesh in meshes:
-            if protected_export:
-                break
-            if Common.has_shapekeys(mesh):
-                for shapekey in mesh.data.shape_keys.key_blocks:
-                    if shapekey.name == 'Basis Original':
-                        protected_export = True
-                        break
-        if protected_export:
-            mesh_smooth_type = 'FACE'
-
-        # Check if textures are found and if they should be embedded
-        path_mode = 'AUTO'
-        if _textures_found and Settings.get_embed_textures():
-            path_mode = 'COPY'
-
         # Open export window
         try:
-            bpy.ops.export_scene.fbx('INVOKE_DEFAULT',
-                                     object_types={'EMPTY', 'ARMATURE', 'MESH', 'OTHER'},
-                                     use_mesh_modifiers=False,
-                                     add_leaf_bones=False,
-                                     bake_anim=False,
-                                     apply_scale_options='FBX_SCALE_ALL',
-                                     path_mode=path_mode,
-                                     embed_textures=True,
-                                     mesh_smooth_type=mesh_smooth_type)
+            bpy.ops.export_scene.fbx('INVOKE_DEFAULT', **get_fbx_export_settings(meshes, _textures_found))
         except (TypeError, ValueError):
             bpy.ops.export_scene.fbx('INVOKE_DEFAULT')
         except AttributeError:
@@ -939,6 +1071,119 @@ class ExportModel(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def get_fbx_export_settings(meshes, textures_found):
+    # The settings for the FBX exporter that work best in Unity
+    # Check if copy protection is enabled
+    mesh_smooth_type = 'OFF'
+    protected_export = False
+    for mesh in meshes:
+        if protected_export:
+            break
+        if Common.has_shapekeys(mesh):
+            for shapekey in mesh.data.shape_keys.key_blocks:
+                if shapekey.name == 'Basis Original':
+                    protected_export = True
+                    break
+    if protected_export:
+        mesh_smooth_type = 'FACE'
+
+    # Check if textures are found and if they should be embedded
+    path_mode = 'AUTO'
+    if textures_found and Settings.get_embed_textures():
+        path_mode = 'COPY'
+
+    return {
+        'object_types': {'EMPTY', 'ARMATURE', 'MESH', 'OTHER'},
+        'use_mesh_modifiers': False,
+        'add_leaf_bones': False,
+        'bake_anim': False,
+        'apply_scale_options': 'FBX_SCALE_ALL',
+        'path_mode': path_mode,
+        'embed_textures': True,
+        'mesh_smooth_type': mesh_smooth_type,
+    }
+
+
+def validate_meshes(meshes, armature=None):
+    """
+    Checks every vertex of the meshes for issues that break the model in Unity.
+
+    :param meshes: the mesh objects to check
+    :param armature: the armature the meshes are weighted to. Weights are only checked if it is given
+    :return: dict with the found issues:
+        'broken_shapes': list of (mesh name, shapekey name, issue) for shapekeys with invalid values or offsets from their basis
+                         of more than max_shape_delta_factor times the size of the mesh
+        'empty_shapes': list of (mesh name, shapekey name) for shapekeys that are identical to their basis
+        'unweighted_vertices': dict of mesh name: number of vertices without any bone weight
+        'overweighted_vertices': dict of mesh name: number of vertices weighted to more than max_bone_weights bones
+        'uv_layers': dict of mesh name: number of uv maps, for meshes with more than max_uv_layers
+    """
+    report = {
+        'broken_shapes': [],
+        'empty_shapes': [],
+        'unweighted_vertices': {},
+        'overweighted_vertices': {},
+        'uv_layers': {},
+    }
+    bone_names = {bone.name for bone in armature.data.bones if bone.use_deform} if armature else set()
+
+    for mesh in meshes:
+        vert_count = len(mesh.data.vertices)
+
+        if len(mesh.data.uv_layers) > max_uv_layers:
+            report['uv_layers'][mesh.name] = len(mesh.data.uv_layers)
+
+        if Common.has_shapekeys(mesh):
+            key_blocks = mesh.data.shape_keys.key_blocks
+            basis_names = {key.relative_key.name for key in key_blocks}
+            coords = {}
+
+            def get_coords(key_block):
+                if key_block.name not in coords:
+                    co = np.empty(vert_count * 3, dtype=np.float32)
+                    key_block.data.foreach_get('co', co)
+                    coords[key_block.name] = co
+                return coords[key_block.name]
+
+            # The limit scales with the mesh, so that it also catches broken shapekeys of small models
+            max_delta = 0
+            if vert_count:
+                basis = get_coords(key_blocks[0]).reshape(-1, 3)
+                basis = basis[np.isfinite(basis).all(axis=1)]
+                diagonal = float(np.linalg.norm(basis.max(axis=0) - basis.min(axis=0))) if len(basis) else 0
+                max_delta = max_shape_delta_factor * max(diagonal, 0.001)
+
+            for shapekey in key_blocks[1:]:
+                co = get_coords(shapekey)
+                basis_co = get_coords(shapekey.relative_key)
+                if not np.isfinite(co).all():
+                    report['broken_shapes'].append((mesh.name, shapekey.name, 'invalid values'))
+                elif co.size and np.abs(co - basis_co).max() > max_delta:
+                    report['broken_shapes'].append((mesh.name, shapekey.name, 'extreme values'))
+                elif np.array_equal(co, basis_co):
+                    report['empty_shapes'].append((mesh.name, shapekey.name))
+
+                # Only keep the coordinates that are needed as a basis by other shapekeys
+                if shapekey.name not in basis_names:
+                    coords.pop(shapekey.name, None)
+
+        if bone_names and vert_count:
+            # Count the bones with a non zero weight of every vertex
+            is_bone = np.array([group.name in bone_names for group in mesh.vertex_groups] + [False], dtype=bool)
+            vert_indices, group_indices, weights = Common.get_weight_arrays(mesh)
+            weighted = is_bone[group_indices] & (weights > 0)
+            bone_counts = np.bincount(vert_indices[weighted], minlength=vert_count)
+
+            unweighted = int(np.count_nonzero(bone_counts == 0))
+            if unweighted:
+                report['unweighted_vertices'][mesh.name] = unweighted
+            overweighted = int(np.count_nonzero(bone_counts > max_bone_weights))
+            if overweighted:
+                report['overweighted_vertices'][mesh.name] = overweighted
+
+    return report
+
+
 @register_wrap
 class ErrorDisplay(bpy.types.Operator):
     bl_idname = "cats_importer.display_error"
@@ -952,6 +1197,7 @@ class ErrorDisplay(bpy.types.Operator):
     broken_shapes = []
     textures_found = False
     eye_meshes_not_named_body = []
+    export_report = None
 
     def execute(self, context):
         return {'FINISHED'}
@@ -965,6 +1211,7 @@ class ErrorDisplay(bpy.types.Operator):
         self.broken_shapes = _broken_shapes
         self.textures_found = _textures_found
         self.eye_meshes_not_named_body = _eye_meshes_not_named_body
+        self.export_report = _export_report
 
         dpi_value = Common.get_user_preferences().system.dpi
         return context.window_manager.invoke_props_dialog(self, width=dpi_value * 6.1)
@@ -1087,6 +1334,84 @@ class ErrorDisplay(bpy.types.Operator):
             col.separator()
             col.separator()
 
+        if self.export_report and self.export_report['unweighted_vertices']:
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="Unweighted vertices!", icon='ERROR')
+            col.separator()
+
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="These meshes have vertices that are not weighted to any bone:")
+            col.separator()
+
+            for mesh_name, count in self.export_report['unweighted_vertices'].items():
+                row = col.row(align=True)
+                row.scale_y = 0.75
+                row.label(text="  - " + mesh_name + ": " + str(count) + " vertices")
+
+            col.separator()
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="These vertices will not move with the armature in Unity.")
+            col.separator()
+            col.separator()
+            col.separator()
+
+        if self.export_report and self.export_report['overweighted_vertices']:
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="Too many bone weights!", icon='INFO')
+            col.separator()
+
+            for mesh_name, count in self.export_report['overweighted_vertices'].items():
+                row = col.row(align=True)
+                row.scale_y = 0.75
+                row.label(text="  - " + mesh_name + ": " + str(count) + " vertices have more than " + str(max_bone_weights) + " bone weights")
+
+            col.separator()
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="Unity only keeps the " + str(max_bone_weights) + " strongest weights of each vertex.")
+            col.separator()
+            col.separator()
+            col.separator()
+
+        if self.export_report and self.export_report['uv_layers']:
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="Too many UV maps!", icon='ERROR')
+            col.separator()
+
+            for mesh_name, count in self.export_report['uv_layers'].items():
+                row = col.row(align=True)
+                row.scale_y = 0.75
+                row.label(text="  - " + mesh_name + ": " + str(count) + " UV maps")
+
+            col.separator()
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="Unity only supports up to " + str(max_uv_layers) + " UV maps per mesh.")
+            col.separator()
+            col.separator()
+            col.separator()
+
+        if self.export_report and self.export_report['empty_shapes']:
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="Empty shapekeys", icon='INFO')
+            col.separator()
+
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="This model has " + str(len(self.export_report['empty_shapes'])) + " shapekey(s) that don't change anything.")
+            row = col.row(align=True)
+            row.scale_y = 0.75
+            row.label(text="This is not an issue, but they can be removed to reduce the file size.")
+            col.separator()
+            col.separator()
+            col.separator()
+
         if not self.textures_found and Settings.get_embed_textures():
             row = col.row(align=True)
             row.scale_y = 0.75
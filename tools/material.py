@@ -29,6 +29,14 @@
 
 import os
 import bpy
+import json
+import time
+import queue
+import hashlib
+import tempfile
+import numpy as np
+from threading import Thread
+from subprocess import Popen, PIPE, DEVNULL
 
 from . import common as Common
 from .register import register_wrap
@@ -169,159 +177,22 @@ class CombineMaterialsButton(bpy.types.Operator):
             return False
         return len(Common.get_meshes_objects(check=False)) > 0
 
-    def assignmatslots(self, ob, matlist):
-        scn = bpy.context.scene
-        ob_active = Common.get_active()
-        Common.set_active(ob)
-
-        for s in ob.material_slots:
-            bpy.ops.object.material_slot_remove()
-
-        i = 0
-        for m in matlist:
-            mat = bpy.data.materials[m]
-            ob.data.materials.append(mat)
-            i += 1
-
-        Common.set_active(ob_active)
-
-    def cleanmatslots(self):
-        objs = bpy.context.selected_editable_objects
-
-        for ob in objs:
-            if ob.type == 'MESH':
-                mats = ob.material_slots.keys()
-
-                usedMatIndex = []
-                faceMats = []
-                me = ob.data
-                for f in me.polygons:
-                    faceindex = f.material_index
-                    if faceindex >= len(mats):
-                        continue
-
-                    currentfacemat = mats[faceindex]
-                    faceMats.append(currentfacemat)
-
-                    found = 0
-                    for m in usedMatIndex:
-                        if m == faceindex:
-                            found = 1
-
-                    if found == 0:
-                        usedMatIndex.append(faceindex)
-
-                ml = []
-                mnames = []
-                for u in usedMatIndex:
-                    ml.append(mats[u])
-                    mnames.append(mats[u])
-
-                self.assignmatslots(ob, ml)
-
-                i = 0
-                for f in me.polygons:
-                    if i >= len(faceMats):
-                        continue
-                    matindex = mnames.index(faceMats[i])
-                    f.material_index = matindex
-                    i += 1
-
-    # Iterates over each material slot and hashes combined image filepaths and material settings
+    # Iterates over each material slot and hashes the material structure and settings once per material
     # Then uses this hash as the dict keys and material data as values
     def generate_combined_tex(self):
         self.combined_tex = {}
+        material_hashes = {}
         for ob in Common.get_meshes_objects():
             for index, mat_slot in enumerate(ob.material_slots):
-                hash_this = ''
-
-                if Common.version_2_79_or_older():
-                    if mat_slot.material:
-                        for tex_index, mtex_slot in enumerate(mat_slot.material.texture_slots):
-                            if mtex_slot:
-                                if mat_slot.material.use_textures[tex_index]:
-                                    if hasattr(mtex_slot.texture, 'image') and bpy.data.materials[mat_slot.name].use_textures[tex_index] and mtex_slot.texture.image:
-                                        hash_this += mtex_slot.texture.image.filepath   # Filepaths makes the hash unique
-                        hash_this += str(mat_slot.material.alpha)           # Alpha setting on material makes the hash unique
-                        hash_this += str(mat_slot.material.diffuse_color)   # Diffuse color makes the hash unique
-                        # hash_this += str(mat_slot.material.specular_color)  # Specular color makes the hash unique  # Specular Color is no used by Unity
-
-                    # print('---------------------------------------------------')
-                    # print(mat_slot.name, hash_this)
-
-                    # Now create or add to the dict key that has this hash value
-                    if hash_this not in self.combined_tex:
-                        self.combined_tex[hash_this] = []
-                    self.combined_tex[hash_this].append({'mat': mat_slot.name, 'index': index})
-
-                else:
-                    hash_this = ''
-                    ignore_nodes = ['Material Output', 'mmd_tex_uv', 'Cats Export Shader']
-
-                    if mat_slot.material and mat_slot.material.node_tree:
-                        # print('MAT: ', mat_slot.material.name)
-                        nodes = mat_slot.material.node_tree.nodes
-                        for node in nodes:
-
-                            # Skip certain known nodes
-                            ignore_this_node = False
-                            for name in ignore_nodes:
-                                if name in node.name or name in node.label:
-                                    ignore_this_node = True
-                                    break
-                            if ignore_this_node:
-                                continue
-                            # Add images to hash and skip toon and shpere textures
-                            if node.type == 'TEX_IMAGE':
-                                image = node.image
-                                if 'toon' in node.name or 'sphere' in node.name:
-                                    nodes.remove(node)
-                                    continue
-                                if not image:
-                                    nodes.remove(node)
-                                    continue
-                                # print('  ', node.name)
-                                # print('    ', image.name)
-                                hash_this += node.name + image.name
-                                continue
-                            # Skip nodes with no input
-                            if not node.inputs:
-                                continue
-
-                            # On MMD models only add diffuse and transparency to the hash
-                            if node.name == 'mmd_shader':
-                                # print('  ', node.name)
-                                # print('    ', node.inputs['Diffuse Color'].default_value[:])
-                                # print('    ', node.inputs['Alpha'].default_value)
-                                hash_this += node.name\
-                                             + str(node.inputs['Diffuse Color'].default_value[:])\
-                                             + str(node.inputs['Alpha'].default_value)
-                                continue
-
-                            # Add all other nodes to the hash
-                            # print('  ', node.name)
-                            hash_this += node.name
-                            for input, value in node.inputs.items():
-                                if hasattr(value, 'default_value'):
-                                    try:
-                                        # print('    ', input, value.default_value[:])
-                                        hash_this += str(value.default_value[:])
-                                    except TypeError:
-                                        # print('    ', input, value.default_value)
-                                        hash_this += str(value.default_value)
-                                else:
-                                    # print('    ', input, 'name:', value.name)
-                                    hash_this += value.name
-
-                    # Now create or add to the dict key that has this hash value
-                    if hash_this not in self.combined_tex:
-                        self.combined_tex[hash_this] = []
-                    self.combined_tex[hash_this].append({'mat': mat_slot.name, 'index': index})
-
-        # for key, value in self.combined_tex.items():
-        #     print(key)
-        #     for mat in value:
-        #         print(mat)
+                mat = mat_slot.material
+                if mat not in material_hashes:
+                    material_hashes[mat] = get_material_hash(mat)
+                hash_this = material_hashes[mat]
+
+                # Now create or add to the dict key that has this hash value
+                if hash_this not in self.combined_tex:
+                    self.combined_tex[hash_this] = []
+                self.combined_tex[hash_this].append({'mat': mat_slot.name, 'index': index})
 
     def execute(self, context):
         print('COMBINE MATERIALS!')
@@ -332,44 +203,18 @@ class CombineMaterialsButton(bpy.types.Operator):
         Common.switch('OBJECT')
         i = 0
 
-        for index, mesh in enumerate(Common.get_meshes_objects()):
-
-            Common.unselect_all()
-            Common.set_active(mesh)
-            for file in self.combined_tex:  # for each combined mat slot of scene object
-                combined_textures = self.combined_tex[file]
-
-                # Combining material slots that are similar with only themselves are useless
-                if len(combined_textures) <= 1:
-                    continue
-                i += len(combined_textures)
-
-                # print('NEW', file, combined_textures, len(combined_textures))
-                Common.switch('EDIT')
-                bpy.ops.mesh.select_all(action='DESELECT')
-
-                # print('UNSELECT ALL')
-                for mat in mesh.material_slots:  # for each scene object material slot
-                    for tex in combined_textures:
-                        if mat.name == tex['mat']:
-                            mesh.active_material_index = tex['index']
-                            bpy.ops.object.material_slot_select()
-                            # print('SELECT', tex['mat'], tex['index'])
-
-                bpy.ops.object.material_slot_assign()
-                # print('ASSIGNED TO SLOT INDEX', bpy.context.object.active_material_index)
-                bpy.ops.mesh.select_all(action='DESELECT')
+        # Every material name gets mapped to the first material name with the same hash
+        combined_names = {}
+        for combined_textures in self.combined_tex.values():
+            for tex in combined_textures:
+                combined_names[tex['mat']] = combined_textures[0]['mat']
 
-            Common.unselect_all()
-            Common.set_active(mesh)
-            Common.switch('OBJECT')
-            self.cleanmatslots()
+        for mesh in Common.get_meshes_objects():
+            i += remap_material_slots(mesh, combined_names)
 
             # Clean material names
             Common.clean_material_names(mesh)
 
-            # print('CLEANED MAT SLOTS')
-
         # Update the material list of the Material Combiner
         Common.update_material_list()
 
@@ -383,6 +228,125 @@ class CombineMaterialsButton(bpy.types.Operator):
         return{'FINISHED'}
 
 
+def get_material_hash(mat):
+    """
+    Hashes the structure and settings of a material, so that visibly identical materials get the same hash.
+    Toon and sphere texture nodes as well as texture nodes without images get removed from the material.
+    """
+    if not mat:
+        return None
+
+    if Common.version_2_79_or_older():
+        hash_this = []
+        for tex_index, mtex_slot in enumerate(mat.texture_slots):
+            if mtex_slot and mat.use_textures[tex_index]:
+                if hasattr(mtex_slot.texture, 'image') and mtex_slot.texture.image:
+                    hash_this.append(mtex_slot.texture.image.filepath)  # Filepaths makes the hash unique
+        hash_this.append(mat.alpha)                                     # Alpha setting on material makes the hash unique
+        hash_this.append(tuple(mat.diffuse_color))                      # Diffuse color makes the hash unique
+        return tuple(hash_this)
+
+    if not mat.node_tree:
+        return ()
+
+    ignore_nodes = ['Material Output', 'mmd_tex_uv', 'Cats Export Shader']
+    nodes = mat.node_tree.nodes
+    hashed_nodes = []
+    node_names = set()
+    for node in list(nodes):
+
+        # Skip certain known nodes
+        if any(name in node.name or name in node.label for name in ignore_nodes):
+            continue
+
+        # Add images to hash and skip toon and shpere textures
+        if node.type == 'TEX_IMAGE':
+            image = node.image
+            if 'toon' in node.name or 'sphere' in node.name or not image:
+                nodes.remove(node)
+                continue
+            hashed_nodes.append((node.name, node.type, image.name))
+            node_names.add(node.name)
+            continue
+
+        # Skip nodes with no input
+        if not node.inputs:
+            continue
+        node_names.add(node.name)
+
+        # On MMD models only add diffuse and transparency to the hash
+        if node.name == 'mmd_shader':
+            hashed_nodes.append((node.name, node.type,
+                                 tuple(node.inputs['Diffuse Color'].default_value[:]),
+                                 node.inputs['Alpha'].default_value))
+            continue
+
+        # Add all other nodes to the hash
+        values = []
+        for value in node.inputs.values():
+            if hasattr(value, 'default_value'):
+                try:
+                    values.append(tuple(value.default_value[:]))
+                except TypeError:
+                    values.append(value.default_value)
+            else:
+                values.append(value.name)
+        hashed_nodes.append((node.name, node.type, tuple(values)))
+
+    # The node tree topology between the hashed nodes
+    links = []
+    for link in mat.node_tree.links:
+        if link.from_node.name in node_names and link.to_node.name in node_names:
+            links.append((link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier))
+
+    return tuple(sorted(hashed_nodes, key=lambda x: x[0])), tuple(sorted(links))
+
+
+def remap_material_slots(mesh, combined_names):
+    """
+    Reassigns the polygons of combined materials to a single slot and removes all unused material slots.
+    The material indices of all polygons are rewritten at once, no edit mode is needed.
+
+    :param mesh: the mesh object
+    :param combined_names: dict mapping a material name to the name of the material it gets combined into
+    :return: the amount of removed material slots
+    """
+    me = mesh.data
+    materials = list(me.materials)
+    slot_count = len(materials)
+    if slot_count == 0:
+        return 0
+
+    # Map each slot to the first slot that holds the same combined material
+    first_slots = {}
+    slot_map = np.arange(slot_count, dtype=np.int32)
+    for index, mat in enumerate(materials):
+        name = mat.name if mat else None
+        key = combined_names.get(name, name)
+        slot_map[index] = first_slots.setdefault(key, index)
+
+    # Remove slots that are no longer used by any polygon
+    mat_indices = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get('material_index', mat_indices)
+    mat_indices = slot_map[np.clip(mat_indices, 0, slot_count - 1)]
+    used_slots = np.unique(mat_indices)
+    compact_map = np.zeros(slot_count, dtype=np.int32)
+    compact_map[used_slots] = np.arange(used_slots.size, dtype=np.int32)
+
+    removed = slot_count - used_slots.size
+    if removed == 0 and np.array_equal(slot_map, np.arange(slot_count)):
+        return 0
+
+    for _ in range(slot_count):
+        me.materials.pop()
+    for index in used_slots:
+        me.materials.append(materials[index])
+    me.polygons.foreach_set('material_index', compact_map[mat_indices])
+    me.update()
+
+    return removed
+
+
 @register_wrap
 class ConvertAllToPngButton(bpy.types.Operator):
     bl_idname = 'cats_material.convert_all_to_png'
@@ -395,28 +359,129 @@ class ConvertAllToPngButton(bpy.types.Operator):
     # Inspired by:
     # https://cdn.discordapp.com/attachments/387450722410561547/526638724570677309/BlenderImageconvert.png
 
+    _timer = None
+    _jobs = None
+    _pool = None
+    _manifest = None
+    _done = 0
+    _failed = None
+    _skipped = 0
+
     @classmethod
     def poll(cls, context):
         return bpy.data.images
 
     def execute(self, context):
-        images_to_convert = self.get_convert_list()
-
-        if images_to_convert:
-            current_step = 0
-            wm = bpy.context.window_manager
-            wm.progress_begin(current_step, len(images_to_convert))
-
-            for image in images_to_convert:
-                self.convert(image)
-                current_step += 1
-                wm.progress_update(current_step)
+        self._manifest = load_png_manifest()
+        self._jobs = []
+        self._done = 0
+        self._failed = []
+        self._skipped = 0
+
+        # Group the images by their source file and skip every file whose png is already up to date
+        jobs_by_path = {}
+        for image in self.get_convert_list():
+            tex_path = bpy.path.abspath(image.filepath)
+            job = jobs_by_path.get(tex_path)
+            if job:
+                job[2].append(image.name)
+                continue
+            tex_path_new = os.path.splitext(tex_path)[0] + '.png'
+            job = jobs_by_path[tex_path] = (tex_path, tex_path_new, [image.name])
+            if png_up_to_date(self._manifest, tex_path, tex_path_new):
+                print('UP TO DATE:', tex_path_new)
+                self.rebind(job)
+                self._skipped += 1
+                continue
+            self._jobs.append(job)
+
+        if not self._jobs:
+            return self.finish(context)
+
+        try:
+            self._pool = PngConversionPool(self._jobs)
+        except OSError as e:
+            print('Could not start the texture conversion workers, converting in Blender instead:', e)
+            self._pool = None
+
+        wm = context.window_manager
+        wm.progress_begin(0, len(self._jobs))
+
+        if not self._pool:
+            for job in self._jobs:
+                self.convert(job)
+                self.job_done(job, True)
+                wm.progress_update(self._done)
+            return self.finish(context)
+
+        # Without a window there are no timer events, so the results are waited for here
+        if bpy.app.background or not context.window:
+            while self.collect_results(context):
+                time.sleep(0.1)
+            return self.finish(context)
+
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._pool.terminate()
+            self.finish(context)
+            return {'CANCELLED'}
 
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self.collect_results(context):
+            return {'PASS_THROUGH'}
+        return self.finish(context)
+
+    def collect_results(self, context):
+        # Rebinds the images of every finished job, this has to happen on the main thread.
+        # Returns whether the workers are still running
+        for index, success, message in self._pool.get_results():
+            job = self._jobs[index]
+            if not success:
+                print('FAILED:', job[0], message)
+            self.job_done(job, success)
+        context.window_manager.progress_update(self._done + len(self._failed))
+
+        if self._pool.running():
+            return True
+
+        # Jobs of a crashed worker never report back
+        for index in self._pool.unreported():
+            self._failed.append(self._jobs[index][0])
+        return False
+
+    def finish(self, context):
+        wm = context.window_manager
+        if self._timer:
+            wm.event_timer_remove(self._timer)
+            self._timer = None
+        if self._jobs:
             wm.progress_end()
-
-        self.report({'INFO'}, 'Converted ' + str(len(images_to_convert)) + ' to PNG files.')
+        save_png_manifest(self._manifest)
+
+        message = 'Converted ' + str(self._done) + ' to PNG files.'
+        if self._skipped:
+            message += ' ' + str(self._skipped) + ' were already up to date.'
+        if self._failed:
+            message += ' ' + str(len(self._failed)) + ' failed, see the console for details.'
+            self.report({'WARNING'}, message)
+        else:
+            self.report({'INFO'}, message)
         return {'FINISHED'}
 
+    def job_done(self, job, success):
+        if not success or not os.path.isfile(job[1]):
+            self._failed.append(job[0])
+            return
+        update_png_manifest(self._manifest, job[0], job[1])
+        self.rebind(job)
+        self._done += 1
+
     def get_convert_list(self):
         images_to_convert = []
         for image in bpy.data.images:
@@ -428,42 +493,197 @@ class ConvertAllToPngButton(bpy.types.Operator):
             images_to_convert.append(image)
         return images_to_convert
 
-    def convert(self, image):
-        # Set the new image file name
-        image_name = image.name
-        print(image_name)
-        image_name_new = ''
-        for s in image_name.split('.')[0:-1]:
-            image_name_new += s + '.'
-        image_name_new += 'png'
-        print(image_name_new)
-
-        # Set the new image file path
-        tex_path = bpy.path.abspath(image.filepath)
-        print(tex_path)
-        tex_path_new = ''
-        for s in tex_path.split('.')[0:-1]:
-            tex_path_new += s + '.'
-        tex_path_new += 'png'
-        print(tex_path_new)
+    @staticmethod
+    def rebind(job):
+        # Exchange the old images in blender for the new one
+        tex_path_new = job[1]
+        for image_name in job[2]:
+            image = bpy.data.images.get(image_name)
+            if not image:
+                continue
+            image.filepath = tex_path_new
+            image.name = os.path.splitext(image_name)[0] + '.png'
+
+    @staticmethod
+    def convert(job):
+        # Fallback if no worker processes can be started, saves the png from within this Blender instance
+        image = bpy.data.images[job[2][0]]
+        scene = bpy.context.scene
 
         # Save the Color Management View Transform and change it to Standard, as any other would screw with the colors
-        view_transform = bpy.context.scene.view_settings.view_transform
-        bpy.context.scene.view_settings.view_transform = 'Default' if Common.version_2_79_or_older() else 'Standard'
+        view_transform = scene.view_settings.view_transform
+        scene.view_settings.view_transform = 'Default' if Common.version_2_79_or_older() else 'Standard'
 
         # Save the image as a new png file
-        scene = bpy.context.scene
-        scene.render.image_settings.file_format = 'PNG'
-        scene.render.image_settings.color_mode = 'RGBA'
-        scene.render.image_settings.color_depth = '16'
-        scene.render.image_settings.compression = 100
-        image.save_render(tex_path_new, scene=scene)  # TODO: FInd out how to use image.save here, to prevent anything from changing the colors
+        set_png_settings(scene)
+        image.save_render(job[1], scene=scene)  # TODO: FInd out how to use image.save here, to prevent anything from changing the colors
 
         # Change the view transform back
-        bpy.context.scene.view_settings.view_transform = view_transform
+        scene.view_settings.view_transform = view_transform
+
 
-        # Exchange the old image in blender for the new one
-        bpy.data.images[image_name].filepath = tex_path_new
-        bpy.data.images[image_name].name = image_name_new
+def set_png_settings(scene):
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.image_settings.color_mode = 'RGBA'
+    scene.render.image_settings.color_depth = '16'
+    scene.render.image_settings.compression = 100
 
-        return True
+
+# This runs inside of a background Blender process. It gets the path of a json job list
+# and reports every finished job on stdout, so that the main Blender instance can pick it up
+png_worker_script = '''
+import bpy
+import sys
+import json
+
+with open(sys.argv[sys.argv.index('--') + 1], encoding='utf8') as file:
+    jobs = json.load(file)
+
+scene = bpy.context.scene
+scene.view_settings.view_transform = 'Default' if bpy.app.version < (2, 80, 0) else 'Standard'
+scene.render.image_settings.file_format = 'PNG'
+scene.render.image_settings.color_mode = 'RGBA'
+scene.render.image_settings.color_depth = '16'
+scene.render.image_settings.compression = 100
+
+for index, tex_path, tex_path_new in jobs:
+    try:
+        image = bpy.data.images.load(tex_path)
+        image.save_render(tex_path_new, scene=scene)
+        bpy.data.images.remove(image)
+        print('CATS_PNG\\t' + str(index) + '\\t1\\t', flush=True)
+    except Exception as e:
+        print('CATS_PNG\\t' + str(index) + '\\t0\\t' + ' '.join(str(e).split()), flush=True)
+'''
+
+
+class PngConversionPool:
+    """Converts textures to png files in background Blender processes.
+
+    Image decoding and encoding is only available through Blender itself and bpy can only be used
+    from the main thread, so each worker is a separate Blender instance started with --background.
+    The results are collected by reader threads and handed over to the main thread through a queue.
+    """
+
+    def __init__(self, jobs):
+        if not bpy.app.binary_path or not os.path.isfile(bpy.app.binary_path):
+            raise OSError('Blender executable not found')
+
+        worker_count = max(1, min(len(jobs), (os.cpu_count() or 2) - 1, 8))
+        self.results = queue.Queue()
+        self.reported = set()
+        self.job_count = len(jobs)
+        self.processes = []
+        self.job_files = []
+        self.alive = 0
+
+        for worker in range(worker_count):
+            worker_jobs = [(index, job[0], job[1]) for index, job in enumerate(jobs) if index % worker_count == worker]
+
+            fd, job_file = tempfile.mkstemp(prefix='cats_png_', suffix='.json')
+            with os.fdopen(fd, 'w', encoding='utf8') as file:
+                json.dump(worker_jobs, file)
+            self.job_files.append(job_file)
+
+            process = Popen([bpy.app.binary_path, '--background', '--factory-startup', '--python-expr', png_worker_script, '--', job_file],
+                            stdout=PIPE, stderr=DEVNULL, creationflags=0x08000000 if os.name == 'nt' else 0)  # CREATE_NO_WINDOW
+            self.processes.append(process)
+            self.alive += 1
+
+            thread = Thread(target=self.read_output, args=[process], daemon=True)
+            thread.start()
+
+    def read_output(self, process):
+        for line in process.stdout:
+            line = line.decode('utf8', errors='replace').rstrip('\r\n')
+            if not line.startswith('CATS_PNG\t'):
+                continue
+            _, index, success, message = line.split('\t', 3)
+            self.results.put((int(index), success == '1', message))
+        process.wait()
+        self.results.put(None)
+
+    def get_results(self):
+        results = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                self.alive -= 1
+                if not self.alive:
+                    self.cleanup()
+                continue
+            self.reported.add(result[0])
+            results.append(result)
+        return results
+
+    def running(self):
+        return self.alive > 0
+
+    def unreported(self):
+        return [index for index in range(self.job_count) if index not in self.reported]
+
+    def terminate(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        self.cleanup()
+
+    def cleanup(self):
+        for job_file in self.job_files:
+            try:
+                os.remove(job_file)
+            except OSError:
+                pass
+        self.job_files = []
+
+
+def get_png_manifest_file():
+    # The list is kept in the Blender config folder of the user, so that updates of the addon don't wipe it
+    return os.path.join(bpy.utils.user_resource('CONFIG', path='cats', create=True), 'png_conversions.json')
+
+
+def load_png_manifest():
+    try:
+        with open(get_png_manifest_file(), encoding='utf8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+    # Forget the pngs that were deleted since, so the list only grows with the files that still exist
+    return {tex_path_new: entry for tex_path_new, entry in manifest.items() if os.path.isfile(tex_path_new)}
+
+
+def save_png_manifest(manifest):
+    try:
+        with open(get_png_manifest_file(), 'w', encoding='utf8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=4)
+    except OSError as e:
+        print('Could not save the png conversion list:', e)
+
+
+def get_file_hash(path):
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def png_up_to_date(manifest, tex_path, tex_path_new):
+    # The png is only reused if it is newer than its source and the source content didn't change since the last conversion
+    entry = manifest.get(os.path.normcase(tex_path_new))
+    if not entry or entry.get('source') != os.path.normcase(tex_path) or not os.path.isfile(tex_path_new):
+        return False
+    if os.path.getmtime(tex_path_new) < os.path.getmtime(tex_path):
+        return False
+    return entry.get('hash') == get_file_hash(tex_path)
+
+
+def update_png_manifest(manifest, tex_path, tex_path_new):
+    manifest[os.path.normcase(tex_path_new)] = {
+        'source': os.path.normcase(tex_path),
+        'hash': get_file_hash(tex_path),
+    }
@@ -0,0 +1,162 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Startup work that is not needed to show the CATS panels is deferred.
+# It runs step by step on an idle timer after Blender finished starting, or all
+# at once as soon as a CATS operator runs. Blender in background mode never
+# runs the idle timer, so batch scripts only pay for what they actually use.
+# Batch scripts that call mmd_tools directly have to call run_deferred() first.
+
+import bpy
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from bpy.app.handlers import persistent
+
+from . import common as Common
+
+timings = OrderedDict()  # Phase name = Seconds
+deferred = OrderedDict()  # Phase name = Function
+idle_interval = 0.1
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def format_timings(names=None):
+    if names is None:
+        names = timings.keys()
+    return ', '.join(name + ' ' + str(round(timings[name] * 1000)) + 'ms' for name in names if name in timings)
+
+
+def defer(name, func):
+    deferred[name] = func
+
+
+def discard(names):
+    # Drops deferred phases that will never be needed, like the UI phases in batch workers
+    for name in names:
+        deferred.pop(name, None)
+
+
+def is_done(name):
+    return name not in deferred and 'deferred ' + name in timings
+
+
+def run_deferred(names=None):
+    if not deferred:
+        return
+
+    for name in list(deferred.keys()):
+        if names is None or name in names:
+            run_phase(name)
+
+    if not deferred:
+        print('### Finished loading CATS: ' + format_timings(name for name in timings if name.startswith('deferred ')))
+
+
+def run_phase(name):
+    func = deferred.pop(name, None)
+    if func:
+        with phase('deferred ' + name):
+            func()
+
+
+def start():
+    # Background instances have no idle time, everything is loaded on first use there
+    if not deferred or bpy.app.background:
+        return
+
+    if Common.version_2_79_or_older():
+        if idle_handler not in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.append(idle_handler)
+    elif not bpy.app.timers.is_registered(idle_timer):
+        bpy.app.timers.register(idle_timer, first_interval=idle_interval, persistent=True)
+
+
+def stop():
+    deferred.clear()
+    if Common.version_2_79_or_older():
+        if idle_handler in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.remove(idle_handler)
+    elif bpy.app.timers.is_registered(idle_timer):
+        bpy.app.timers.unregister(idle_timer)
+
+
+def run_next():
+    # Only one phase per call to keep the UI responsive in between
+    if deferred:
+        run_deferred([next(iter(deferred))])
+    return bool(deferred)
+
+
+def idle_timer():
+    if run_next():
+        return idle_interval
+    return None
+
+
+@persistent
+def idle_handler(scene):
+    if not run_next():
+        bpy.app.handlers.scene_update_post.remove(idle_handler)
+
+
+def first_use(cls):
+    # Wraps operators and panels so that they finish the deferred startup before they are used.
+    # Panels only need the icons, the rest would block drawing and can wait for the idle timer.
+    # Operators also keep the mesh health checks of Common.get_meshes_objects while they run.
+    if cls.__dict__.get('_cats_first_use'):
+        return cls
+
+    if issubclass(cls, bpy.types.Operator):
+        execute = getattr(cls, 'execute', None)
+        invoke = getattr(cls, 'invoke', None)
+        if execute:
+            def wrapped_execute(self, context):
+                run_deferred()
+                with Common.cache_mesh_health():
+                    return execute(self, context)
+            cls.execute = wrapped_execute
+        if invoke:
+            def wrapped_invoke(self, context, event):
+                run_deferred()
+                with Common.cache_mesh_health():
+                    return invoke(self, context, event)
+            cls.invoke = wrapped_invoke
+
+    elif issubclass(cls, bpy.types.Panel):
+        draw = getattr(cls, 'draw', None)
+        if draw:
+            def wrapped_draw(self, context):
+                run_deferred(['icons'])
+                return draw(self, context)
+            cls.draw = wrapped_draw
+
+    cls._cats_first_use = True
+    return cls
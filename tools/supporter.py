@@ -29,7 +29,6 @@ import bpy
 import json
 import shutil
 import pathlib
-import zipfile
 import webbrowser
 import json.decoder
 import urllib.error
@@ -43,6 +42,7 @@ from bpy.utils import previews
 from . import common as Common
 from . import settings as Settings
 from .. import globs
+from .. import downloader
 from ..tools.register import register_wrap
 
 # global variables
@@ -152,61 +152,40 @@ def unregister_dynamic_buttons():
 def download_file():
     # Load all the directories and files
     downloads_dir = os.path.join(resources_dir, "downloads")
-    extracted_zip_dir = os.path.join(downloads_dir, "cats_supporter_list-master")
+    extract_dir = os.path.join(downloads_dir, "extracted")
+    extracted_zip_dir = os.path.join(extract_dir, "cats_supporter_list-master")
     icons_dir = os.path.join(resources_dir, "icons")
     icons_supporter_dir = os.path.join(icons_dir, "supporters")
 
-    supporter_zip_file = os.path.join(downloads_dir, "cats_supporter_list.zip")
     supporter_list_file = os.path.join(resources_dir, "supporters.json")
 
     extracted_supporter_list_file = os.path.join(extracted_zip_dir, "supporters.json")
     extracted_icons_dir = os.path.join(extracted_zip_dir, "supporters")
 
-    # Create download folder
-    pathlib.Path(downloads_dir).mkdir(exist_ok=True)
-
-    # Download zip
+    # Download zip, an interrupted download is continued next time
     # print('DOWNLOAD FILE')
     try:
-        urllib.request.urlretrieve("https://github.com/Darkblader24/cats_supporter_list/archive/master.zip", supporter_zip_file)
-    except urllib.error.URLError:
-        print("FILE COULD NOT BE DOWNLOADED")
-        shutil.rmtree(downloads_dir)
+        supporter_zip_file = downloader.download("https://github.com/Darkblader24/cats_supporter_list/archive/master.zip", downloads_dir)
+        downloader.extract_zip(supporter_zip_file, extract_dir)
+    except downloader.DownloadError as e:
+        print("FILE COULD NOT BE DOWNLOADED:", e)
         finish_reloading()
         return
     # print('DOWNLOAD FINISHED')
 
-    # If zip is not downloaded, abort
-    if not os.path.isfile(supporter_zip_file):
-        print("ZIP NOT FOUND!")
-        shutil.rmtree(downloads_dir)
-        finish_reloading()
-        return
-
-    # Extract the downloaded zip
-    # print('EXTRACTING ZIP')
-    with zipfile.ZipFile(supporter_zip_file, "r") as zip_ref:
-        zip_ref.extractall(downloads_dir)
-    # print('EXTRACTED')
-
     # If zip is not extracted, abort
-    if not os.path.isdir(extracted_zip_dir):
+    if not os.path.isfile(extracted_supporter_list_file) or not os.path.isdir(extracted_icons_dir):
         print("EXTRACTED ZIP FOLDER NOT FOUND!")
         shutil.rmtree(downloads_dir)
         finish_reloading()
         return
 
-    # delete existing supporter list and icon folder
-    if os.path.isfile(supporter_list_file):
-        # print("REMOVED SUPPORT LIST")
-        os.remove(supporter_list_file)
-    if os.path.isdir(icons_supporter_dir):
-        # print("REMOVED ICON DIR")
-        shutil.rmtree(icons_supporter_dir)
-
-    # Move the extracted files to their correct places
-    shutil.move(extracted_supporter_list_file, supporter_list_file)
-    shutil.move(extracted_icons_dir, icons_dir)
+    # Replace the supporter list and swap the icon folder, both are replaced as a whole
+    os.replace(extracted_supporter_list_file, supporter_list_file)
+    try:
+        downloader.swap_directories(extracted_icons_dir, icons_supporter_dir)
+    except OSError as e:
+        print("ICONS COULD NOT BE REPLACED:", e)
 
     # Delete download folder
     shutil.rmtree(downloads_dir)
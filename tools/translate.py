@@ -26,10 +26,17 @@
 import re
 import os
 import bpy
-import copy
+import sys
+import mmap
 import json
+import time
+import array
+import struct
+import hashlib
 import pathlib
 import collections
+import contextlib
+import collections.abc
 import requests.exceptions
 
 from datetime import datetime, timezone
@@ -48,6 +55,11 @@ main_dir = pathlib.Path(os.path.dirname(__file__)).parent.resolve()
 resources_dir = os.path.join(str(main_dir), "resources")
 dictionary_file = os.path.join(resources_dir, "dictionary.json")
 dictionary_google_file = os.path.join(resources_dir, "dictionary_google.json")
+dictionary_compiled_file = os.path.join(resources_dir, "dictionary.bin")
+dictionary_google_lock_file = dictionary_google_file + '.lock'
+
+compiled_magic = b'CATSDICT'
+compiled_version = 1
 
 
 @register_wrap
@@ -302,10 +314,26 @@ class TranslateAllButton(bpy.types.Operator):
         return {'FINISHED'}
 
 
+# Loads the dictionaries if they were not loaded yet, they are loaded after startup
+def ensure_translations():
+    if dictionary is None:
+        globs.dict_found = load_translations()
+
+
 # Loads the dictionaries at the start of blender
+# The merged and sorted dictionary is compiled into dictionary.bin and memory mapped from there,
+# it only gets rebuilt from the json files when one of them changed
 def load_translations():
-    global dictionary
-    dictionary = OrderedDict()
+    global dictionary, dictionary_google
+    source_hash = get_dictionary_source_hash()
+
+    compiled = CompiledDictionary.open(dictionary_compiled_file, source_hash)
+    if compiled is not None:
+        close_dictionary()
+        dictionary = compiled
+        dictionary_google = None  # Loaded on first use
+        return compiled.dict_found
+
     temp_dict = OrderedDict()
     dict_found = False
 
@@ -323,25 +351,36 @@ def load_translations():
         pass
 
     # Load local google dictionary and add it to the temp dict
+    load_google_dict()
+    for name, trans in dictionary_google.get('translations').items():
+        if not name:
+            continue
+
+        if name in temp_dict.keys():
+            print(name, 'ALREADY IN INTERNAL DICT!')
+            continue
+
+        temp_dict[name] = trans
+
+    # The google dictionary might have been reset, so hash the sources again
+    compile_dictionary(temp_dict.items(), get_dictionary_source_hash(), dict_found)
+
+    # for key, value in dictionary.items():
+    #     print('"' + key + '" - "' + value + '"')
+
+    return dict_found
+
+
+def load_google_dict():
+    global dictionary_google
     try:
         with open(dictionary_google_file, encoding="utf8") as file:
-            global dictionary_google
             dictionary_google = json.load(file, object_pairs_hook=collections.OrderedDict)
 
             if 'created' not in dictionary_google \
                     or 'translations' not in dictionary_google \
                     or 'translations_full' not in dictionary_google:
                 reset_google_dict()
-            else:
-                for name, trans in dictionary_google.get('translations').items():
-                    if not name:
-                        continue
-
-                    if name in temp_dict.keys():
-                        print(name, 'ALREADY IN INTERNAL DICT!')
-                        continue
-
-                    temp_dict[name] = trans
 
             # print('GOOGLE DICTIONARY LOADED!')
     except FileNotFoundError:
@@ -353,18 +392,229 @@ def load_translations():
         reset_google_dict()
         pass
 
-    # Sort temp dictionary by lenght and put it into the global dict
-    for key in sorted(temp_dict, key=lambda k: len(k), reverse=True):
-        dictionary[key] = temp_dict[key]
 
-    # for key, value in dictionary.items():
-    #     print('"' + key + '" - "' + value + '"')
+# The google dictionary is only parsed when it is needed, the compiled dictionary already contains its translations
+def ensure_google_dict():
+    if dictionary_google is None:
+        load_google_dict()
 
-    return dict_found
+
+def get_dictionary_source_hash():
+    source_hash = hashlib.sha1(compiled_magic + struct.pack('<I', compiled_version))
+    for file_path in [dictionary_file, dictionary_google_file]:
+        # Mark missing files so that they differ from empty ones
+        try:
+            with open(file_path, 'rb') as file:
+                source_hash.update(b'\1' + struct.pack('<Q', os.fstat(file.fileno()).st_size))
+                for chunk in iter(lambda: file.read(1 << 16), b''):
+                    source_hash.update(chunk)
+        except OSError:
+            source_hash.update(b'\0')
+    return source_hash.digest()
+
+
+# Sorts the entries by key length and compiles them into dictionary.bin, then loads it as the dictionary
+def compile_dictionary(entries, source_hash, dict_found):
+    global dictionary
+    # sorted is stable, so keys of the same length keep their order
+    entries = sorted(((key, value or '') for key, value in entries), key=lambda e: len(e[0]), reverse=True)
+    data = CompiledDictionary.build(entries, source_hash, dict_found)
+
+    # The old file has to be unmapped before it can be replaced on Windows
+    close_dictionary()
+    temp_file = dictionary_compiled_file + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(temp_file, 'wb') as file:
+            file.write(data)
+        os.replace(temp_file, dictionary_compiled_file)
+    except OSError as e:
+        print('Could not save the compiled dictionary:', e)
+        dictionary = CompiledDictionary(data)
+        return
+
+    dictionary = CompiledDictionary.open(dictionary_compiled_file, source_hash)
+    if dictionary is None:
+        dictionary = CompiledDictionary(data)
+
+
+def close_dictionary():
+    if isinstance(dictionary, CompiledDictionary):
+        dictionary.close()
+
+
+class CompiledDictionary(collections.abc.Mapping):
+    """
+    Read only dictionary backed by the compiled dictionary file.
+
+    Layout (little endian):
+        header:  magic, version, flags, sha1 of the json sources, entry count
+        entries: (key offset, key length, value offset, value length) per entry, sorted by key length descending
+        lookup:  entry indices sorted by the utf-8 bytes of their keys, for binary search
+        blob:    the utf-8 encoded keys and values
+    Iterating it yields the keys longest first, the same order the translation loops rely on.
+    Lookups work on the mapped file directly, the entries are only decoded when they are used.
+    """
+    header = struct.Struct('<8sII20sI')
+
+    def __init__(self, buffer, mapped_file=None):
+        self.mapped_file = mapped_file
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        magic, version, flags, self.source_hash, self.count = self.header.unpack_from(self.view)
+        if magic != compiled_magic or version != compiled_version or sys.byteorder != 'little':
+            self.close()
+            raise ValueError('Not a compiled CATS dictionary')
+
+        self.dict_found = bool(flags & 1)
+        entries_end = self.header.size + self.count * 16
+        lookup_end = entries_end + self.count * 4
+        self.entries = self.view[self.header.size:entries_end].cast('I')
+        self.lookup = self.view[entries_end:lookup_end].cast('I')
+        self.blob = self.view[lookup_end:]
+        if len(self.entries) != self.count * 4 or len(self.lookup) != self.count:
+            self.close()
+            raise ValueError('Truncated compiled CATS dictionary')
+        # The entries are sorted by key length, so the first key is the longest one
+        self.max_key_length = len(self.entry(0)[0]) if self.count else 0
+
+    @classmethod
+    def open(cls, file_path, source_hash):
+        # Returns None if the file is missing, broken or was compiled from other sources
+        try:
+            with open(file_path, 'rb') as file:
+                mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            compiled = cls(mapped_file, mapped_file)
+        except (ValueError, struct.error, TypeError):
+            mapped_file.close()
+            return None
+
+        if compiled.source_hash != source_hash:
+            compiled.close()
+            return None
+        return compiled
+
+    @classmethod
+    def build(cls, entries, source_hash, dict_found):
+        blob = bytearray()
+        table = array.array('I')
+        keys = []
+        for key, value in entries:
+            key = key.encode('utf-8')
+            value = value.encode('utf-8')
+            table.extend((len(blob), len(key), len(blob) + len(key), len(value)))
+            blob += key
+            blob += value
+            keys.append(key)
+
+        lookup = array.array('I', sorted(range(len(keys)), key=keys.__getitem__))
+        if sys.byteorder != 'little':
+            table.byteswap()
+            lookup.byteswap()
+        return cls.header.pack(compiled_magic, compiled_version, 1 if dict_found else 0, source_hash, len(keys)) \
+            + table.tobytes() + lookup.tobytes() + bytes(blob)
+
+    def close(self):
+        # Views have to be released before the memory map can be closed
+        for name in ['entries', 'lookup', 'blob', 'view']:
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+        self.count = 0
+        self.max_key_length = 0
+
+    def key_bytes(self, index):
+        offset = index * 4
+        start, length = self.entries[offset], self.entries[offset + 1]
+        return bytes(self.blob[start:start + length])
+
+    def entry(self, index):
+        offset = index * 4
+        key_start, key_length, value_start, value_length = self.entries[offset:offset + 4]
+        return str(self.blob[key_start:key_start + key_length], 'utf-8'), str(self.blob[value_start:value_start + value_length], 'utf-8')
+
+    def find(self, key):
+        key = key.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            index = self.lookup[middle]
+            if self.key_bytes(index) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.key_bytes(self.lookup[low]) == key:
+            return self.lookup[low]
+        return None
+
+    def find_keys_in(self, text, start=0):
+        # Returns the sorted indices, from start on, of the entries whose keys are part of the text.
+        # The keys starting at each position of the text are found by narrowing the range of keys in the lookup
+        # table that share a growing prefix with it, which mostly ends after one or two characters
+        indices = []
+        for i in range(len(text)):
+            low, high = 0, self.count
+            for j in range(i + 1, min(i + self.max_key_length, len(text)) + 1):
+                prefix = text[i:j].encode('utf-8')
+                low = self.search_prefix(prefix, low, high, False)
+                high = self.search_prefix(prefix, low, high, True)
+                if low >= high:
+                    break
+                index = self.lookup[low]
+                if index >= start and self.key_bytes(index) == prefix:
+                    indices.append(index)
+        return sorted(set(indices))
+
+    def search_prefix(self, prefix, low, high, after):
+        # Returns the first position in the lookup table whose key starts with or comes after the prefix,
+        # or with after set, the first one that comes after all keys starting with it
+        length = len(prefix)
+        while low < high:
+            middle = (low + high) // 2
+            key = self.key_bytes(self.lookup[middle])[:length]
+            if key < prefix or after and key == prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __getitem__(self, key):
+        index = self.find(key) if isinstance(key, str) else None
+        if index is None:
+            raise KeyError(key)
+        return self.entry(index)[1]
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.find(key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (key for key, value in self.iter_items())
+
+    def items(self):
+        return CompiledDictionaryItems(self)
+
+    def iter_items(self):
+        return (self.entry(index) for index in range(self.count))
+
+
+class CompiledDictionaryItems(collections.abc.ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
 
 
 def update_dictionary(to_translate_list, translating_shapes=False, self=None):
     global dictionary, dictionary_google
+    ensure_translations()
+    ensure_google_dict()
     regex = u'[\u3000-\u303f\u3040-\u309f\u30a0-\u30ff\uff00-\uff9f\u4e00-\u9faf\u3400-\u4dbf]+'  # Regex to look for japanese chars
 
     use_google_only = False
@@ -380,8 +630,6 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
     # Translate everything
     for to_translate in to_translate_list:
         length = len(to_translate)
-        translated_count = 0
-
         to_translate = fix_jp_chars(to_translate)
 
         # Translate shape keys with Google Translator only, if the user chose this
@@ -400,17 +648,7 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
 
         # Translate with internal dictionary
         else:
-            for key, value in dictionary.items():
-                if key in to_translate:
-                    if value:
-                        to_translate = to_translate.replace(key, value)
-                    else:
-                        continue
-
-                    # Check if string is fully translated
-                    translated_count += len(key)
-                    if translated_count >= length:
-                        break
+            to_translate, translated_count = translate_with_dictionary(to_translate, length)
 
             # If not fully translated, translate the rest with Google
             if translated_count < length:
@@ -472,6 +710,7 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
         return
 
     # Update the dictionaries
+    new_translations = OrderedDict()
     for i, translation in enumerate(translations):
         name = google_input[i]
 
@@ -479,30 +718,59 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
             dictionary_google['translations_full'][name] = translation.text
         else:
             translated_name = translation.text.capitalize()
-            dictionary[name] = translated_name
+            new_translations[name] = translated_name
             dictionary_google['translations'][name] = translated_name
 
         print(google_input[i], translation.text.capitalize())
 
-    # Sort dictionary
-    temp_dict = copy.deepcopy(dictionary)
-    dictionary = OrderedDict()
-    for key in sorted(temp_dict, key=lambda k: len(k), reverse=True):
-        dictionary[key] = temp_dict[key]
+    # Batch workers translate at the same time, so the file is merged and compiled under the lock.
+    # Otherwise the last worker to save would drop the translations of the others
+    with google_dict_lock():
+        # Save the google dict locally, together with the translations other processes saved in the meantime
+        save_google_dict(merge=True)
 
-    # Save the google dict locally
-    save_google_dict()
+        # Sort the new translations into the dictionary by compiling it again
+        if new_translations:
+            for name, translated_name in dictionary_google['translations'].items():
+                if name and name not in dictionary:
+                    new_translations[name] = translated_name
+            entries = [(key, value) for key, value in dictionary.items() if key not in new_translations]
+            compile_dictionary(entries + list(new_translations.items()), get_dictionary_source_hash(), dictionary.dict_found)
 
     print('DICTIONARY UPDATE SUCCEEDED!')
     return
 
 
+# Replaces the dictionary keys that are part of the name, longest first, until the name is fully translated
+# Returns the name and the length of the replaced keys
+def translate_with_dictionary(to_translate, length, addition=''):
+    translated_count = 0
+    matches = dictionary.find_keys_in(to_translate)
+    while matches:
+        index = matches.pop(0)
+        key, value = dictionary.entry(index)
+        # If string is empty, don't replace it. This will be done at the end
+        if not value:
+            continue
+
+        to_translate = to_translate.replace(key, addition + value)
+
+        # Check if string is fully translated
+        translated_count += len(key)
+        if translated_count >= length:
+            break
+
+        # The replaced name can contain other keys and lose some of the found ones
+        matches = dictionary.find_keys_in(to_translate, index + 1)
+
+    return to_translate, translated_count
+
+
 def translate(to_translate, add_space=False, translating_shapes=False):
-    global dictionary
+    ensure_translations()
 
     pre_translation = to_translate
     length = len(to_translate)
-    translated_count = 0
 
     # Figure out whether to use google only or not
     use_google_only = False
@@ -519,24 +787,14 @@ def translate(to_translate, add_space=False, translating_shapes=False):
 
     # Translate shape keys with Google Translator only, if the user chose this
     if use_google_only:
+        ensure_google_dict()
         for key, value in dictionary_google.get('translations_full').items():
             if to_translate == key and value:
                 to_translate = value
 
     # Translate with internal dictionary
     else:
-        for key, value in dictionary.items():
-            if key in to_translate:
-                # If string is empty, don't replace it. This will be done at the end
-                if not value:
-                    continue
-
-                to_translate = to_translate.replace(key, addition + value)
-
-                # Check if string is fully translated
-                translated_count += len(key)
-                if translated_count >= length:
-                    break
+        to_translate = translate_with_dictionary(to_translate, length, addition)[0]
 
     to_translate = to_translate.replace('.L', '_L').replace('.R', '_R').replace('  ', ' ').replace('し', '').replace('っ', '').strip()
 
@@ -566,9 +824,54 @@ def reset_google_dict():
     print('GOOGLE DICT RESET')
 
 
-def save_google_dict():
-    with open(dictionary_google_file, 'w', encoding="utf8") as outfile:
+# Merging adds the translations that are only in the saved file, so that the ones of other processes are kept.
+# It should only be used while holding google_dict_lock
+def save_google_dict(merge=False):
+    if merge:
+        try:
+            with open(dictionary_google_file, encoding="utf8") as file:
+                saved = json.load(file, object_pairs_hook=collections.OrderedDict)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            saved = {}
+
+        if saved.get('created') == dictionary_google['created']:
+            for key in ['translations', 'translations_full']:
+                for name, translation in saved.get(key, {}).items():
+                    dictionary_google[key].setdefault(name, translation)
+
+    # Written to a temporary file first, so that other processes never read a half written file
+    temp_file = dictionary_google_file + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_file, 'w', encoding="utf8") as outfile:
         json.dump(dictionary_google, outfile, ensure_ascii=False, indent=4)
+    os.replace(temp_file, dictionary_google_file)
+
+
+# Lock file around reading, merging and saving the google dictionary, batch workers run in parallel.
+# A lock that is older than the timeout was left behind by a crashed process and gets removed
+@contextlib.contextmanager
+def google_dict_lock(timeout=30):
+    start = time.time()
+    while True:
+        try:
+            os.close(os.open(dictionary_google_lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(dictionary_google_lock_file) > timeout:
+                    os.remove(dictionary_google_lock_file)
+                    continue
+            except OSError:
+                continue
+            if time.time() - start > timeout:
+                raise TimeoutError('The google dictionary is locked by another process: ' + dictionary_google_lock_file)
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(dictionary_google_lock_file)
+        except OSError:
+            pass
 
 # def cvs_to_json():
 #     temp_dict = OrderedDict()
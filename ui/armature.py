@@ -51,7 +51,7 @@ class ArmaturePanel(ToolPanel, bpy.types.Panel):
         #     col.separator()
         #     col.separator()
 
-        if not globs.dict_found:
+        if globs.dict_found is False:
             col.separator()
             row = col.row(align=True)
             row.scale_y = 0.75
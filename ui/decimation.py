@@ -137,3 +137,5 @@ class DecimationPanel(ToolPanel, bpy.types.Panel):
         row = col.row(align=True)
         row.scale_y = 1.2
         row.operator(Decimation.AutoDecimateButton.bl_idname, icon='MOD_DECIM')
+        row = col.row(align=True)
+        row.operator(Decimation.AutoDecimateButton.bl_idname, text='Show Decimation Plan', icon='INFO').dry_run = True
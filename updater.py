@@ -5,12 +5,13 @@ import json
 import urllib
 import shutil
 import pathlib
-import zipfile
 import addon_utils
 from threading import Thread
 from collections import OrderedDict
 from bpy.app.handlers import persistent
 
+from . import downloader
+
 no_ver_check = False
 fake_update = False
 
@@ -33,6 +34,9 @@ show_error = ''
 
 main_dir = os.path.dirname(__file__)
 downloads_dir = os.path.join(main_dir, "downloads")
+# Next to the addon folder, so that they survive the update. Blender doesn't load folders with a dot in their name
+cache_dir = os.path.join(os.path.dirname(main_dir), ".cats_downloads")
+staging_dir = os.path.join(os.path.dirname(main_dir), ".cats_update")
 resources_dir = os.path.join(main_dir, "resources")
 ignore_ver_file = os.path.join(resources_dir, "ignore_version.txt")
 no_auto_ver_check_file = os.path.join(resources_dir, "no_auto_ver_check.txt")
@@ -412,8 +416,8 @@ def get_github_releases(repo):
         if version_tag.startswith('v'):
             version_tag = version_tag[1:]
 
-        version_list[version_tag] = ['', 'Put exiting new stuff here', 'Today']
-        version_list['12.34.56.78'] = ['', 'Nothing new to see', 'A week ago probably']
+        version_list[version_tag] = ['', 'Put exiting new stuff here', 'Today', None]
+        version_list['12.34.56.78'] = ['', 'Nothing new to see', 'A week ago probably', None]
         return True
 
     try:
@@ -435,7 +439,9 @@ def get_github_releases(repo):
         if version_tag.startswith('v'):
             version_tag = version_tag[1:]
 
-        version_list[version_tag] = [version.get('zipball_url'), version.get('body'), version.get('published_at').split('T')[0]]
+        # Prefer an uploaded zip with a published checksum over the generated zipball
+        update_url, sha256 = get_release_zip(version)
+        version_list[version_tag] = [update_url, version.get('body'), version.get('published_at').split('T')[0], sha256]
 
     # for version, info in version_list.items():
     #     print(version, info[0], info[2])
@@ -443,6 +449,14 @@ def get_github_releases(repo):
     return True
 
 
+def get_release_zip(release):
+    for asset in release.get('assets') or []:
+        digest = asset.get('digest') or ''
+        if asset.get('name', '').endswith('.zip') and digest.startswith('sha256:') and asset.get('browser_download_url'):
+            return asset.get('browser_download_url'), digest[len('sha256:'):]
+    return release.get('zipball_url'), None
+
+
 def check_for_update_available():
     if not version_list:
         return False
@@ -524,56 +538,56 @@ def update_now(version=None, latest=False, dev=False):
     if dev:
         print('UPDATE TO DEVELOPMENT')
         update_link = 'https://github.com/michaeldegroot/cats-blender-plugin/archive/development.zip'
-    elif latest or not version:
+        download_file(update_link)
+        return
+
+    if latest or not version:
         print('UPDATE TO ' + latest_version_str)
-        update_link = version_list.get(latest_version_str)[0]
+        update_link, sha256 = version_list.get(latest_version_str)[0], version_list.get(latest_version_str)[3]
         bpy.context.scene.cats_updater_version_list = latest_version_str
     else:
         print('UPDATE TO ' + version)
-        update_link = version_list[version][0]
-
-    download_file(update_link)
+        update_link, sha256 = version_list[version][0], version_list[version][3]
 
+    # Releases don't change, so their downloads can be reused
+    download_file(update_link, sha256=sha256, cache_key=update_link)
 
-def download_file(update_url):
-    # Load all the directories and files
-    update_zip_file = os.path.join(downloads_dir, "cats-update.zip")
 
-    # Remove existing download folder
+def download_file(update_url, sha256=None, cache_key=None):
+    # Remove the download folder of older updaters
     if os.path.isdir(downloads_dir):
         print("DOWNLOAD FOLDER EXISTED")
         shutil.rmtree(downloads_dir)
 
-    # Create download folder
-    pathlib.Path(downloads_dir).mkdir(exist_ok=True)
-
-    # Download zip
+    # Download zip, this continues an interrupted download and reuses finished ones
     print('DOWNLOAD FILE')
     try:
-        urllib.request.urlretrieve(update_url, update_zip_file)
-    except urllib.error.URLError:
-        print("FILE COULD NOT BE DOWNLOADED")
-        shutil.rmtree(downloads_dir)
+        update_zip_file = downloader.download(update_url, cache_dir, sha256=sha256, cache_key=cache_key)
+    except downloader.DownloadError as e:
+        print("FILE COULD NOT BE DOWNLOADED:", e)
         finish_update(error='Could not connect to Github')
         return
     print('DOWNLOAD FINISHED')
 
-    # If zip is not downloaded, abort
-    if not os.path.isfile(update_zip_file):
-        print("ZIP NOT FOUND!")
-        shutil.rmtree(downloads_dir)
-        finish_update(error='Could not find the downloaded zip')
-        return
+    # Only keep the latest downloads, every release is a few MB
+    downloader.prune_cache(cache_dir, keep=2, keep_file=update_zip_file)
 
-    # Extract the downloaded zip
+    # Extract the downloaded zip into the staging folder next to the addon
     print('EXTRACTING ZIP')
-    with zipfile.ZipFile(update_zip_file, "r") as zip_ref:
-        zip_ref.extractall(downloads_dir)
+    try:
+        downloader.extract_zip(update_zip_file, staging_dir)
+    except downloader.DownloadError as e:
+        print("ZIP COULD NOT BE EXTRACTED:", e)
+        os.remove(update_zip_file)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        finish_update(error='The downloaded update was damaged, please try again')
+        return
     print('EXTRACTED')
 
-    # Delete the extracted zip file
-    print('REMOVING ZIP FILE')
-    os.remove(update_zip_file)
+    # Delete the zip file if it can't be reused
+    if not cache_key:
+        print('REMOVING ZIP FILE')
+        os.remove(update_zip_file)
 
     # Detect the extracted folders and files
     print('SEARCHING FOR INIT 1')
@@ -592,47 +606,79 @@ def download_file(update_url):
         return searchInit(os.path.join(path, folders[0]))
 
     print('SEARCHING FOR INIT 2')
-    extracted_zip_dir = searchInit(downloads_dir)
+    extracted_zip_dir = searchInit(staging_dir)
     if not extracted_zip_dir:
         print("INIT NOT FOUND!")
-        shutil.rmtree(downloads_dir)
+        shutil.rmtree(staging_dir)
         # finish_reloading()
         finish_update(error='Could not find CATS in the downloaded zip')
         return
 
-    # Remove old addon files
-    clean_addon_dir()
+    # Take over the user files and hidden folders from the current installation
+    keep_user_files(extracted_zip_dir)
 
-    # Move the extracted files to their correct places
-    def move_files(from_dir, to_dir):
-        print('MOVE FILES TO DIR:', to_dir)
-        files = os.listdir(from_dir)
-        for file in files:
-            file_dir = os.path.join(from_dir, file)
-            target_dir = os.path.join(to_dir, file)
-            print('MOVE', file_dir)
+    # The memory mapped dictionary.bin keeps its file open, which blocks renaming and deleting it on Windows
+    from . import globs
+    from .tools import translate
+    translate.close_dictionary()
 
-            # If file exists
-            if os.path.isfile(file_dir) and os.path.isfile(target_dir):
-                os.remove(target_dir)
-                shutil.move(file_dir, to_dir)
-                print('REMOVED AND MOVED', file)
+    # Swap the whole addon folder, so that a failed update doesn't leave a half copied addon behind
+    try:
+        downloader.swap_directories(extracted_zip_dir, main_dir)
+        print('SWAPPED ADDON FOLDER')
+    except OSError as e:
+        print('COULD NOT SWAP ADDON FOLDER, MOVING FILES INSTEAD:', e)
+        clean_addon_dir()
+        move_files(extracted_zip_dir, main_dir)
+    finally:
+        # Open the dictionary again, it is compiled again from the new files if they changed
+        globs.dict_found = translate.load_translations()
+
+    # Delete staging folder
+    print('DELETE STAGING DIR')
+    shutil.rmtree(staging_dir, ignore_errors=True)
 
-            elif os.path.isdir(file_dir) and os.path.isdir(target_dir):
-                move_files(file_dir, target_dir)
+    # Finish the update
+    finish_update()
 
-            else:
-                shutil.move(file_dir, to_dir)
-                print('MOVED', file)
 
-    move_files(extracted_zip_dir, main_dir)
+def keep_user_files(new_dir):
+    # Settings and the google dictionary are kept unless the update brings its own
+    for f in ['settings.json', 'dictionary_google.json']:
+        file = os.path.join(resources_dir, f)
+        new_file = os.path.join(new_dir, 'resources', f)
+        if os.path.isfile(file) and not os.path.exists(new_file):
+            pathlib.Path(os.path.dirname(new_file)).mkdir(exist_ok=True)
+            shutil.copy2(file, new_file)
 
-    # Delete download folder
-    print('DELETE DOWNLOADS DIR')
-    shutil.rmtree(downloads_dir)
+    # Hidden folders like .git are moved over
+    for f in os.listdir(main_dir):
+        folder = os.path.join(main_dir, f)
+        if f.startswith('.') and os.path.isdir(folder) and not os.path.exists(os.path.join(new_dir, f)):
+            shutil.move(folder, new_dir)
 
-    # Finish the update
-    finish_update()
+
+# Move the extracted files to their correct places
+def move_files(from_dir, to_dir):
+    print('MOVE FILES TO DIR:', to_dir)
+    files = os.listdir(from_dir)
+    for file in files:
+        file_dir = os.path.join(from_dir, file)
+        target_dir = os.path.join(to_dir, file)
+        print('MOVE', file_dir)
+
+        # If file exists
+        if os.path.isfile(file_dir) and os.path.isfile(target_dir):
+            os.remove(target_dir)
+            shutil.move(file_dir, to_dir)
+            print('REMOVED AND MOVED', file)
+
+        elif os.path.isdir(file_dir) and os.path.isdir(target_dir):
+            move_files(file_dir, target_dir)
+
+        else:
+            shutil.move(file_dir, to_dir)
+            print('MOVED', file)
 
 
 def finish_update(error=''):